@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 
 def _score_to_risk(score: int) -> str:
@@ -9,23 +9,75 @@ def _score_to_risk(score: int) -> str:
     return "ALTO"
 
 
+def near_duplicate_issues(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Copia entre oferentes de la misma licitación = posible colusión; entre licitaciones, plantilla reutilizada
+    issues = []
+    for m in matches or []:
+        same = bool(m.get("misma_licitacion"))
+        pct = int(round(float(m.get("similitud", 0)) * 100))
+        issues.append({
+            "type": "Propuesta casi duplicada",
+            "severity": "ALTO" if same else "MEDIO",
+            "category": "duplicados",
+            "where": "documento completo",
+            "evidence": f"Similitud estimada {pct}% con '{m.get('documento')}'"
+                        + (" de otro oferente en esta licitación" if same else f" (licitación {m.get('lic_id')})"),
+            "recommendation": "Verificar si los oferentes están vinculados (posible colusión) y comparar ambos documentos."
+                              if same else "Revisar si el oferente reutiliza una propuesta ajena.",
+            "documento_similar": m.get("documento"),
+            "licitacion_similar": m.get("lic_id"),
+            "similitud": m.get("similitud"),
+        })
+    return issues
+
+
+def with_near_duplicates(report: Dict[str, Any], matches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reporte con los hallazgos de casi duplicados (se calculan aparte porque dependen de otros documentos)."""
+    if not matches:
+        return report
+    dup_issues = near_duplicate_issues(matches)
+    risks = dict(report.get("risks", {}))
+    risks["duplicados"] = "ALTO" if any(i["severity"] == "ALTO" for i in dup_issues) else "MEDIO"
+    return {**report, "risks": risks, "issues": list(report.get("issues", [])) + dup_issues}
+
+
+def routing(packs: List[Dict[str, Any]], ruc_reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Modelo que respondió cada agente (por sección en modo map-reduce) y si hubo escalamiento
+    out = []
+    for pack in packs:
+        r = pack.get("ruteo")
+        out += r if isinstance(r, list) else ([r] if r else [])
+    seen = set()
+    for rr in ruc_reports:
+        r = rr.get("ruteo")
+        # Un lote de relación RUC se comparte entre varios RUC: se registra una vez
+        if r and id(r) not in seen:
+            seen.add(id(r))
+            out.append(r)
+    return out
+
+
 def aggregate(
-    legal: Dict[str, Any], tech: Dict[str, Any], econ: Dict[str, Any], incons: Dict[str, Any], ruc_reports: List[Dict[str, Any]]
+    legal: Dict[str, Any], tech: Dict[str, Any], econ: Dict[str, Any], incons: Dict[str, Any], ruc_reports: List[Dict[str, Any]],
+    near_duplicates: Optional[List[Dict[str, Any]]] = None,
 ) -> Dict[str, Any]:
     # Scores globales
-    score_legal = int(legal.get("score", 50))
-    score_tech = int(tech.get("score", 50))
-    score_econ = int(econ.get("score", 50))
-    score_incons = int(incons.get("score", 50))
+    packs = {"legal": legal, "tecnico": tech, "economico": econ, "inconsistencias": incons}
+    scores = {}
+    for name, pack in packs.items():
+        try:
+            scores[name] = int(pack.get("score"))
+        except (TypeError, ValueError):
+            pass
+    # Validador sin respuesta utilizable: se completa con el promedio de los demás
+    # (un 50 fijo empujaría la propuesta en el ranking) y queda marcado
+    faltantes = [name for name in packs if name not in scores]
+    fill = int(round(sum(scores.values()) / len(scores))) if scores else 50
+    scores = {name: scores.get(name, fill) for name in packs}
 
     # Riesgo por categoría
-    risks = {
-        "legal": _score_to_risk(score_legal),
-        "tecnico": _score_to_risk(score_tech),
-        "economico": _score_to_risk(score_econ),
-        "inconsistencias": _score_to_risk(score_incons),
-        "ruc": max([r.get("risk", "ALTO") for r in ruc_reports] or ["ALTO"])  # peor caso
-    }
+    risks = {name: ("SIN_DATO" if name in faltantes else _score_to_risk(scores[name])) for name in packs}
+    risks["ruc"] = max([r.get("risk", "ALTO") for r in ruc_reports] or ["ALTO"])  # peor caso
 
     # Issues
     issues = []
@@ -36,14 +88,18 @@ def aggregate(
             it["category"] = name
             issues.append(it)
 
-    return {
-        "scores": {
-            "legal": score_legal,
-            "tecnico": score_tech,
-            "economico": score_econ,
-            "inconsistencias": score_incons,
-        },
+    out = {
+        "scores": scores,
         "risks": risks,
         "issues": issues,
         "ruc_reports": ruc_reports,
-    }
\ No newline at end of file
+        "ruteo": routing([legal, tech, econ, incons], ruc_reports),
+    }
+    if faltantes:
+        out["scores_faltantes"] = faltantes
+        out["errores"] = [packs[name]["error"] for name in faltantes if packs[name].get("error")]
+    # Agentes que respondieron de forma degradada (aunque tengan score): el reporte no se cachea
+    degradados = [name for name, pack in packs.items() if pack.get("degradado") or pack.get("error")]
+    if degradados:
+        out["degradados"] = degradados
+    return with_near_duplicates(out, near_duplicates or [])
\ No newline at end of file
@@ -2,6 +2,8 @@ from typing import List, Dict, Any, Optional
 import os
 from openai import OpenAI
 
+from utils import tracing, budget
+
 MODEL_JUST = os.environ.get("MODEL_JUST", "gpt-4o-mini")
 
 
@@ -20,12 +22,14 @@ def _fallback_text(rows: List[Dict[str, Any]], winner: Optional[Dict[str, Any]])
     )
 
 
+@tracing.traced("generate_justification")
 def generate_justification(
     rows: List[Dict[str, Any]],
     winner: Optional[Dict[str, Any]],
     objeto: str = "",
     pesos: Optional[Dict[str, Any]] = None,
     num_docs: Optional[int] = None,
+    fallback: bool = True,
 ) -> str:
     """Genera una justificación breve (3–4 párrafos) del contrato recomendado.
 
@@ -33,7 +37,10 @@ def generate_justification(
     winner: dict de row ganador
     objeto: objeto del proceso
     pesos: pesos utilizados
+    fallback: si es False, un error del LLM se propaga en lugar de devolver el texto genérico
     """
+    if budget.deterministic():
+        return _fallback_text(rows, winner)
     try:
         client = OpenAI()
         insumos: List[Dict[str, Any]] = []
@@ -81,7 +88,7 @@ def generate_justification(
             )
 
         resp = client.chat.completions.create(
-            model=MODEL_JUST,
+            model=budget.model_for(MODEL_JUST),
             messages=[
                 {"role": "system", "content": (
                     "Eres un asistente experto en análisis de licitaciones. "
@@ -92,8 +99,11 @@ def generate_justification(
             ],
             temperature=0.3,
         )
+        tracing.record_usage("generate_justification", resp)
         return resp.choices[0].message.content.strip()
     except Exception:
+        if not fallback:
+            raise
         return _fallback_text(rows, winner)
 
 
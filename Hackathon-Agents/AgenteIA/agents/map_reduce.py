@@ -0,0 +1,118 @@
+"""Validación map-reduce de propuestas largas.
+
+La propuesta se corta en secciones de ~SECTION_CHARS (en límites de párrafo).
+Cada sección se valida en paralelo con su propio contexto RAG (map); luego,
+por validador, se fusionan los issues eliminando duplicados y se combinan los
+scores ponderando por el largo de cada sección (reduce). El resultado conserva
+la forma `{issues, score}` de los validadores.
+"""
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, List, Tuple
+
+from rapidfuzz import fuzz, utils as fuzz_utils
+
+from utils import budget
+
+ENABLED = os.environ.get("MAP_REDUCE_VALIDATION", "1") == "1"
+SECTION_CHARS = int(os.environ.get("SECTION_CHARS", "6000"))
+MAX_SECTIONS = int(os.environ.get("MAX_SECTIONS", "8"))
+MAP_WORKERS = int(os.environ.get("MAP_WORKERS", "4"))
+# Similitud de evidencia (token_set_ratio) a partir de la cual dos issues del mismo tipo son el mismo
+DEDUPE_THRESHOLD = int(os.environ.get("ISSUE_DEDUPE_THRESHOLD", "85"))
+
+_SEVERITY_RANK = {"ALTO": 2, "ROJO": 2, "MEDIO": 1, "AMARILLO": 1}
+
+
+def enabled() -> bool:
+    # Con presupuesto de tokens en riesgo se vuelve al modo de una sola sección
+    return ENABLED and budget.level() == 0
+
+
+def settings() -> Tuple[Any, ...]:
+    return (ENABLED, SECTION_CHARS, MAX_SECTIONS, DEDUPE_THRESHOLD)
+
+
+def _cut_point(window: str, size: int) -> int:
+    for sep in ("\n\n", "\n", ". ", " "):
+        pos = window.rfind(sep, size // 2, size)
+        if pos != -1:
+            return pos + len(sep)
+    return size
+
+
+def iter_sections(read_prefix: Callable[[int], str], size: int = SECTION_CHARS,
+                  max_sections: int = MAX_SECTIONS) -> Iterator[str]:
+    """Secciones a partir de una función `read_prefix(n) -> texto[:n]`.
+
+    Cada corte depende solo del texto hasta el final de su sección, así que con
+    un documento perezoso la primera sección está lista antes de decodificar el resto.
+    """
+    start = 0
+    for _ in range(max_sections):
+        window = read_prefix(start + size + 1)[start:]
+        if not window.strip():
+            return
+        if len(window) <= size:
+            yield window
+            return
+        cut = _cut_point(window, size)
+        yield window[:cut]
+        start += cut
+
+
+def map_sections(sections: Iterator[str], fn: Callable[[str], Any], workers: int = MAP_WORKERS) -> List[Tuple[int, Any]]:
+    """Aplica `fn` a cada sección en paralelo; devuelve [(largo, resultado)] en orden."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="map-seccion") as pool:
+        # Cada tarea hereda traza y presupuesto de la corrida (contextvars)
+        futures = [(len(sec), pool.submit(contextvars.copy_context().run, fn, sec)) for sec in sections]
+        return [(n, fut.result()) for n, fut in futures]
+
+
+def _same_issue(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    if str(a.get("type", "")).strip().lower() != str(b.get("type", "")).strip().lower():
+        return False
+    return fuzz.token_set_ratio(str(a.get("evidence", "")), str(b.get("evidence", "")),
+                               processor=fuzz_utils.default_process) >= DEDUPE_THRESHOLD
+
+
+def dedupe_issues(issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    merged: List[Dict[str, Any]] = []
+    for it in issues:
+        dup = next((m for m in merged if _same_issue(m, it)), None)
+        if dup is None:
+            merged.append(dict(it))
+            continue
+        secciones = sorted(set(dup.get("secciones", [])) | set(it.get("secciones", [])))
+        if _SEVERITY_RANK.get(str(it.get("severity", "")).upper(), 0) > _SEVERITY_RANK.get(str(dup.get("severity", "")).upper(), 0):
+            dup.update(it)
+        dup["secciones"] = secciones
+    return merged
+
+
+def reduce_results(parts: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Fusiona los resultados `{issues, score}` de un validador sobre varias secciones."""
+    if len(parts) == 1:
+        return parts[0][1]
+    issues = []
+    total_w = 0
+    acc = 0.0
+    for i, (weight, res) in enumerate(parts, start=1):
+        for it in res.get("issues", []) or []:
+            issues.append({**it, "secciones": [i]})
+        try:
+            acc += float(res.get("score")) * weight
+            total_w += weight
+        except (TypeError, ValueError):
+            pass  # sección sin respuesta utilizable: no pesa en el score
+    score = int(round(acc / total_w)) if total_w else None
+    ruteo = [res["ruteo"] for _, res in parts if res.get("ruteo")]
+    out = {"issues": dedupe_issues(issues), "score": score, "secciones": len(parts), "ruteo": ruteo}
+    # Una sección degradada marca el resultado completo (no se cachea)
+    errores = [res["error"] for _, res in parts if res.get("error")]
+    if errores or any(res.get("degradado") for _, res in parts):
+        out["degradado"] = True
+    if errores:
+        out["error"] = "; ".join(errores)
+    return out
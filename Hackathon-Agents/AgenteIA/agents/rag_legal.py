@@ -1,5 +1,5 @@
-from typing import Dict, Any, List
-from rag.retrieve import retrieve_context
+from typing import Dict, Any, List, Optional
+from rag.retrieve import retrieve_context, retrieve_contexts
 
 TOPICS = {
     "garantias": "garantías",
@@ -11,18 +11,24 @@ TOPICS = {
 }
 
 
-def run(question: str, extra_context: str = "", k: int = 6) -> Dict[str, Any]:
+def _question(question: str, extra_context: str = "") -> str:
     q = (question or "").strip()
     if extra_context:
         q += f"\n\nCONSIDERA ESTE CONTEXTO DE LA PROPUESTA:\n{extra_context[:1500]}"
-    ctx = retrieve_context(q, k=k)
+    return q
+
+
+def run(question: str, extra_context: str = "", k: int = 6) -> Dict[str, Any]:
+    ctx = retrieve_context(_question(question, extra_context), k=k)
     return {"context": ctx}
 
 
-def run_topics(topics: List[str], proposal_excerpt: str = "", k: int = 6) -> Dict[str, Any]:
-    out = {}
-    for t in topics:
-        label = TOPICS.get(t, t)
-        res = run(f"Extrae reglas y requisitos sobre: {label}. Cita textualmente si es posible.", proposal_excerpt, k=k)
-        out[t] = res["context"]
-    return out
\ No newline at end of file
+def run_topics(topics: List[str], proposal_excerpt: str = "", k: int = 6, excerpts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    # Todas las consultas de tópicos en un solo lote (un embedding + una búsqueda);
+    # `excerpts` da un extracto de la propuesta distinto por tópico
+    excerpts = excerpts or {}
+    queries = [
+        _question(f"Extrae reglas y requisitos sobre: {TOPICS.get(t, t)}. Cita textualmente si es posible.", excerpts.get(t, proposal_excerpt))
+        for t in topics
+    ]
+    return dict(zip(topics, retrieve_contexts(queries, k=k)))
\ No newline at end of file
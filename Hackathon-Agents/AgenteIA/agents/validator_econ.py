@@ -1,6 +1,9 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from openai import OpenAI
 
+from utils import budget, model_router, structured
+from utils.econ_extract import extract_facts, check_facts, format_facts
+
 client = OpenAI()
 MODEL = "gpt-4o-mini"
 
@@ -10,28 +13,65 @@ SYSTEM = (
 )
 
 PROMPT = (
-    "Contexto (RAG):\n{ctx}\n\nPropuesta:\n{proposal}\n\n"
+    "Contexto (RAG):\n{ctx}\n\nPresupuesto referencial de la licitación: {presupuesto}\n\n"
+    "Hechos económicos extraídos de la propuesta ([tipo/clase] valor (posición): «contexto»):\n{proposal}\n\n"
+    "Tarea: verifica CONDICIONES ECONÓMICAS (presupuesto, hitos, formas de pago). "
+    "Reporta faltantes/ambigüedades y puntúa conformidad económica (0-100)."
+)
+# Sin montos/porcentajes/plazos reconocibles se envía el texto de la propuesta
+PROMPT_TEXTO = (
+    "Contexto (RAG):\n{ctx}\n\nPresupuesto referencial de la licitación: {presupuesto}\n\nPropuesta:\n{proposal}\n\n"
     "Tarea: verifica CONDICIONES ECONÓMICAS (presupuesto, hitos, formas de pago). "
     "Reporta faltantes/ambigüedades y puntúa conformidad económica (0-100)."
 )
+# Tope del score cuando las reglas encuentran una violación grave
+RULE_SCORE_CAP = 40
+
+
+def _with_rules(data: Dict[str, Any], rule_issues: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not rule_issues:
+        return data
+    data["issues"] = rule_issues + list(data.get("issues", []) or [])
+    # Sin score utilizable se deja en None: el agregador lo marca como faltante
+    if any(i["severity"] == "ALTO" for i in rule_issues) and data.get("score") is not None:
+        try:
+            data["score"] = min(int(data["score"]), RULE_SCORE_CAP)
+        except (TypeError, ValueError):
+            data["score"] = None
+    return data
+
+
+def run(proposal_text: str, ctx_items: List[Dict], presupuesto: Optional[float] = None,
+        facts: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    # Montos, porcentajes y plazos por regex; las violaciones claras no necesitan LLM
+    if facts is None:
+        facts = extract_facts(proposal_text)
+    rule_issues = check_facts(facts, presupuesto)
+    if budget.deterministic():
+        return _with_rules(budget.fallback_result("validator_econ"), rule_issues)
+    max_prop, max_items, max_item = budget.context_limits()
+    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:max_item]}" for c in budget.trim_context(ctx_items, max_items)])
+    ref = f"${presupuesto:,.2f}" if presupuesto else "no informado"
+    if facts:
+        content = PROMPT.format(ctx=ctx, presupuesto=ref, proposal=format_facts(facts)[:max_prop])
+    else:
+        content = PROMPT_TEXTO.format(ctx=ctx, presupuesto=ref, proposal=proposal_text[:max_prop])
 
+    def _call(model: str):
+        def create():
+            return client.chat.completions.create(
+                model=model,
+                temperature=0.2,
+                response_format=structured.response_format("validacion", structured.VALIDATION_SCHEMA),
+                messages=[
+                    {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
+                    {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
+                ]
+            )
+        return structured.call("validator_econ", create, structured.validation_result)
 
-def run(proposal_text: str, ctx_items: List[Dict]) -> Dict[str, Any]:
-    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:1200]}" for c in ctx_items])
-    content = PROMPT.format(ctx=ctx, proposal=proposal_text[:6000])
-    resp = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.2,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
-            {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
-        ]
-    )
-    text = resp.choices[0].message.content
-    import json
-    try:
-        data = json.loads(text)
-    except Exception:
-        data = {"issues": [{"type": "parse_error", "where": "validator_econ", "evidence": text[:1000], "severity": "MEDIO", "recommendation": "Revisar"}], "score": 50}
-    return data
\ No newline at end of file
+    (data, text), ruteo = model_router.cascade("validator_econ", MODEL, _call, lambda r: model_router.score_reason(r[0]))
+    if data is None:
+        data = structured.unavailable("validator_econ", text)
+    data["ruteo"] = ruteo
+    return _with_rules(data, rule_issues)
\ No newline at end of file
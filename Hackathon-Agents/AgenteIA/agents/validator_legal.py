@@ -1,6 +1,9 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from openai import OpenAI
 
+from utils import budget, model_router, structured
+from utils.clause_scan import scan, missing_issues, format_spans
+
 client = OpenAI()
 MODEL = "gpt-4o-mini"
 
@@ -10,29 +13,60 @@ SYSTEM = (
 )
 
 PROMPT = (
-    "Contexto (RAG):\n{ctx}\n\nPropuesta:\n{proposal}\n\n"
-    "Tarea: verifica GARANTÍAS, MULTAS y PLAZOS según lo exigido. "
-    "Si falta algo, o es ambiguo, repórtalo como issue. Puntúa de 0-100 la conformidad legal."
+    "Contexto (RAG):\n{ctx}\n\n"
+    "Cláusulas detectadas en la propuesta completa ([cláusulas | posición] texto):\n{proposal}\n\n"
+    "Cláusulas sin ninguna mención en la propuesta (ya reportadas): {faltantes}\n\n"
+    "Tarea: verifica GARANTÍAS, MULTAS y PLAZOS de las cláusulas detectadas según lo exigido. "
+    "Si algo es insuficiente o ambiguo, repórtalo como issue indicando la posición. Puntúa de 0-100 la conformidad legal."
 )
+# Cada cláusula obligatoria ausente descuenta del score máximo
+MISSING_PENALTY = 30
+
+
+def _with_missing(data: Dict[str, Any], clauses: Dict[str, Any]) -> Dict[str, Any]:
+    issues = missing_issues(clauses)
+    if not issues:
+        return data
+    data["issues"] = issues + list(data.get("issues", []) or [])
+    # Sin score utilizable se deja en None: el agregador lo marca como faltante
+    if data.get("score") is not None:
+        cap = max(100 - MISSING_PENALTY * len(issues), 0)
+        try:
+            data["score"] = min(int(data["score"]), cap)
+        except (TypeError, ValueError):
+            data["score"] = None
+    return data
+
+
+def run(proposal_text: str, ctx_items: List[Dict], clauses: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # `clauses`: resultado de clause_scan.scan sobre el documento completo; si no llega, se escanea el texto recibido
+    if clauses is None:
+        clauses = scan(proposal_text)
+    if budget.deterministic():
+        return _with_missing(budget.fallback_result("validator_legal"), clauses)
+    if not clauses.get("tramos"):
+        # Sin ninguna cláusula que revisar no hace falta el LLM
+        return _with_missing({"issues": [], "score": 100}, clauses)
+    max_prop, max_items, max_item = budget.context_limits()
+    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:max_item]}" for c in budget.trim_context(ctx_items, max_items)])
+    faltantes = ", ".join(clauses.get("faltantes", [])) or "ninguna"
+    content = PROMPT.format(ctx=ctx, proposal=format_spans(clauses, max_prop), faltantes=faltantes)
 
+    def _call(model: str):
+        def create():
+            return client.chat.completions.create(
+                model=model,
+                temperature=0.2,
+                response_format=structured.response_format("validacion", structured.VALIDATION_SCHEMA),
+                messages=[
+                    {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
+                    {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
+                ]
+            )
+        return structured.call("validator_legal", create, structured.validation_result)
 
-def run(proposal_text: str, ctx_items: List[Dict]) -> Dict[str, Any]:
-    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:1200]}" for c in ctx_items])
-    content = PROMPT.format(ctx=ctx, proposal=proposal_text[:6000])
-    resp = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.2,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
-            {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
-        ]
-    )
-    text = resp.choices[0].message.content
-    # Intento de parseo seguro
-    import json
-    try:
-        data = json.loads(text)
-    except Exception:
-        data = {"issues": [{"type": "parse_error", "where": "validator_legal", "evidence": text[:1000], "severity": "MEDIO", "recommendation": "Revisar"}], "score": 50}
-    return data
\ No newline at end of file
+    (data, text), ruteo = model_router.cascade("validator_legal", MODEL, _call, lambda r: model_router.score_reason(r[0]))
+    if data is None:
+        data = structured.unavailable("validator_legal", text)
+    data["ruteo"] = ruteo
+    return _with_missing(data, clauses)
\ No newline at end of file
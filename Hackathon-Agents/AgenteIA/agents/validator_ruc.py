@@ -1,11 +1,16 @@
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from rapidfuzz import fuzz
 import re
 import unicodedata
+import hashlib
+import threading
 from openai import OpenAI
 import os
 
+from utils import tracing, budget, model_router, structured
+from utils.ruc_extract import check_ruc
+
 SRI_URL = (
     "https://srienlinea.sri.gob.ec/"
     "sri-catastro-sujeto-servicio-internet/rest/ConsolidadoContribuyente/"
@@ -30,6 +35,7 @@ if not api_key:
 client = OpenAI(api_key=api_key)
 MODEL = "gpt-4o-mini"
 
+@tracing.traced("call_sri")
 def call_sri(ruc: str, max_retries=3):
     url = SRI_URL.format(ruc=ruc)
     
@@ -47,6 +53,7 @@ def call_sri(ruc: str, max_retries=3):
             return None
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             if attempt < max_retries - 1:
+                tracing.record_retry("call_sri")
                 import time
                 # Exponential backoff
                 time.sleep(2 ** attempt)
@@ -78,6 +85,8 @@ def assess_related_with_ai(actividad: str, razon: str, objeto: str) -> Dict[str,
     Utiliza la API de OpenAI para determinar si la actividad económica principal
     es adecuada para el objeto del contrato.
     """
+    if budget.deterministic():
+        return assess_related_deterministic(actividad, razon, objeto)
     try:
         prompt = f"""
         Evalúa si la actividad económica principal de una empresa es coherente y adecuada 
@@ -93,28 +102,36 @@ def assess_related_with_ai(actividad: str, razon: str, objeto: str) -> Dict[str,
         3. "reasoning": explicación detallada de tu evaluación
         """
         
-        response = client.chat.completions.create(
-            model=MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "Eres un experto en análisis de contratos y validación de empresas que responde exclusivamente en formato JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2
+        def _call(model: str):
+            def create():
+                return client.chat.completions.create(
+                    model=model,
+                    response_format=structured.response_format("relacion_ruc", structured.RELATEDNESS_SCHEMA),
+                    messages=[
+                        {"role": "system", "content": "Eres un experto en análisis de contratos y validación de empresas que responde exclusivamente en formato JSON."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.2
+                )
+            return structured.call("ruc_relatedness", create, structured.relatedness_result)[0]
+
+        ai_response, ruteo = model_router.cascade(
+            "ruc_relatedness", MODEL, _call,
+            lambda r: "json_invalido" if r is None else model_router.confidence_reason(r["confidence"]),
         )
+        if ai_response is None:
+            raise ValueError("Respuesta de IA sin JSON válido tras reparación y reintento")
         
-        import json
-        ai_response = json.loads(response.choices[0].message.content)
-        
-        related = ai_response.get("related", False)
-        confidence = ai_response.get("confidence", 0)
-        reasoning = ai_response.get("reasoning", "No se proporcionó razonamiento")
+        related = ai_response["related"]
+        confidence = ai_response["confidence"]
+        reasoning = ai_response["reasoning"]
         
         return {
             "related": related,
             "confidence": confidence,
             "why": reasoning,
-            "ai_powered": True
+            "ai_powered": True,
+            "ruteo": ruteo,
         }
     except Exception as e:
         # Si hay algún error con la API de OpenAI, usamos el método determinístico como fallback
@@ -158,53 +175,233 @@ def assess_related_deterministic(actividad: str, razon: str, objeto: str) -> Dic
 assess_related = assess_related_with_ai
 
 
-def run(ruc: str, objeto_contrato: str) -> Dict[str, Any]:
-    out = {"ruc": ruc, "exists": False, "related": False, "risk": "ALTO", "rationale": "", "ai_powered": False}
+# ============ Relación actividad vs objeto: memo + vía rápida + lote ============
+
+# Umbrales de la vía rápida determinística (actividad vs objeto)
+FAST_RELATED_SET = 60
+FAST_UNRELATED_SET = 20
+FAST_UNRELATED_PART = 35
+
+_verdicts: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_verdicts_lock = threading.Lock()
+
+
+def _verdict_key(actividad: str, objeto: str) -> Tuple[str, str]:
+    return _normalize(actividad), hashlib.sha1(_normalize(objeto).encode("utf-8")).hexdigest()
+
+
+def assess_related_fast(actividad: str, objeto: str) -> Optional[Dict[str, Any]]:
+    """Resuelve los casos claros con rapidfuzz; None si el caso es ambiguo."""
+    a, obj = _normalize(actividad), _normalize(objeto)
+    if not a or not obj:
+        return None
+    sim_set = fuzz.token_set_ratio(a, obj)
+    sim_part = fuzz.partial_ratio(a, obj)
+    overlap = _token_overlap(a, obj)
+    scores = f"act-obj(set={sim_set:.1f}, part={sim_part:.1f}, overlap={overlap})"
+    if sim_set >= FAST_RELATED_SET and overlap:
+        return {"related": True, "confidence": int(sim_set), "why": f"{scores}. Coherente con el proyecto.", "ai_powered": False}
+    if sim_set < FAST_UNRELATED_SET and sim_part < FAST_UNRELATED_PART and not overlap:
+        return {"related": False, "confidence": int(100 - sim_set), "why": f"{scores}. Sin relación con el proyecto.", "ai_powered": False}
+    return None
+
+
+def assess_related_batch(items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """Evalúa varios (actividad, razón social, objeto) en una sola llamada al LLM."""
+    if not items:
+        return []
+    if budget.deterministic():
+        return [assess_related_deterministic(*it) for it in items]
+    # Cascada por caso: el modelo chico resuelve el lote y solo los casos con
+    # confianza baja o sin respuesta válida pasan al modelo de escalamiento
+    models = model_router.models_for("ruc_relatedness", MODEL)
+    answers: Dict[int, Dict[str, Any]] = {}
+    intentos: Dict[int, List[Dict[str, Any]]] = {i: [] for i in range(len(items))}
+    used: Dict[int, str] = {}
+    pending = list(range(len(items)))
+    for n, model in enumerate(models):
+        got = _relatedness_batch_call(model, [items[i] for i in pending])
+        retry = []
+        for j, i in enumerate(pending):
+            r = got.get(j)
+            reason = "json_invalido" if r is None else model_router.confidence_reason(r["confidence"])
+            tracing.record_route("ruc_relatedness", model, reason or "aceptado")
+            intentos[i].append({"modelo": model, "motivo": reason})
+            if r is not None:
+                answers[i], used[i] = r, model
+            if reason is not None and n < len(models) - 1:
+                retry.append(i)
+        pending = retry
+        if not pending:
+            break
+
+    out = []
+    for i, it in enumerate(items):
+        r = answers.get(i)
+        if r is None:
+            fb = assess_related_deterministic(*it)
+            fb["error"] = "Sin respuesta de IA para este caso"
+            fb["ruteo"] = model_router.summary("ruc_relatedness", intentos[i])
+            out.append(fb)
+            continue
+        out.append({
+            "related": r["related"],
+            "confidence": r["confidence"],
+            "why": r["reasoning"],
+            "ai_powered": True,
+            "ruteo": model_router.summary("ruc_relatedness", intentos[i], used[i]),
+        })
+    return out
+
+
+def _relatedness_batch_call(model: str, items: List[Tuple[str, str, str]]) -> Dict[int, Dict[str, Any]]:
+    """Una llamada al LLM para un lote de casos: {n° de caso: respuesta}; vacío si falla."""
     try:
-        data = call_sri(ruc)
+        casos = "\n".join(
+            f'{i}. Actividad: "{a}" | Razón social: "{r}" | Objeto: "{o}"' for i, (a, r, o) in enumerate(items)
+        )
+        prompt = f"""
+        Evalúa, para cada caso, si la actividad económica principal de la empresa es coherente y adecuada
+        para el proyecto o contrato descrito.
+
+        {casos}
+
+        Responde con un JSON {{"resultados": [...]}} con un elemento por caso que contenga:
+        1. "id": número del caso
+        2. "related": true/false (si la actividad es adecuada para el proyecto)
+        3. "confidence": valor de 0 a 100 que indique la confianza en la evaluación
+        4. "reasoning": explicación breve de tu evaluación
+        """
+
+        def create():
+            return client.chat.completions.create(
+                model=model,
+                response_format=structured.response_format("relacion_ruc_lote", structured.RELATEDNESS_BATCH_SCHEMA),
+                messages=[
+                    {"role": "system", "content": "Eres un experto en análisis de contratos y validación de empresas que responde exclusivamente en formato JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2
+            )
+        data, _ = structured.call("ruc_relatedness", create, structured.relatedness_batch_result)
+        return {r["id"]: r for r in (data or {}).get("resultados", [])}
+    except Exception as e:
+        print(f"[ruc] Error en validación por lote con IA ({model}): {e}")
+        return {}
+
+
+def resolve_relatedness(items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """Veredictos para (actividad, razón social, objeto) con a lo sumo una llamada al LLM.
+
+    Orden: memo por (actividad normalizada, hash del objeto) -> vía rápida
+    determinística -> un único lote al LLM con los casos ambiguos restantes.
+    """
+    keys = [_verdict_key(a, o) for a, _, o in items]
+    verdicts: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    pending: Dict[Tuple[str, str], List[int]] = {}
+    for i, (it, key) in enumerate(zip(items, keys)):
+        with _verdicts_lock:
+            cached = _verdicts.get(key)
+        if cached is not None:
+            tracing.record_cache("ruc_relatedness", True)
+            verdicts[i] = dict(cached)
+            continue
+        tracing.record_cache("ruc_relatedness", False)
+        fast = assess_related_fast(it[0], it[2])
+        if fast is not None:
+            with _verdicts_lock:
+                _verdicts[key] = fast
+            verdicts[i] = dict(fast)
+            continue
+        pending.setdefault(key, []).append(i)
+
+    if pending:
+        order = list(pending)
+        batch = assess_related_batch([items[pending[k][0]] for k in order])
+        for key, verdict in zip(order, batch):
+            if verdict.get("ai_powered"):
+                with _verdicts_lock:
+                    _verdicts[key] = verdict
+            for i in pending[key]:
+                verdicts[i] = dict(verdict)
+    return verdicts
+
+
+def _evaluate_risk(out: Dict[str, Any], data: Dict[str, Any]):
+    # Evaluamos el riesgo
+    if not out["related"]:
+        out["risk"] = "ALTO"
+    else:
+        # Evaluación de estado del contribuyente
+        estado = (data.get("estadoContribuyenteRuc") or "").upper()
+        if estado != "ACTIVO":
+            out["risk"] = "MEDIO"
+            out["rationale"] += f" Estado contribuyente: {estado}."
+        # Verificamos banderas de riesgo
+        elif (data.get("contribuyenteFantasma") == "SI" or
+              data.get("transaccionesInexistente") == "SI"):
+            out["risk"] = "ALTO"
+            out["rationale"] += " Contribuyente con alertas de riesgo."
+        else:
+            out["risk"] = "BAJO"
+
+
+def run_many(pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Valida varios (ruc, objeto) de una licitación: una consulta SRI por RUC
+    distinto y a lo sumo una llamada al LLM para todos los casos ambiguos."""
+    outs: List[Dict[str, Any]] = []
+    sri_cache: Dict[str, Any] = {}
+    to_assess: List[Tuple[int, Dict[str, Any], Tuple[str, str, str]]] = []
+    for ruc, objeto_contrato in pairs:
+        out = {"ruc": ruc, "exists": False, "related": False, "risk": "ALTO", "rationale": "", "ai_powered": False}
+        outs.append(out)
+        # Estructura inválida (provincia, tipo, sufijo): no se consulta al SRI
+        estructura, digito, motivo = check_ruc(ruc)
+        if not estructura:
+            out["rationale"] = f"RUC inválido: {motivo}"
+            continue
+        out["digito_verificador_ok"] = digito
+        try:
+            if ruc not in sri_cache:
+                sri_cache[ruc] = call_sri(ruc)
+            data = sri_cache[ruc]
+        except Exception as e:
+            out["rationale"] = f"Error en validación SRI: {e}"
+            continue
         if not data:
             out["rationale"] = "RUC no existe o sin datos"
-            return out
-        
+            continue
+
         out["exists"] = True
         out["sri_data"] = data  # Incluimos los datos completos del SRI
-        
+
         actividad = (data.get("actividadEconomicaPrincipal") or "").strip()
         razon = (data.get("razonSocial") or "").strip()
-        
+
         # Añadimos información adicional relevante
         out["actividad_economica"] = actividad
         out["razon_social"] = razon
         out["estado_contribuyente"] = data.get("estadoContribuyenteRuc")
         out["tipo_contribuyente"] = data.get("tipoContribuyente")
         out["obligado_contabilidad"] = data.get("obligadoLlevarContabilidad")
-        
-        # Evaluación principal con IA
-        verdict = assess_related_with_ai(actividad, razon, objeto_contrato)
+        to_assess.append((len(outs) - 1, data, (actividad, razon, objeto_contrato)))
+
+    verdicts = resolve_relatedness([it for _, _, it in to_assess])
+    for (idx, data, _), verdict in zip(to_assess, verdicts):
+        out = outs[idx]
         out["related"] = bool(verdict.get("related", False))
         out["rationale"] = verdict.get("why", "")
         out["ai_powered"] = verdict.get("ai_powered", False)
         out["confidence"] = verdict.get("confidence", 0)
+        if verdict.get("ruteo"):
+            out["ruteo"] = verdict["ruteo"]
+        _evaluate_risk(out, data)
+    return outs
 
-        # Evaluamos el riesgo
-        if not out["related"]:
-            out["risk"] = "ALTO"
-        else:
-            # Evaluación de estado del contribuyente
-            estado = data.get("estadoContribuyenteRuc", "").upper()
-            if estado != "ACTIVO":
-                out["risk"] = "MEDIO"
-                out["rationale"] += f" Estado contribuyente: {estado}."
-            # Verificamos banderas de riesgo
-            elif (data.get("contribuyenteFantasma") == "SI" or 
-                  data.get("transaccionesInexistente") == "SI"):
-                out["risk"] = "ALTO"
-                out["rationale"] += " Contribuyente con alertas de riesgo."
-            else:
-                out["risk"] = "BAJO"
-                
-        return out
+
+def run(ruc: str, objeto_contrato: str) -> Dict[str, Any]:
+    try:
+        return run_many([(ruc, objeto_contrato)])[0]
     except Exception as e:
-        out["rationale"] = f"Error en validación SRI: {e}"
-        out["risk"] = "ALTO"
-        return out
\ No newline at end of file
+        return {"ruc": ruc, "exists": False, "related": False, "risk": "ALTO",
+                "rationale": f"Error en validación SRI: {e}", "ai_powered": False}
@@ -1,6 +1,8 @@
 from typing import Dict, Any, List
 from openai import OpenAI
 
+from utils import budget, model_router, structured
+
 client = OpenAI()
 MODEL = "gpt-4o-mini"
 
@@ -17,21 +19,27 @@ PROMPT = (
 
 
 def run(proposal_text: str, ctx_items: List[Dict]) -> Dict[str, Any]:
-    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:1200]}" for c in ctx_items])
-    content = PROMPT.format(ctx=ctx, proposal=proposal_text[:6000])
-    resp = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.2,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
-            {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
-        ]
-    )
-    text = resp.choices[0].message.content
-    import json
-    try:
-        data = json.loads(text)
-    except Exception:
-        data = {"issues": [{"type": "parse_error", "where": "validator_tech", "evidence": text[:1000], "severity": "MEDIO", "recommendation": "Revisar"}], "score": 50}
+    if budget.deterministic():
+        return budget.fallback_result("validator_tech")
+    max_prop, max_items, max_item = budget.context_limits()
+    ctx = "\n---\n".join([f"Fuente: {c.get('source')}\n{c.get('text')[:max_item]}" for c in budget.trim_context(ctx_items, max_items)])
+    content = PROMPT.format(ctx=ctx, proposal=proposal_text[:max_prop])
+
+    def _call(model: str):
+        def create():
+            return client.chat.completions.create(
+                model=model,
+                temperature=0.2,
+                response_format=structured.response_format("validacion", structured.VALIDATION_SCHEMA),
+                messages=[
+                    {"role": "system", "content": SYSTEM + " Devuelve únicamente JSON válido."},
+                    {"role": "user", "content": content + "\n\nSalida estricta JSON con campos: issues (array) y score (0-100)."},
+                ]
+            )
+        return structured.call("validator_tech", create, structured.validation_result)
+
+    (data, text), ruteo = model_router.cascade("validator_tech", MODEL, _call, lambda r: model_router.score_reason(r[0]))
+    if data is None:
+        data = structured.unavailable("validator_tech", text)
+    data["ruteo"] = ruteo
     return data
\ No newline at end of file
@@ -1,17 +1,26 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-import os, io, json, uuid, shutil, glob
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+import os, io, json, uuid, shutil, glob, hashlib, threading, contextvars
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 
 # === Importa tu lógica ya creada ===
-from utils.pdf_text import pdf_to_text
+from utils.pdf_text import pdf_to_text, open_document
+from utils.chunk import chunk_text
 from utils.ruc_extract import extract_rucs
-from agents import rag_legal, validator_legal, validator_tech, validator_econ, validator_incons, validator_ruc, aggregator
+from utils import econ_extract, clause_scan, model_router, structured
+from agents import rag_legal, validator_legal, validator_tech, validator_econ, validator_incons, validator_ruc, aggregator, map_reduce
 from agents.justificador import generate_justification
-from rag.chroma_setup import get_docs_collection
+from rag.chroma_setup import get_docs_collection, get_lic_collection, drop_lic_collection
+from rag import vector_gc, near_dup
+from utils.jobs import JobQueue
+from utils.file_hash import sha256_file
+from utils import analysis_cache, tracing, budget, report_index, search_index
 from openai import OpenAI
 
 # PDF resumen ejecutivo
@@ -37,6 +46,16 @@ client = OpenAI()
 MODEL_EMB = os.environ.get("MODEL_EMB", "text-embedding-3-small")
 MODEL_JUST = os.environ.get("MODEL_JUST", "gpt-4o-mini")
 
+# Subidas en streaming + indexación en segundo plano
+UPLOAD_CHUNK = int(os.environ.get("UPLOAD_CHUNK", str(1024 * 1024)))
+INDEX_QUEUE = JobQueue("index", workers=int(os.environ.get("INDEX_WORKERS", "1")))
+# Justificación del ganador: se genera después del análisis, fuera del camino crítico de /analizar
+JUST_QUEUE = JobQueue("justificacion", workers=int(os.environ.get("JUST_WORKERS", "1")))
+JUST_VERSION = "1"
+JUST_RETRY_SECONDS = int(os.environ.get("JUST_RETRY_SECONDS", "60"))
+# Trabajo sobre el documento completo (escaneo de cláusulas, hechos económicos) fuera del camino de /analizar
+_DOC_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("DOC_WORKERS", "4")), thread_name_prefix="doc")
+
 # ============ Helpers de persistencia (MVP) ============
 
 def _load_db() -> Dict[str, Any]:
@@ -50,6 +69,9 @@ def _load_db() -> Dict[str, Any]:
         # Manejo robusto ante JSON inválido
         return {"licitaciones": []}
 
+# Lectura-modificación-escritura de la DB: se relee y guarda bajo este lock
+DB_LOCK = threading.RLock()
+
 def _save_db(db: Dict[str, Any]):
     with open(DB_PATH, "w", encoding="utf-8") as f:
         json.dump(db, f, ensure_ascii=False, indent=2)
@@ -63,18 +85,43 @@ def _get_licitacion(db, lic_id: str):
 # ============ Embeddings para Chroma (contratos) ============
 
 def _embed_batch(texts: List[str]):
-    resp = client.embeddings.create(model=MODEL_EMB, input=texts)
+    with tracing.span("embeddings"):
+        resp = client.embeddings.create(model=MODEL_EMB, input=texts)
+    tracing.record_usage("embeddings", resp)
     return [d.embedding for d in resp.data]
 
 
 def index_folder_to_contratos(folder: str, lic_id: str):
-    col = get_docs_collection()  # colección "contratos"
     pdfs = glob.glob(os.path.join(folder, "**/*.pdf"), recursive=True)
+    return index_files_to_contratos(pdfs, lic_id)
+
+
+def _lic_doc_meta(lic: Optional[Dict[str, Any]], lic_id: str) -> Dict[str, str]:
+    folder = os.path.join(DOCS_DIR, lic_id)
+    return {os.path.join(folder, d.get("file")): d.get("type", "propuesta") for d in (lic or {}).get("docs", [])}
+
+
+def _doc_kind(path: str, doc_meta: Dict[str, str]) -> str:
+    # Tipo declarado al subir; si no hay metadata, se infiere por nombre
+    t = doc_meta.get(path)
+    if not t:
+        t = "pliego" if "pliego" in os.path.basename(path).lower() else "propuesta"
+    return t
+
+
+@tracing.traced("index_contratos")
+def index_files_to_contratos(pdfs: List[str], lic_id: str):
+    col = get_lic_collection(lic_id)  # partición de "contratos" de esta licitación
+    doc_meta = _lic_doc_meta(_get_licitacion(_load_db(), lic_id), lic_id)
+    # Pliegos primero: su texto es plantilla y no cuenta como copia entre propuestas
+    pdfs = sorted(pdfs, key=lambda p: _doc_kind(p, doc_meta) != "pliego")
+    indexed = []
+    duplicados = {}
     for path in pdfs:
         try:
+            # Reindexar un documento reemplaza sus chunks previos (solo dentro de la partición)
+            col.delete(where={"path": path})
             text = pdf_to_text(path)
-            # Chunking muy simple (reusa tu utils/chunk si prefieres)
-            from utils.chunk import chunk_text
             chunks = chunk_text(text)
             embs = _embed_batch(chunks)
             ids = [str(uuid.uuid4()) for _ in chunks]
@@ -83,83 +130,272 @@ def index_folder_to_contratos(folder: str, lic_id: str):
                 "path": path,
                 "type": "contrato",
                 "licitacion_id": lic_id,
-            } for _ in chunks]
+                "chunk": i,
+            } for i in range(len(chunks))]
             col.add(ids=ids, documents=chunks, embeddings=embs, metadatas=metas)
+            indexed.append(os.path.basename(path))
         except Exception as e:
             print(f"[index] Error {path}: {e}")
+            continue
+        try:
+            # Firma MinHash de la propuesta contra el índice LSH de todas las licitaciones
+            if _doc_kind(path, doc_meta) == "pliego":
+                near_dup.add_template(lic_id, chunks)
+            else:
+                dups = near_dup.add_document(path, lic_id, chunks)
+                if dups:
+                    duplicados[os.path.basename(path)] = dups
+                    print(f"[index] {os.path.basename(path)}: {len(dups)} propuesta(s) casi duplicada(s)")
+        except Exception as e:
+            print(f"[near_dup] Error {path}: {e}")
+    return {"indexed": indexed, "casi_duplicados": duplicados}
 
-# ============ Orquestador para una licitación ============
-
-def run_analysis_for_lic(lic_id: str, objeto: str) -> Dict[str, Any]:
-    folder = os.path.join(DOCS_DIR, lic_id)
-    pdfs = glob.glob(os.path.join(folder, "**/*.pdf"), recursive=True)
-    if not pdfs:
-        raise HTTPException(status_code=400, detail="No hay PDFs para esta licitación")
 
-    # Separar pliego vs propuestas desde DB si existe metadata; fallback por nombre
-    db = _load_db()
-    lic = _get_licitacion(db, lic_id)
-    doc_meta = {os.path.join(folder, d.get("file")): d.get("type", "propuesta") for d in (lic.get("docs", []) if lic else [])}
-    pliegos = []
-    propuestas = []
-    for path in pdfs:
-        t = doc_meta.get(path)
-        if not t:
-            base = os.path.basename(path).lower()
-            t = "pliego" if "pliego" in base else "propuesta"
-        (pliegos if t == "pliego" else propuestas).append(path)
-    if not propuestas:
-        propuestas = [p for p in pdfs if p not in pliegos]
+def _near_duplicates(path: str, lic_id: str) -> List[Dict[str, Any]]:
+    try:
+        dups = near_dup.matches(path)
+        if not dups and not near_dup.has_signature(path):
+            # Propuestas indexadas antes de las firmas
+            dups = near_dup.add_document(path, lic_id, chunk_text(pdf_to_text(path)))
+        return dups
+    except Exception as e:
+        print(f"[near_dup] Error {path}: {e}")
+        return []
 
-    results = []
-    topics = ["garantias", "multas", "plazos", "tecnicos", "economicos", "coherencia"]
+# ============ Orquestador para una licitación ============
 
+# Subir este valor invalida todos los análisis por documento almacenados
+ANALYSIS_VERSION = "1"
+TOPICS = ["garantias", "multas", "plazos", "tecnicos", "economicos", "coherencia"]
+# Caracteres de la propuesta que leen los validadores (ver budget.context_limits)
+PROPOSAL_CHARS = 6000
+# Recuperación dirigida: chunks indexados de la propuesta por tópico en lugar del prefijo
+PROPOSAL_RETRIEVAL = os.environ.get("PROPOSAL_RETRIEVAL", "1") == "1"
+PROPOSAL_TOPIC_K = int(os.environ.get("PROPOSAL_TOPIC_K", "3"))
+# Tópicos de la propuesta que lee cada validador
+VALIDATOR_TOPICS = {
+    "legal": ["garantias", "multas", "plazos"],
+    "tecnico": ["tecnicos"],
+    "economico": ["economicos"],
+    "inconsistencias": ["coherencia"],
+}
+_topic_embs: Dict[str, List[float]] = {}
+
+
+def _pipeline_fingerprint(objeto: str, presupuesto: Optional[float] = None) -> str:
+    # Modelo + prompts de cada agente y los `settings()` de los módulos que cambian el
+    # resultado: si algo cambia, el análisis cacheado deja de valer
+    parts = [ANALYSIS_VERSION, objeto or "", presupuesto, sorted(rag_legal.TOPICS.items())]
+    for mod in (validator_legal, validator_tech, validator_econ, validator_incons):
+        parts += [mod.MODEL, mod.SYSTEM, mod.PROMPT]
+    parts.append(validator_ruc.MODEL)
+    parts.append(map_reduce.settings())
+    parts += [validator_econ.PROMPT_TEXTO, econ_extract.settings()]
+    parts += [clause_scan.settings(), validator_legal.MISSING_PENALTY]
+    parts += [model_router.settings(), structured.settings()]
+    parts.append((PROPOSAL_RETRIEVAL, PROPOSAL_TOPIC_K, PROPOSAL_CHARS))
+    return analysis_cache.hash_parts(parts)
+
+
+def _doc_hash(path: str, known: Dict[str, str]) -> str:
+    sha = known.get(path)
+    if sha:
+        return sha
+    sha = sha256_file(path)
+    known[path] = sha
+    return sha
+
+
+def _cacheable(report: Dict[str, Any]) -> bool:
+    # No se guardan resultados degradados por errores transitorios o por presupuesto
+    if report.get("scores_faltantes") or report.get("degradados"):
+        return False
+    if any(i.get("type") in ("parse_error", "presupuesto_tokens") for i in report.get("issues", []) or []):
+        return False
+    for rr in report.get("ruc_reports", []) or []:
+        if str(rr.get("rationale", "")).startswith("Error en validación SRI"):
+            return False
+    return True
+
+
+def _build_pliego_context(pliegos: List[str]) -> Dict[str, List[Dict[str, Any]]]:
     # Construir contexto base del pliego para comparar
-    base_ctx = {k: [] for k in topics}
+    base_ctx = {k: [] for k in TOPICS}
     for path in pliegos:
         try:
-            text = pdf_to_text(path)
-            topic_ctx = rag_legal.run_topics(topics, proposal_excerpt=text[:4000], k=6)
-            for k in topics:
+            # Solo se decodifican las páginas que cubren el extracto
+            excerpt = open_document(path).excerpt(4000)
+            topic_ctx = rag_legal.run_topics(TOPICS, proposal_excerpt=excerpt, k=6)
+            for k in TOPICS:
                 base_ctx[k].extend(topic_ctx.get(k, []))
         except Exception:
             continue
+    return base_ctx
+
+
+def _clause_excerpts(clauses: Dict[str, Any]) -> Dict[str, str]:
+    # Consulta RAG de cada tópico legal = tramos de la propuesta con esa cláusula
+    out = {}
+    for t in VALIDATOR_TOPICS["legal"]:
+        spans = [sp["texto"] for sp in clauses.get("tramos", []) if t in sp["clausulas"]]
+        if spans:
+            out[t] = "\n".join(spans)[:4000]
+    return out
+
+
+def _in_background(fn: Callable[[], Any]) -> Future:
+    # La tarea hereda traza y presupuesto de la corrida (contextvars)
+    return _DOC_POOL.submit(contextvars.copy_context().run, fn)
+
+
+def _run_validators(texts: Dict[str, str], excerpts: Dict[str, str], base_ctx: Dict[str, List[Dict[str, Any]]],
+                    presupuesto: Optional[float] = None, econ_facts: Optional[Future] = None,
+                    clauses: Optional[Future] = None, legal: bool = True):
+    """Los cuatro validadores LLM; `texts` por validador, `excerpts` por tópico para el RAG.
+
+    `econ_facts` y `clauses` son tareas en segundo plano sobre el documento completo
+    (hechos económicos y escaneo de cláusulas): se esperan recién cuando las usa su
+    validador, así la decodificación del PDF se solapa con las llamadas al LLM.
+    Con `legal=False` se omite el validador legal (devuelve None en su lugar).
+    """
+    topics = [t for t in TOPICS if t not in VALIDATOR_TOPICS["legal"]]
+    topic_ctx = rag_legal.run_topics(topics, k=6, excerpts=excerpts)
+    # Mezclar contexto del pliego con el de la propuesta
+    for k in topics:
+        topic_ctx[k] = (base_ctx.get(k, []) or []) + (topic_ctx.get(k, []) or [])
+    v_tech  = validator_tech.run(texts["tecnico"], topic_ctx.get("tecnicos", []))
+    v_incon = validator_incons.run(texts["inconsistencias"], topic_ctx.get("coherencia", []))
+    v_econ  = validator_econ.run(texts["economico"], topic_ctx.get("economicos", []), presupuesto=presupuesto,
+                                 facts=econ_facts.result() if econ_facts is not None else None)
+    v_legal = None
+    if legal:
+        v_legal = _validate_legal(clauses.result() if clauses is not None else None, base_ctx, excerpts, texts["legal"])
+    return v_legal, v_tech, v_econ, v_incon
+
+
+def _validate_section(text: str, base_ctx: Dict[str, List[Dict[str, Any]]], presupuesto: Optional[float] = None,
+                      clauses: Optional[Future] = None, legal: bool = True):
+    """Validadores sobre un tramo contiguo de la propuesta, con su propio contexto RAG."""
+    return _run_validators({v: text for v in VALIDATOR_TOPICS}, {t: text[:4000] for t in TOPICS}, base_ctx, presupuesto,
+                           clauses=clauses, legal=legal)
+
+
+def _validate_legal(clauses: Optional[Dict[str, Any]], base_ctx: Dict[str, List[Dict[str, Any]]],
+                    excerpts: Optional[Dict[str, str]] = None, text: str = "") -> Dict[str, Any]:
+    """Validador legal sobre los tramos de cláusulas; sin escaneo previo, escanea `text`."""
+    if clauses is None:
+        clauses = clause_scan.scan(text)
+    topics = VALIDATOR_TOPICS["legal"]
+    # Consulta RAG de cada tópico legal = sus tramos de cláusulas (o el extracto si no hay)
+    topic_ctx = rag_legal.run_topics(topics, k=6, excerpts={**(excerpts or {}), **_clause_excerpts(clauses)})
+    ctx = [c for t in topics for c in (base_ctx.get(t, []) or []) + (topic_ctx.get(t, []) or [])]
+    return validator_legal.run(text, ctx, clauses=clauses)
+
+
+def _topic_query_embeddings(topics: List[str]) -> List[List[float]]:
+    # Las consultas por tópico son fijas: se embeben una sola vez por proceso
+    missing = [t for t in topics if t not in _topic_embs]
+    if missing:
+        queries = [f"Cláusulas de la propuesta sobre: {rag_legal.TOPICS.get(t, t)}" for t in missing]
+        _topic_embs.update(zip(missing, _embed_batch(queries)))
+    return [_topic_embs[t] for t in topics]
+
+
+def _proposal_topic_chunks(lic_id: str, path: str) -> Optional[Dict[str, List[tuple]]]:
+    """Top-k chunks indexados de la propuesta por tópico: {tópico: [(n° chunk, texto)]}.
+
+    None si la propuesta no está indexada en la partición de la licitación.
+    """
+    try:
+        col = get_lic_collection(lic_id)
+        if col.count() == 0:
+            return None
+        qembs = _topic_query_embeddings(TOPICS)
+        with tracing.span("vector_query"):
+            res = col.query(query_embeddings=qembs, n_results=PROPOSAL_TOPIC_K,
+                            where={"source": os.path.basename(path)}, include=["documents", "metadatas"])
+    except Exception as e:
+        print(f"[analisis] recuperación dirigida no disponible ({os.path.basename(path)}): {e}")
+        return None
+    out = {}
+    for t, docs, metas in zip(TOPICS, res.get("documents") or [], res.get("metadatas") or []):
+        # Índices antiguos sin n° de chunk conservan el orden por relevancia
+        out[t] = [((m or {}).get("chunk", 0), d) for d, m in zip(docs, metas) if d]
+    return out if any(out.values()) else None
+
+
+def _retrieval_mode(lic_id: Optional[str], path: str) -> str:
+    """Cómo leerán los validadores la propuesta: "dirigida", "secciones" o "prefijo".
+
+    La recuperación dirigida requiere la propuesta ya indexada en la partición;
+    mientras la indexación en segundo plano siga pendiente se usa la lectura de respaldo.
+    """
+    if lic_id and PROPOSAL_RETRIEVAL and not INDEX_QUEUE.pending(lic_id):
+        try:
+            if get_lic_collection(lic_id).get(where={"source": os.path.basename(path)}, limit=1, include=[]).get("ids"):
+                return "dirigida"
+        except Exception as e:
+            print(f"[analisis] estado del índice no disponible ({os.path.basename(path)}): {e}")
+    return "secciones" if map_reduce.enabled() else "prefijo"
+
+
+def _targeted_text(topic_chunks: Dict[str, List[tuple]], topics: List[str]) -> str:
+    seen, hits = set(), []
+    for t in topics:
+        for n, doc in topic_chunks.get(t, []):
+            if doc not in seen:
+                seen.add(doc)
+                hits.append((n, doc))
+    hits.sort(key=lambda h: h[0])  # en el orden del documento
+    return "\n[...]\n".join(doc for _, doc in hits)[:PROPOSAL_CHARS]
+
+
+def _validate_proposal(path: str, base_ctx: Dict[str, List[Dict[str, Any]]], objeto: str, lic_id: Optional[str] = None,
+                       presupuesto: Optional[float] = None, mode: Optional[str] = None):
+    """Validadores LLM de una propuesta + pares (ruc, objeto) pendientes de validar en el SRI.
+
+    Devuelve también el modo de lectura realmente usado (ver `_retrieval_mode`).
+    """
+    doc = open_document(path)
+    mode = mode or _retrieval_mode(lic_id, path)
+    topic_chunks = _proposal_topic_chunks(lic_id, path) if mode == "dirigida" else None
+    if topic_chunks:
+        used = "dirigida"
+        # Cada validador lee los chunks de la propuesta sobre sus tópicos, estén donde estén
+        doc.prefetch()
+        texts = {v: _targeted_text(topic_chunks, ts) for v, ts in VALIDATOR_TOPICS.items()}
+        excerpts = {t: _targeted_text(topic_chunks, [t]) for t in TOPICS}
+        # Los hechos económicos (montos, %, plazos) y las cláusulas legales (Aho-Corasick) salen
+        # del documento completo: se calculan en segundo plano mientras corren los demás validadores
+        facts = _in_background(lambda: econ_extract.extract_facts(doc.text))
+        clauses = _in_background(lambda: clause_scan.scan(doc.text))
+        validations = _run_validators(texts, excerpts, base_ctx, presupuesto, facts, clauses)
+    elif map_reduce.enabled():
+        used = "secciones"
+        # Propuestas largas: cada sección se valida en paralelo y los resultados se fusionan
+        # El legal lee los tramos de cláusulas del documento completo: corre una sola vez, no por sección
+        sections = map_reduce.iter_sections(doc.excerpt)
+        doc.prefetch()
+        v_legal = _in_background(lambda: _validate_legal(clause_scan.scan(doc.text), base_ctx))
+        parts = map_reduce.map_sections(sections, lambda sec: _validate_section(sec, base_ctx, presupuesto, legal=False))
+        validations = (v_legal.result(),) + tuple(map_reduce.reduce_results([(n, res[i]) for n, res in parts]) for i in range(1, 4))
+    else:
+        used = "prefijo"
+        # Los validadores solo leen el inicio (PROPOSAL_CHARS); el resto se decodifica en segundo plano
+        text = doc.excerpt(PROPOSAL_CHARS)
+        doc.prefetch()
+        validations = _validate_section(text, base_ctx, presupuesto, clauses=_in_background(lambda: clause_scan.scan(doc.text)))
 
-    # Analizar solo propuestas, con contexto del pliego
-    for path in propuestas:
-        text = pdf_to_text(path)
-        topic_ctx = rag_legal.run_topics(topics, proposal_excerpt=text[:4000], k=6)
-        # Mezclar contexto del pliego con el de la propuesta
-        for k in topics:
-            topic_ctx[k] = (base_ctx.get(k, []) or []) + (topic_ctx.get(k, []) or [])
-        v_legal = validator_legal.run(text, topic_ctx.get("garantias", []) + topic_ctx.get("multas", []) + topic_ctx.get("plazos", []))
-        v_tech  = validator_tech.run(text, topic_ctx.get("tecnicos", []))
-        v_econ  = validator_econ.run(text, topic_ctx.get("economicos", []))
-        v_incon = validator_incons.run(text, topic_ctx.get("coherencia", []))
-
-        rucs = extract_rucs(text)
-        # Usar objeto si existe; en su defecto, un extracto del documento como contexto semántico
-        ctx_obj = objeto or " ".join((text or "").split()[:60])
-        ruc_reports = [validator_ruc.run(r, ctx_obj) for r in rucs]
-
-        report = aggregator.aggregate(v_legal, v_tech, v_econ, v_incon, ruc_reports)
-        results.append({
-            "file": os.path.basename(path),
-            "path": path,
-            "report": report
-        })
+    rucs = extract_rucs(doc.text)  # los RUC pueden estar en cualquier página
+    # Usar objeto si existe; en su defecto, un extracto del documento como contexto semántico
+    ctx_obj = objeto or doc.first_words(60)
+    return validations, [(r, ctx_obj) for r in rucs], used
 
-    # Resumen global para la licitación (MVP)
-    total_rojas = sum(1 for r in results for i in r["report"]["issues"] if str(i.get("severity", "")).upper() in ("ALTO","ROJO"))
-    total_amarillas = sum(1 for r in results for i in r["report"]["issues"] if str(i.get("severity", "")).upper() in ("MEDIO","AMARILLO"))
 
-    summary = {"rojas": int(total_rojas), "amarillas": int(total_amarillas)}
-
-    # Calcular filas comparativas y ganador (misma lógica de endpoint comparativo)
+def _compare_rows(results: List[Dict[str, Any]], lic: Optional[Dict[str, Any]]):
+    """Filas comparativas ponderadas y ganador (misma lógica del endpoint comparativo)."""
+    pesos = (lic or {}).get("pesos", {"legal": 35, "tecnico": 40, "economico": 25})
     try:
-        db = _load_db()
-        lic = _get_licitacion(db, lic_id)
-        pesos = (lic or {}).get("pesos", {"legal": 35, "tecnico": 40, "economico": 25})
         wl, wt, we = float(pesos.get("legal", 35)), float(pesos.get("tecnico", 40)), float(pesos.get("economico", 25))
         denom = max(wl + wt + we, 1.0)
         wl, wt, we = wl/denom, wt/denom, we/denom
@@ -200,64 +436,198 @@ def run_analysis_for_lic(lic_id: str, objeto: str) -> Dict[str, Any]:
         ganador = max(candidatas, key=lambda x: x["total"]) if candidatas else None
     except Exception:
         filas, ganador = [], None
+    return filas, ganador, pesos
 
-    # Generar justificación con IA (fallback determinístico si falla)
-    def _generate_just(data_rows, win):
-        try:
-            resumen_insumos = []
-            for f in data_rows:
-                resumen_insumos.append({
-                    "oferente": f["oferente"],
-                    "legal": f["scores"].get("legal", 0),
-                    "tecnico": f["scores"].get("tecnico", 0),
-                    "economico": f["scores"].get("economico", 0),
-                    "rojas": f["rojas"],
-                    "amarillas": f["amarillas"],
-                    "top_riesgos": [
-                        {
-                            "categoria": i.get("category",""),
-                            "severidad": i.get("severity",""),
-                            "desc": i.get("recommendation") or i.get("evidence") or i.get("type")
-                        } for i in (f.get("issues") or [])[:5]
-                    ]
-                })
-
-            prompt = f"""
-            Eres AgenteIA. Con base en los siguientes resultados de análisis de una licitación, redacta una justificación breve (máx. 4 párrafos) en español, clara para usuarios no técnicos, pero precisa. Explica cuál contrato es la mejor opción y por qué, comparando criterios legales, técnicos y económicos. Considera garantías, multas, plazos, materiales/procesos, tiempos, presupuestos/forma de pago, vacíos/inconsistencias, cláusulas ambiguas/faltantes, coherencia con pliegos y riesgos.
-
-            Datos (JSON): {resumen_insumos}
-            Ganador propuesto: {win.get('oferente') if win else 'N/D'} con total {win.get('total') if win else 'N/D'}.
-
-            Debes incluir al final (en un párrafo breve) recomendaciones para fortalecer el contrato ganador si aplica. Evita opiniones sin sustento y mantén el texto en 3-4 párrafos.
-            """
-            resp = client.chat.completions.create(
-                model=MODEL_JUST,
-                messages=[
-                    {"role":"system","content":"Eres un asesor experto en contratación pública. Redactas claro y breves párrafos."},
-                    {"role":"user","content": prompt}
-                ],
-                temperature=0.3,
-            )
-            return resp.choices[0].message.content.strip()
-        except Exception as e:
-            if win:
-                return (
-                    f"Se recomienda el contrato '{win.get('oferente')}' por presentar el mejor equilibrio entre cumplimiento legal, solidez técnica y propuesta económica, de acuerdo con los puntajes ponderados. "
-                    f"Frente a las alternativas, registra menos riesgos críticos (rojas: {win.get('rojas')}, amarillas: {win.get('amarillas')}) y una mejor alineación con los requisitos del pliego.\n\n"
-                    "En el aspecto legal, cumple con las exigencias de garantías, multas y plazos de forma más clara y consistente. En lo técnico, la definición de materiales, procesos y tiempos es más completa y compatible con los objetivos del proyecto. En lo económico, la estructura de precios y pagos es competitiva y viable.\n\n"
-                    "Como mejora, se recomienda precisar cláusulas susceptibles de ambigüedad y reforzar hitos de control y evidencias técnicas para mitigar riesgos residuales."
-                )
-            return "No fue posible generar una justificación automática."
-
-    just_text = generate_justification(
-        filas,
-        ganador,
-        objeto=objeto,
-        pesos=pesos if 'pesos' in locals() else None,
-        num_docs=len(results)
-    )
 
-    return {"results": results, "summary": summary, "justificacion_agente": just_text}
+def run_analysis_for_lic(lic_id: str, objeto: str, force: bool = False) -> Dict[str, Any]:
+    lic = _get_licitacion(_load_db(), lic_id) or {}
+    trace = tracing.start_trace()
+    run_budget = budget.start(lic.get("presupuesto_tokens"))
+    try:
+        result = _run_analysis_for_lic(lic_id, objeto, force)
+    finally:
+        uso = budget.finish(run_budget)
+        timings = tracing.finish_trace(trace)
+    result["timings"] = timings
+    result["uso_tokens"] = uso
+    return result
+
+
+def _run_analysis_for_lic(lic_id: str, objeto: str, force: bool) -> Dict[str, Any]:
+    folder = os.path.join(DOCS_DIR, lic_id)
+    pdfs = glob.glob(os.path.join(folder, "**/*.pdf"), recursive=True)
+    if not pdfs:
+        raise HTTPException(status_code=400, detail="No hay PDFs para esta licitación")
+
+    # Separar pliego vs propuestas desde DB si existe metadata; fallback por nombre
+    db = _load_db()
+    lic = _get_licitacion(db, lic_id)
+    lic_docs = lic.get("docs", []) if lic else []
+    doc_meta = _lic_doc_meta(lic, lic_id)
+    doc_hashes = {os.path.join(folder, d.get("file")): d.get("sha256") for d in lic_docs if d.get("sha256")}
+    pliegos = []
+    propuestas = []
+    for path in pdfs:
+        (pliegos if _doc_kind(path, doc_meta) == "pliego" else propuestas).append(path)
+    if not propuestas:
+        propuestas = [p for p in pdfs if p not in pliegos]
+
+    # Solo se recalculan las propuestas cuyos insumos cambiaron
+    presupuesto = (lic or {}).get("presupuesto")
+    fingerprint = _pipeline_fingerprint(objeto, presupuesto)
+    pliego_set_hash = analysis_cache.hash_parts(sorted(_doc_hash(p, doc_hashes) for p in pliegos))
+    base_ctx = None
+    results = []
+    pendientes = []
+    for path in propuestas:
+        # El modo de lectura forma parte de la clave: un análisis de respaldo (propuesta aún
+        # sin indexar) no se reutiliza cuando ya está disponible la recuperación dirigida
+        mode = _retrieval_mode(lic_id, path)
+        key = analysis_cache.make_key(_doc_hash(path, doc_hashes), pliego_set_hash,
+                                      analysis_cache.hash_parts([fingerprint, mode]))
+        report = None if force else analysis_cache.load(key)
+        tracing.record_cache("analisis_documento", report is not None)
+        if report is None:
+            if base_ctx is None:
+                base_ctx = _build_pliego_context(pliegos)
+            with tracing.span("analisis_propuesta"):
+                validations, pairs, used = _validate_proposal(path, base_ctx, objeto, lic_id, presupuesto, mode)
+            # Si la recuperación dirigida falló a último momento, el resultado no corresponde a la clave
+            pendientes.append((len(results), key if used == mode else None, validations, pairs))
+        results.append({
+            "file": os.path.basename(path),
+            "path": path,
+            "report": report
+        })
+
+    # Validación RUC de todas las propuestas recalculadas en un solo lote
+    # (una consulta SRI por RUC y a lo sumo una llamada al LLM por licitación)
+    all_pairs = [p for _, _, _, pairs in pendientes for p in pairs]
+    ruc_reports = validator_ruc.run_many(all_pairs) if all_pairs else []
+    offset = 0
+    for idx, key, validations, pairs in pendientes:
+        report = aggregator.aggregate(*validations, ruc_reports[offset:offset + len(pairs)])
+        offset += len(pairs)
+        results[idx]["report"] = report
+        if key and _cacheable(report):
+            analysis_cache.save(key, report)
+    recalculados = len(pendientes)
+
+    # Casi duplicados: dependen de las demás propuestas indexadas, no se guardan en el caché
+    for r in results:
+        r["report"] = aggregator.with_near_duplicates(r["report"], _near_duplicates(r["path"], lic_id))
+
+    # Resumen global para la licitación (MVP)
+    total_rojas = sum(1 for r in results for i in r["report"]["issues"] if str(i.get("severity", "")).upper() in ("ALTO","ROJO"))
+    total_amarillas = sum(1 for r in results for i in r["report"]["issues"] if str(i.get("severity", "")).upper() in ("MEDIO","AMARILLO"))
+
+    summary = {"rojas": int(total_rojas), "amarillas": int(total_amarillas)}
+
+    # La justificación se genera en segundo plano (ver JUST_QUEUE); aquí solo se fija su versión
+    filas, ganador, pesos = _compare_rows(results, lic)
+    just_version = _justification_version(filas, ganador, objeto, pesos, len(results))
+
+    return {
+        "results": results,
+        "summary": summary,
+        "justificacion_version": just_version,
+        "incremental": {"recalculados": recalculados, "reutilizados": len(results) - recalculados},
+    }
+
+# ============ Justificación (artefacto aparte, en segundo plano) ============
+
+def _justification_path(lic_id: str) -> str:
+    return os.path.join(REPORTS_DIR, f"justificacion_{lic_id}.json")
+
+
+def _justification_version(filas: List[Dict[str, Any]], ganador: Optional[Dict[str, Any]], objeto: str,
+                           pesos: Dict[str, Any], num_docs: int) -> str:
+    # Solo lo que llega al prompt: un reanálisis con los mismos resultados reutiliza el texto
+    resumen = [
+        (f["oferente"], sorted(f["scores"].items()), f["total"], f["rojas"], f["amarillas"],
+         [(i.get("category"), i.get("severity"), i.get("recommendation") or i.get("evidence") or i.get("type"))
+          for i in (f.get("issues") or [])[:5]])
+        for f in filas
+    ]
+    return analysis_cache.hash_parts([JUST_VERSION, MODEL_JUST, objeto or "", sorted((pesos or {}).items()), num_docs,
+                                      (ganador or {}).get("oferente"), resumen])[:32]
+
+
+def _load_justification(lic_id: str, version: str) -> Optional[str]:
+    try:
+        with open(_justification_path(lic_id), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data.get("texto") if data.get("version") == version else None
+
+
+def _generate_justification_job(lic_id: str, version: str) -> str:
+    if _load_justification(lic_id, version) is not None:
+        return "reutilizada"
+    lic = _get_licitacion(_load_db(), lic_id)
+    rep_path = os.path.join(REPORTS_DIR, f"reporte_{lic_id}.json")
+    if not lic or not os.path.exists(rep_path):
+        return "sin_reporte"
+    with open(rep_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("justificacion_version") != version:
+        return "obsoleta"  # hubo otro análisis; ese programa su propia justificación
+    results = data.get("results", [])
+    filas, ganador, pesos = _compare_rows(results, lic)
+    run_budget = budget.start(None)
+    try:
+        # Sin texto genérico de respaldo: un error deja el trabajo en "error" y se reintenta más tarde
+        texto = generate_justification(filas, ganador, objeto=lic.get("objeto", ""), pesos=pesos,
+                                       num_docs=len(results), fallback=False)
+    finally:
+        uso = budget.finish(run_budget)
+    path = _justification_path(lic_id)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "texto": texto, "generado_at": datetime.utcnow().isoformat()}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    if uso.get("total"):
+        with DB_LOCK:
+            db = _load_db()
+            lic = _get_licitacion(db, lic_id)
+            if lic:
+                lic["uso_tokens"] = budget.add_usage(lic.get("uso_tokens"), uso, "justificacion")
+                _save_db(db)
+    return "generada"
+
+
+def _retry_due(job: Dict[str, Any]) -> bool:
+    # Tras un error (p. ej. caída del LLM) se reintenta al consultar de nuevo, con una espera mínima
+    try:
+        fin = datetime.fromisoformat(job.get("fin") or "")
+    except ValueError:
+        return True
+    return (datetime.utcnow() - fin).total_seconds() >= JUST_RETRY_SECONDS
+
+
+def _justification_status(lic_id: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """{"estado": "lista" | "pendiente" | "error", "texto"}; programa la generación si falta."""
+    version = report.get("justificacion_version")
+    if version is None:
+        # Reportes anteriores traen la justificación embebida
+        return {"estado": "lista", "texto": report.get("justificacion_agente")}
+    texto = _load_justification(lic_id, version)
+    if texto is not None:
+        tracing.record_cache("justificacion", True)
+        return {"estado": "lista", "texto": texto}
+    key = f"{lic_id}@{version}"
+    jobs = JUST_QUEUE.jobs_for(key)
+    if JUST_QUEUE.pending(key):
+        return {"estado": "pendiente", "texto": None}
+    failed = [j for j in jobs if j["estado"] == "error"]
+    if failed and not _retry_due(failed[-1]):
+        return {"estado": "error", "texto": None, "error": failed[-1].get("error")}
+    # Sin trabajo en curso (análisis recién terminado o servidor reiniciado)
+    tracing.record_cache("justificacion", False)
+    JUST_QUEUE.submit(_generate_justification_job, lic_id, version, key=key)
+    return {"estado": "pendiente", "texto": None}
+
 
 # ============ PDF: Resumen Ejecutivo (2 páginas) ============
 
@@ -266,7 +636,7 @@ def _wrap_text(c: canvas.Canvas, text: str, max_width: float, font_name: str = "
     return simpleSplit(text, font_name, font_size, max_width)
 
 
-def build_executive_pdf(lic: Dict[str, Any], data: Dict[str, Any], out_path: str):
+def build_executive_pdf(lic: Dict[str, Any], data: Dict[str, Any], out_path: str, generated_at: Optional[datetime] = None):
     c = canvas.Canvas(out_path, pagesize=A4)
     width, height = A4
 
@@ -280,7 +650,7 @@ def build_executive_pdf(lic: Dict[str, Any], data: Dict[str, Any], out_path: str
         ("Nombre", lic.get("nombre", "")),
         ("Objeto", lic.get("objeto", "")),
         ("Deadline", lic.get("deadline", "N/D")),
-        ("Fecha de reporte", datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')),
+        ("Fecha de reporte", (generated_at or datetime.utcnow()).strftime('%Y-%m-%d %H:%M UTC')),
     ]
     for k, v in info:
         c.setFont("Helvetica-Bold", 11)
@@ -336,6 +706,71 @@ def build_executive_pdf(lic: Dict[str, Any], data: Dict[str, Any], out_path: str
 
     c.save()
 
+
+# Un PDF por versión de reporte; el lock evita construir dos veces el mismo
+PDF_VERSION = "1"
+_pdf_locks: Dict[str, threading.Lock] = {}
+_pdf_locks_guard = threading.Lock()
+
+
+def _pdf_lock(lic_id: str) -> threading.Lock:
+    with _pdf_locks_guard:
+        return _pdf_locks.setdefault(lic_id, threading.Lock())
+
+
+def _executive_pdf_version(lic: Dict[str, Any], rep_path: str) -> str:
+    st = os.stat(rep_path)
+    parts = [PDF_VERSION, st.st_mtime_ns, st.st_size, lic.get("nombre"), lic.get("objeto"), lic.get("deadline")]
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def _ensure_executive_pdf(lic: Dict[str, Any], lic_id: str, rep_path: str, version: str) -> str:
+    pdf_path = os.path.join(REPORTS_DIR, f"resumen_{lic_id}_{version}.pdf")
+    if os.path.exists(pdf_path):
+        tracing.record_cache("resumen_pdf", True)
+        return pdf_path
+    tracing.record_cache("resumen_pdf", False)
+    with _pdf_lock(lic_id):
+        if os.path.exists(pdf_path):
+            return pdf_path
+        with open(rep_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        generated_at = datetime.utcfromtimestamp(os.path.getmtime(rep_path))
+        # Escritura atómica: nunca se sirve un PDF a medio escribir
+        tmp_path = f"{pdf_path}.{uuid.uuid4().hex}.part"
+        try:
+            with tracing.span("build_executive_pdf"):
+                build_executive_pdf(lic, data, tmp_path, generated_at=generated_at)
+            os.replace(tmp_path, pdf_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # Limpiar versiones anteriores
+        for old in glob.glob(os.path.join(REPORTS_DIR, f"resumen_{lic_id}*.pdf")):
+            if old != pdf_path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+    return pdf_path
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(mtime) <= since.timestamp()
+    return False
+
 # ============ FastAPI ============
 app = FastAPI(title="API Auditor IA Licitaciones", version="0.2.0")
 
@@ -345,12 +780,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 @app.get("/health")
 def health():
     return {"ok": True, "ts": datetime.utcnow().isoformat()}
 
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(tracing.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# ---- Mantenimiento del índice vectorial (duplicados, huérfanos, compactación) ----
+@app.post("/mantenimiento/vectores/gc")
+def gc_vectores(dry_run: bool = False):
+    lic_ids = [x["id"] for x in _load_db().get("licitaciones", [])]
+    return vector_gc.run_gc(lic_ids, dry_run=dry_run)
+
+# ---- Búsqueda entre licitaciones (índice invertido de RUC, proveedores y hallazgos) ----
+@app.get("/busqueda")
+def buscar(campo: str, valor: str, prefijo: bool = False, limit: int = 200):
+    # Ej.: /busqueda?campo=ruc&valor=1790012345001 -> licitaciones y documentos donde aparece
+    try:
+        items = search_index.lookup(campo, valor, prefijo=prefijo, limit=min(limit, 1000))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items}
+
+@app.get("/busqueda/proveedores")
+def buscar_proveedores(categoria: Optional[str] = None, tipo: Optional[str] = None,
+                       severidad: Optional[str] = None, limit: int = 50):
+    # Ej.: /busqueda/proveedores?tipo=garantia&severidad=ALTO -> proveedores con más hallazgos de ese tipo
+    filtros = [(c, v) for c, v in (("categoria", categoria), ("tipo", tipo)) if v]
+    if not filtros and not severidad:
+        raise HTTPException(status_code=400, detail="Indica categoria, tipo o severidad")
+    return {"items": search_index.suppliers(filtros, severidad=severidad, limit=min(limit, 500))}
+
+@app.post("/mantenimiento/busqueda/reconstruir")
+def reconstruir_busqueda():
+    nombres = {x["id"]: x.get("nombre") for x in _load_db().get("licitaciones", [])}
+    return search_index.rebuild(REPORTS_DIR, nombres)
+
 # ---- Modelos ----
 class Pesos(BaseModel):
     legal: int = 35
@@ -364,6 +834,7 @@ class NuevaLicitacion(BaseModel):
     pesos: Pesos = Pesos()
     normativa: List[str] = Field(default_factory=list)
     deadline: Optional[str] = None  # ISO date
+    presupuesto_tokens: Optional[int] = Field(default=None, gt=0)  # tope de tokens por corrida de análisis
 
 class LicResumen(BaseModel):
     id: str
@@ -378,7 +849,6 @@ class LicResumen(BaseModel):
 # ---- LICITACIONES CRUD BÁSICO ----
 @app.post("/licitaciones", response_model=LicResumen)
 def crear_licitacion(payload: NuevaLicitacion):
-    db = _load_db()
     lic_id = str(uuid.uuid4())
     item = {
         "id": lic_id,
@@ -388,16 +858,21 @@ def crear_licitacion(payload: NuevaLicitacion):
         "pesos": payload.pesos.dict(),
         "normativa": payload.normativa,
         "deadline": payload.deadline,
+        "presupuesto_tokens": payload.presupuesto_tokens,
+        "uso_tokens": {},
         "etapa": "Ingesta",
         "progreso": 0,
         "created_at": datetime.utcnow().isoformat(),
     }
-    db["licitaciones"].append(item)
-    _save_db(db)
+    with DB_LOCK:
+        db = _load_db()
+        db["licitaciones"].append(item)
+        _save_db(db)
 
-    # crear carpeta de documentos de la licitación
+    # crear carpeta de documentos y partición vectorial de la licitación
     lic_folder = os.path.join(DOCS_DIR, lic_id)
     os.makedirs(lic_folder, exist_ok=True)
+    get_lic_collection(lic_id)
 
     return LicResumen(
         id=lic_id,
@@ -411,13 +886,32 @@ def crear_licitacion(payload: NuevaLicitacion):
     )
 
 @app.get("/licitaciones", response_model=List[LicResumen])
-def listar_licitaciones():
-    db = _load_db()
+def listar_licitaciones(response: Response, q: Optional[str] = None, etapa: Optional[str] = None,
+                        cursor: Optional[str] = None, limit: Optional[int] = None):
+    # Paginación por cursor (id de la última licitación devuelta); el siguiente va en X-Next-Cursor
+    lics = _load_db().get("licitaciones", [])
+    if etapa:
+        lics = [x for x in lics if x.get("etapa", "Ingesta") == etapa]
+    if q:
+        terms = report_index.words(q)
+        lics = [x for x in lics if all(t in report_index.normalize(f"{x.get('nombre', '')} {x.get('objeto', '')}") for t in terms)]
+    start = 0
+    if cursor:
+        try:
+            last = report_index.decode_cursor(cursor)
+            start = next(i for i, x in enumerate(lics) if x["id"] == last) + 1
+        except (ValueError, StopIteration):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    end = len(lics) if limit is None else min(start + max(1, min(limit, report_index.MAX_PAGE)), len(lics))
+    if end < len(lics):
+        response.headers["X-Next-Cursor"] = report_index.encode_cursor("", lics[end - 1]["id"])
+    response.headers["X-Total-Count"] = str(len(lics))
     items = []
-    for x in db.get("licitaciones", []):
+    for x in lics[start:end]:
+        alertas = x.get("alertas") or {}
         items.append(LicResumen(
             id=x["id"], nombre=x["nombre"], etapa=x.get("etapa", "Ingesta"), progreso=x.get("progreso", 0),
-            rojas=0, amarillas=0, deadline=x.get("deadline"), responsables=[]
+            rojas=alertas.get("rojas", 0), amarillas=alertas.get("amarillas", 0), deadline=x.get("deadline"), responsables=[]
         ))
     return items
 
@@ -429,7 +923,128 @@ def obtener_licitacion(lic_id: str):
         raise HTTPException(status_code=404, detail="No encontrada")
     return lic
 
-# ---- Subida de documentos (AUTO-GUARDADO + AUTO-INDEXACIÓN) ----
+@app.delete("/licitaciones/{lic_id}")
+def eliminar_licitacion(lic_id: str):
+    with DB_LOCK:
+        db = _load_db()
+        if not _get_licitacion(db, lic_id):
+            raise HTTPException(status_code=404, detail="No encontrada")
+        db["licitaciones"] = [x for x in db.get("licitaciones", []) if x["id"] != lic_id]
+        _save_db(db)
+
+    # Vectores: se elimina la partición entera, sin recorrer el resto del corpus
+    drop_lic_collection(lic_id)
+    try:
+        # Chunks indexados antes de las particiones (colección compartida)
+        get_docs_collection().delete(where={"licitacion_id": lic_id})
+    except Exception as e:
+        print(f"[lic] limpieza colección compartida: {e}")
+
+    shutil.rmtree(os.path.join(DOCS_DIR, lic_id), ignore_errors=True)
+    report_index.forget(os.path.join(REPORTS_DIR, f"reporte_{lic_id}.json"))
+    search_index.remove_lic(lic_id)
+    near_dup.remove_lic(lic_id)
+    for path in ([os.path.join(REPORTS_DIR, f"reporte_{lic_id}.json"), _justification_path(lic_id)]
+                 + glob.glob(os.path.join(REPORTS_DIR, f"resumen_{lic_id}*.pdf"))):
+        if os.path.exists(path):
+            os.remove(path)
+    return {"ok": True, "id": lic_id}
+
+# ---- Subida de documentos (STREAMING + DEDUPE + INDEXACIÓN EN COLA) ----
+def _write_chunk(out, h, chunk: bytes):
+    h.update(chunk)
+    out.write(chunk)
+
+
+async def _stream_to_disk(upload: UploadFile, out_path: str):
+    """Copia el upload a disco por bloques calculando sha256 al vuelo.
+
+    Escribe sobre un archivo temporal; el llamador decide si lo conserva.
+    """
+    h = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, out_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            await run_in_threadpool(_write_chunk, out, h, chunk)
+            size += len(chunk)
+    finally:
+        await run_in_threadpool(out.close)
+    return h.hexdigest(), size
+
+
+def _find_stored_by_hash(db: Dict[str, Any], sha: str) -> Optional[Dict[str, Any]]:
+    for lic in db.get("licitaciones", []):
+        for d in lic.get("docs", []) or []:
+            if d.get("sha256") == sha and d.get("path") and os.path.exists(d["path"]):
+                return {"lic_id": lic["id"], **d}
+    return None
+
+
+def _link_or_keep(src: str, tmp_path: str, out_path: str):
+    # Mismo contenido ya almacenado en otra licitación: hardlink en lugar de otra copia
+    try:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        os.link(src, out_path)
+        os.remove(tmp_path)
+    except OSError:
+        os.replace(tmp_path, out_path)
+
+
+def _remove_parts(streamed: List[tuple]):
+    for _, tmp_path, _, _ in streamed:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _register_uploads(lic_id: str, folder: str, streamed: List[tuple], doc_type: str):
+    """Mueve los temporales a su destino y registra los documentos en la DB.
+
+    Corre en el threadpool: relee la DB bajo DB_LOCK para no pisar escrituras
+    hechas mientras se recibían los archivos.
+    """
+    saved = []
+    duplicados = []
+    with DB_LOCK:
+        db = _load_db()
+        lic = _get_licitacion(db, lic_id)
+        if not lic:
+            _remove_parts(streamed)
+            raise HTTPException(status_code=404, detail="Licitación no encontrada")
+        lic_docs = lic.setdefault("docs", [])
+        for filename, tmp_path, sha, size in streamed:
+            out_path = os.path.join(folder, filename)
+            # Duplicado exacto dentro de la misma licitación: no se guarda ni se reindexa
+            same = next((d for d in lic_docs if d.get("sha256") == sha), None)
+            if same:
+                os.remove(tmp_path)
+                duplicados.append({"file": filename, "duplicado_de": same.get("file"), "sha256": sha})
+                continue
+
+            stored = _find_stored_by_hash(db, sha)
+            if stored:
+                _link_or_keep(stored["path"], tmp_path, out_path)
+            else:
+                os.replace(tmp_path, out_path)
+            saved.append(out_path)
+
+            # Mismo nombre con contenido nuevo: reemplaza la entrada previa
+            lic_docs[:] = [d for d in lic_docs if d.get("file") != filename]
+            lic_docs.append({
+                "file": filename,
+                "path": out_path,
+                "type": doc_type,
+                "size": size,
+                "sha256": sha,
+            })
+        _save_db(db)
+    return saved, duplicados
+
+
 @app.post("/licitaciones/{lic_id}/documentos")
 async def subir_documentos(
     lic_id: str,
@@ -437,39 +1052,51 @@ async def subir_documentos(
     auto_index: bool = True,
     tipo: Optional[str] = Form(None),
 ):
-    db = _load_db()
-    lic = _get_licitacion(db, lic_id)
-    if not lic:
+    if not _get_licitacion(await run_in_threadpool(_load_db), lic_id):
         raise HTTPException(status_code=404, detail="Licitación no encontrada")
 
     folder = os.path.join(DOCS_DIR, lic_id)
-    os.makedirs(folder, exist_ok=True)
+    await run_in_threadpool(os.makedirs, folder, exist_ok=True)
 
-    saved = []
-    lic_docs = lic.setdefault("docs", [])
     for f in files:
-        if not f.filename.lower().endswith(".pdf"):
+        if not (f.filename or "").lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Solo PDFs por ahora")
-        out_path = os.path.join(folder, f.filename)
-        with open(out_path, "wb") as out:
-            shutil.copyfileobj(f.file, out)
-        saved.append(out_path)
-        doc_type = (tipo or "propuesta").lower()
-        if doc_type not in ("pliego", "propuesta"):
-            doc_type = "propuesta"
-        lic_docs.append({
-            "file": f.filename,
-            "path": out_path,
-            "type": doc_type,
-            "size": os.path.getsize(out_path)
-        })
-    _save_db(db)
 
-    # AUTO-INDEXACIÓN inmediata a colección contratos
-    if auto_index:
-        index_folder_to_contratos(folder, lic_id)
+    doc_type = (tipo or "propuesta").lower()
+    if doc_type not in ("pliego", "propuesta"):
+        doc_type = "propuesta"
+    # Primero se copian todos los uploads a temporales; la DB se toca recién al final
+    streamed = []
+    try:
+        for f in files:
+            filename = os.path.basename(f.filename)
+            tmp_path = os.path.join(folder, filename) + f".{uuid.uuid4().hex}.part"
+            streamed.append((filename, tmp_path, None, 0))
+            sha, size = await _stream_to_disk(f, tmp_path)
+            streamed[-1] = (filename, tmp_path, sha, size)
+    except Exception:
+        await run_in_threadpool(_remove_parts, streamed)
+        raise
+    saved, duplicados = await run_in_threadpool(_register_uploads, lic_id, folder, streamed, doc_type)
+
+    # AUTO-INDEXACIÓN en segundo plano (solo archivos nuevos)
+    job_id = None
+    if auto_index and saved:
+        job_id = INDEX_QUEUE.submit(index_files_to_contratos, list(saved), lic_id, key=lic_id)
 
-    return {"ok": True, "saved": saved, "indexed": bool(auto_index)}
+    return {
+        "ok": True,
+        "saved": saved,
+        "duplicados": duplicados,
+        "indexed": bool(auto_index and saved),
+        "index_job": job_id,
+    }
+
+# ---- Estado de la indexación en segundo plano ----
+@app.get("/licitaciones/{lic_id}/indexacion")
+def estado_indexacion(lic_id: str):
+    items = INDEX_QUEUE.jobs_for(lic_id)
+    return {"pendientes": INDEX_QUEUE.pending(lic_id), "items": items}
 
 # ---- Listar documentos de la licitación ----
 @app.get("/licitaciones/{lic_id}/documentos")
@@ -498,27 +1125,45 @@ def indexar_licitacion(lic_id: str):
 
 # ---- Análisis orquestado ----
 @app.post("/licitaciones/{lic_id}/analizar")
-def analizar_licitacion(lic_id: str):
+def analizar_licitacion(lic_id: str, force: bool = False):
     db = _load_db()
     lic = _get_licitacion(db, lic_id)
     if not lic:
         raise HTTPException(status_code=404, detail="Licitación no encontrada")
 
-    result = run_analysis_for_lic(lic_id, objeto=lic.get("objeto", ""))
+    result = run_analysis_for_lic(lic_id, objeto=lic.get("objeto", ""), force=force)
 
     # Persistir reporte
     rep_path = os.path.join(REPORTS_DIR, f"reporte_{lic_id}.json")
-    with open(rep_path, "w", encoding="utf-8") as f:
+    tmp_path = f"{rep_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, rep_path)
+    # Índice de hallazgos para filtros y paginación (ver /hallazgos)
+    report_index.write_index(rep_path, result)
+    # Índice entre licitaciones (RUC, proveedores, hallazgos): solo se reemplazan los postings de esta
+    try:
+        search_index.update_report(lic_id, result, lic.get("nombre"))
+    except Exception as e:
+        print(f"[busqueda] no se pudo indexar {lic_id}: {e}")
 
-    # Actualizar estado básico
-    lic["etapa"] = "Análisis"
-    lic["progreso"] = 100
-    db_ts = datetime.utcnow().isoformat()
-    lic["last_analysis_at"] = db_ts
-    _save_db(db)
+    # La justificación se genera en segundo plano; /resumen la entrega cuando está lista
+    just = _justification_status(lic_id, result)
+
+    # Actualizar estado básico (la DB se relee: el análisis puede haber tardado)
+    with DB_LOCK:
+        db = _load_db()
+        lic = _get_licitacion(db, lic_id)
+        if lic:  # pudo eliminarse mientras se analizaba
+            lic["etapa"] = "Análisis"
+            lic["progreso"] = 100
+            lic["alertas"] = result.get("summary", {})
+            lic["last_analysis_at"] = datetime.utcnow().isoformat()
+            lic["uso_tokens"] = budget.add_usage(lic.get("uso_tokens"), result.get("uso_tokens", {}), "analisis")
+            _save_db(db)
 
-    return {"ok": True, "report_path": rep_path, **result}
+    return {"ok": True, "report_path": rep_path, **result,
+            "justificacion_agente": just["texto"], "justificacion_estado": just["estado"]}
 
 # ---- Endpoints para vistas específicas de tu UI ----
 @app.get("/licitaciones/{lic_id}/resumen")
@@ -530,24 +1175,24 @@ def resumen_licitacion(lic_id: str):
         data = json.load(f)
     rojas = data["summary"].get("rojas", 0)
     amarillas = data["summary"].get("amarillas", 0)
-    just = data.get("justificacion_agente")
-    return {"progreso": 100, "rojas": rojas, "amarillas": amarillas, "justificacion_agente": just}
+    just = _justification_status(lic_id, data)
+    return {"progreso": 100, "rojas": rojas, "amarillas": amarillas,
+            "justificacion_agente": just["texto"], "justificacion_estado": just["estado"]}
 
 @app.get("/licitaciones/{lic_id}/hallazgos")
-def hallazgos_licitacion(lic_id: str):
+def hallazgos_licitacion(lic_id: str, severity: Optional[str] = None, category: Optional[str] = None,
+                         documento: Optional[str] = None, q: Optional[str] = None,
+                         cursor: Optional[str] = None, limit: Optional[int] = None):
+    # Filtros con valores separados por coma; sin `limit` se devuelven todos (compatibilidad)
     rep_path = os.path.join(REPORTS_DIR, f"reporte_{lic_id}.json")
     if not os.path.exists(rep_path):
         raise HTTPException(status_code=404, detail="Aún no hay reporte. Ejecuta /analizar")
-    with open(rep_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    rows = []
-    for r in data["results"]:
-        doc = r["file"]
-        for it in r["report"].get("issues", []) or []:
-            it_copy = dict(it)
-            it_copy["documento"] = doc
-            rows.append(it_copy)
-    return {"items": rows}
+    idx = report_index.load_index(rep_path)
+    try:
+        return report_index.query(idx, severity=severity, category=category, documento=documento,
+                                  q=q, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/licitaciones/{lic_id}/validaciones/ruc")
 def validaciones_ruc(lic_id: str):
@@ -675,8 +1320,14 @@ def _format_rows(rows: List[Dict[str, Any]], ganador: Optional[Dict[str, Any]])
 def _retrieve_context(lic_id: str, user_question: str, k: int = 6) -> List[str]:
     chunks: List[str] = []
     try:
-        col = get_docs_collection()
-        q = col.query(query_texts=[user_question], n_results=k, where={"licitacion_id": lic_id})
+        col = get_lic_collection(lic_id)
+        qemb = _embed_batch([user_question])
+        with tracing.span("vector_query"):
+            if col.count() > 0:
+                q = col.query(query_embeddings=qemb, n_results=k)
+            else:
+                # Licitaciones indexadas antes de las particiones
+                q = get_docs_collection().query(query_embeddings=qemb, n_results=k, where={"licitacion_id": lic_id})
         docs = q.get("documents") if isinstance(q, dict) else getattr(q, "documents", None)
         if docs:
             for d in (docs[0] if isinstance(docs[0], list) else docs):
@@ -768,6 +1419,7 @@ def chat_licitacion(lic_id: str, payload: ChatRequest):
     # Construir contexto enriquecido
     ctx = build_chat_context(lic_id, payload.message)
 
+    chat_budget = budget.start(None)
     try:
         messages = [
             {"role": "system", "content": CHAT_SYSTEM_PROMPT},
@@ -776,11 +1428,13 @@ def chat_licitacion(lic_id: str, payload: ChatRequest):
                 f"CONTEXTO UNIFICADO:\n{ctx['text']}"
             )},
         ]
-        resp = client.chat.completions.create(
-            model=MODEL_JUST,
-            messages=messages,
-            temperature=0.2,
-        )
+        with tracing.span("chat"):
+            resp = client.chat.completions.create(
+                model=MODEL_JUST,
+                messages=messages,
+                temperature=0.2,
+            )
+        tracing.record_usage("chat", resp)
         answer = resp.choices[0].message.content.strip()
     except Exception as e:
         print(f"[chat] openai error: {e}")
@@ -788,13 +1442,23 @@ def chat_licitacion(lic_id: str, payload: ChatRequest):
             "No fue posible generar una respuesta completa ahora. Sin embargo, de acuerdo con el comparativo, el ganador presenta mejor equilibrio de puntajes y menor número de riesgos críticos. "
             "Revisa garantías, multas y plazos en lo legal; definición de materiales, procesos y tiempos en lo técnico; y coherencia de precios y pagos en lo económico."
         )
+    finally:
+        uso = budget.finish(chat_budget)
+
+    if uso.get("total"):
+        with DB_LOCK:
+            db = _load_db()
+            lic = _get_licitacion(db, lic_id)
+            if lic:
+                lic["uso_tokens"] = budget.add_usage(lic.get("uso_tokens"), uso, "chat")
+                _save_db(db)
 
     return {"answer": answer}
 
 # ---- Descargar PDF de Resumen Ejecutivo (2 páginas) ----
 @app.get("/licitaciones/{lic_id}/resumen-ejecutivo.pdf")
-def descargar_resumen_ejecutivo(lic_id: str):
-    db = _load_db()
+async def descargar_resumen_ejecutivo(lic_id: str, request: Request):
+    db = await run_in_threadpool(_load_db)
     lic = _get_licitacion(db, lic_id)
     if not lic:
         raise HTTPException(status_code=404, detail="Licitación no encontrada")
@@ -803,13 +1467,20 @@ def descargar_resumen_ejecutivo(lic_id: str):
     if not os.path.exists(rep_path):
         raise HTTPException(status_code=404, detail="Aún no hay reporte. Ejecuta /analizar")
 
-    with open(rep_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    pdf_path = os.path.join(REPORTS_DIR, f"resumen_{lic_id}.pdf")
-    build_executive_pdf(lic, data, pdf_path)
+    version = _executive_pdf_version(lic, rep_path)
+    mtime = os.path.getmtime(rep_path)
+    etag = f'"{version}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=headers)
 
-    return FileResponse(pdf_path, media_type="application/pdf", filename=f"resumen_{lic_id}.pdf")
+    # Construcción fuera del event loop; las descargas siguientes solo sirven el archivo
+    pdf_path = await run_in_threadpool(_ensure_executive_pdf, lic, lic_id, rep_path, version)
+    return FileResponse(pdf_path, media_type="application/pdf", filename=f"resumen_{lic_id}.pdf", headers=headers)
 
 # ============ Cómo correr ============
 # pip install fastapi uvicorn reportlab python-dotenv
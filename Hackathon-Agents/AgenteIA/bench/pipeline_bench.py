@@ -0,0 +1,464 @@
+"""Benchmark end-to-end de run_analysis_for_lic con licitaciones sintéticas.
+
+Genera pliegos y propuestas en PDF (reportlab) y ejecuta indexación + análisis
+completo contra sustitutos locales del LLM, embeddings, Chroma y el SRI con
+latencia inyectada. Reporta por etapa: tiempo de pared, CPU, llamadas y RSS pico.
+
+Ejecuta (desde AgenteIA/):
+  python -m bench.pipeline_bench --propuestas 5 --paginas 10 --out bench/baseline_pipeline.json
+  python -m bench.pipeline_bench --baseline bench/baseline_pipeline.json --tolerancia 0.25
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import re
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# Los módulos crean clientes OpenAI al importarse; aquí nunca se usan
+os.environ.setdefault("OPENAI_API_KEY", "bench-local")
+
+import numpy as np
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import cm
+from reportlab.lib.utils import simpleSplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ============ Métricas por etapa ============
+
+class StageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def measure(self, name: str):
+        w0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            dw, dc = time.perf_counter() - w0, time.thread_time() - c0
+            with self._lock:
+                st = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+                st["calls"] += 1
+                st["wall_s"] += dw
+                st["cpu_s"] += dc
+
+    def wrap(self, name: str, fn):
+        def _wrapped(*args, **kwargs):
+            with self.measure(name):
+                return fn(*args, **kwargs)
+        _wrapped.__wrapped__ = fn
+        return _wrapped
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                k: {"calls": int(v["calls"]), "wall_s": round(v["wall_s"], 4), "cpu_s": round(v["cpu_s"], 4)}
+                for k, v in sorted(self.stages.items())
+            }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB; macOS, bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ============ Licitaciones sintéticas ============
+
+VOCAB = (
+    "contratista entidad contratante obra suministro garantía fiel cumplimiento anticipo multa "
+    "plazo ejecución cronograma materiales hormigón acero procesos fiscalización recepción "
+    "provisional definitiva pago planilla reajuste precios presupuesto referencial oferta "
+    "especificaciones técnicas personal equipo mínimo experiencia seguros riesgo terminación"
+).split()
+
+CLAUSULAS = [
+    "CLÁUSULA {n}.- GARANTÍAS: El contratista rendirá una garantía de fiel cumplimiento del {p}% del monto del contrato.",
+    "CLÁUSULA {n}.- MULTAS: Por cada día de retraso se aplicará una multa del {m} por mil del valor del contrato.",
+    "CLÁUSULA {n}.- PLAZO: El plazo de ejecución es de {d} días calendario contados desde la entrega del anticipo.",
+    "CLÁUSULA {n}.- FORMA DE PAGO: Anticipo del {a}% y el saldo contra planillas mensuales por un total de ${monto}.",
+]
+
+
+def _ruc_natural(seed: int) -> str:
+    # Cédula con dígito verificador módulo 10 + establecimiento 001
+    rnd = random.Random(seed)
+    base = [1, 7, rnd.randint(0, 5)] + [rnd.randint(0, 9) for _ in range(6)]
+    total = 0
+    for i, d in enumerate(base):
+        v = d * (2 if i % 2 == 0 else 1)
+        total += v - 9 if v > 9 else v
+    check = (10 - total % 10) % 10
+    return "".join(map(str, base)) + str(check) + "001"
+
+
+def _synthetic_text(rnd: random.Random, pages: int, words_per_page: int, kind: str, seed: int) -> List[str]:
+    out = []
+    clause_n = 1
+    for p in range(pages):
+        words = [rnd.choice(VOCAB) for _ in range(words_per_page)]
+        paras = [" ".join(words[i:i + 60]).capitalize() + "." for i in range(0, len(words), 60)]
+        tpl = CLAUSULAS[p % len(CLAUSULAS)]
+        paras.insert(0, tpl.format(
+            n=clause_n, p=rnd.choice([5, 10]), m=rnd.choice([1, 2]), d=rnd.choice([90, 120, 180]),
+            a=rnd.choice([30, 50, 70]), monto=f"{rnd.randint(100_000, 9_000_000):,}".replace(",", ".") + ",00",
+        ))
+        clause_n += 1
+        if p == 0:
+            head = "PLIEGO DE CONTRATACIÓN PÚBLICA" if kind == "pliego" else f"PROPUESTA OFERENTE RUC {_ruc_natural(seed)}"
+            paras.insert(0, head)
+        out.append("\n".join(paras))
+    return out
+
+
+def write_pdf(path: str, pages_text: List[str]):
+    c = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    for text in pages_text:
+        y = height - 2 * cm
+        c.setFont("Helvetica", 9)
+        for para in text.split("\n"):
+            for ln in simpleSplit(para, "Helvetica", 9, width - 4 * cm):
+                if y < 2 * cm:
+                    break
+                c.drawString(2 * cm, y, ln)
+                y -= 0.42 * cm
+        c.showPage()
+    c.save()
+
+
+def generate_tender(folder: str, n_pliegos: int, n_props: int, pages: int, words_per_page: int, seed: int = 7) -> Dict[str, List[str]]:
+    rnd = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    out = {"pliegos": [], "propuestas": []}
+    for i in range(n_pliegos):
+        path = os.path.join(folder, f"pliego_{i + 1}.pdf")
+        write_pdf(path, _synthetic_text(rnd, pages, words_per_page, "pliego", seed + i))
+        out["pliegos"].append(path)
+    for i in range(n_props):
+        path = os.path.join(folder, f"propuesta_{i + 1}.pdf")
+        write_pdf(path, _synthetic_text(rnd, pages, words_per_page, "propuesta", seed + 1000 + i))
+        out["propuestas"].append(path)
+    return out
+
+
+# ============ Sustitutos locales (LLM, embeddings, Chroma, SRI) ============
+
+def _obj(**kw):
+    return types.SimpleNamespace(**kw)
+
+
+class FakeOpenAI:
+    def __init__(self, stats: StageStats, llm_latency: float, emb_latency: float, dim: int):
+        self.stats = stats
+        self.llm_latency = llm_latency
+        self.emb_latency = emb_latency
+        self.dim = dim
+        self.chat = _obj(completions=_obj(create=stats.wrap("llm.chat", self._chat)))
+        self.embeddings = _obj(create=stats.wrap("llm.embeddings", self._embed))
+
+    def _chat(self, model: str = "", messages=None, response_format=None, **kwargs):
+        time.sleep(self.llm_latency)
+        prompt = " ".join(m.get("content", "") for m in (messages or []))
+        if '"resultados"' in prompt:
+            casos = re.findall(r"^\s*(\d+)\. Actividad:", prompt, re.M)
+            content = json.dumps({"resultados": [
+                {"id": int(i), "related": True, "confidence": 80, "reasoning": "bench"} for i in casos
+            ]})
+        elif "actividad económica" in prompt.lower():
+            content = json.dumps({"related": True, "confidence": 80, "reasoning": "bench"})
+        elif response_format or "JSON" in prompt:
+            h = zlib.crc32(prompt.encode("utf-8"))
+            content = json.dumps({
+                "issues": [{"type": "bench", "where": "N/D", "evidence": "sintético", "severity": "MEDIO", "recommendation": "Revisar"}],
+                "score": 50 + h % 50,
+            })
+        else:
+            content = "Justificación sintética de benchmark."
+        usage = _obj(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4, total_tokens=(len(prompt) + len(content)) // 4)
+        return _obj(choices=[_obj(message=_obj(content=content))], usage=usage)
+
+    def _vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(zlib.crc32((text or "").encode("utf-8")))
+        v = rng.standard_normal(self.dim).astype(np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def _embed(self, model: str = "", input=None, **kwargs):
+        texts = input if isinstance(input, list) else [input]
+        time.sleep(self.emb_latency)
+        n_tok = sum(len(t or "") for t in texts) // 4
+        return _obj(data=[_obj(embedding=self._vector(t)) for t in texts], usage=_obj(prompt_tokens=n_tok, total_tokens=n_tok))
+
+
+class FakeCollection:
+    """Colección en memoria con la API mínima de Chroma usada por el proyecto."""
+
+    def __init__(self, stats: StageStats, name: str, latency: float):
+        self.stats = stats
+        self.name = name
+        self.latency = latency
+        self.ids: List[str] = []
+        self.docs: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.embs: List[List[float]] = []
+        self._mat: Optional[np.ndarray] = None
+        self.add = stats.wrap(f"vector.{name}.add", self._add)
+        self.query = stats.wrap(f"vector.{name}.query", self._query)
+
+    def _add(self, ids, documents, embeddings, metadatas, **kwargs):
+        self.ids += list(ids)
+        self.docs += list(documents)
+        self.metas += list(metadatas)
+        self.embs += list(embeddings)
+        self._mat = None
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=None, **kwargs):
+        idx = [i for i, (id_, m) in enumerate(zip(self.ids, self.metas))
+               if (ids is None or id_ in ids) and (not where or all(m.get(k) == v for k, v in where.items()))]
+        idx = idx[offset:offset + limit] if limit is not None else idx[offset:]
+        return {"ids": [self.ids[i] for i in idx], "documents": [self.docs[i] for i in idx],
+                "metadatas": [self.metas[i] for i in idx]}
+
+    def delete(self, ids=None, where=None, **kwargs):
+        keep = [i for i, (id_, m) in enumerate(zip(self.ids, self.metas))
+                if not ((ids is None or id_ in ids) and (not where or all(m.get(k) == v for k, v in where.items())))]
+        self.ids = [self.ids[i] for i in keep]
+        self.docs = [self.docs[i] for i in keep]
+        self.metas = [self.metas[i] for i in keep]
+        self.embs = [self.embs[i] for i in keep]
+        self._mat = None
+
+    def _query(self, query_embeddings=None, query_texts=None, n_results=6, where=None, include=None, **kwargs):
+        time.sleep(self.latency)
+        if query_embeddings is None or not self.embs:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        if self._mat is None:
+            self._mat = np.asarray(self.embs, dtype=np.float32)
+        idx = [i for i, m in enumerate(self.metas) if not where or all(m.get(k) == v for k, v in where.items())]
+        if not idx:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        mat = self._mat if len(idx) == len(self.ids) else self._mat[idx]
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            sims = mat @ np.asarray(q, dtype=np.float32)
+            top = np.argsort(-sims)[:n_results]
+            out["ids"].append([self.ids[idx[j]] for j in top])
+            out["documents"].append([self.docs[idx[j]] for j in top])
+            out["metadatas"].append([self.metas[idx[j]] for j in top])
+            out["distances"].append([float(1 - sims[j]) for j in top])
+        return out
+
+
+def fake_sri_factory(stats: StageStats, latency: float):
+    def call_sri(ruc: str, max_retries=3):
+        time.sleep(latency)
+        return {
+            "numeroRuc": ruc,
+            "razonSocial": f"CONSTRUCTORA {ruc[-6:]} S.A.",
+            "actividadEconomicaPrincipal": "CONSTRUCCION DE OBRAS CIVILES Y EDIFICIOS",
+            "estadoContribuyenteRuc": "ACTIVO",
+        }
+    return stats.wrap("sri.call", call_sri)
+
+
+# ============ Ejecución ============
+
+def _install_standins(A, stats: StageStats, args, workdir: str) -> Dict[str, FakeCollection]:
+    """Sustituye clientes externos e instrumenta las etapas del pipeline."""
+    from agents import rag_legal, validator_legal, validator_tech, validator_econ, validator_incons, validator_ruc, justificador, aggregator
+    import rag.retrieve as retrieve
+    import utils.chunk as chunk_mod
+    import utils.pdf_text as pdf_text_mod
+    from utils import analysis_cache
+    from rag import near_dup
+
+    fake = FakeOpenAI(stats, args.latencia_llm, args.latencia_emb, args.dim)
+    cols = {
+        "base_legal": FakeCollection(stats, "base_legal", args.latencia_vector),
+        "contratos": FakeCollection(stats, "contratos", args.latencia_vector),
+    }
+    for mod in (A, retrieve, validator_legal, validator_tech, validator_econ, validator_incons, validator_ruc):
+        mod.client = fake
+    justificador.OpenAI = lambda *a, **k: fake
+
+    retrieve.get_collection = lambda *a, **k: cols["base_legal"]
+    A.get_docs_collection = lambda *a, **k: cols["contratos"]
+    A.get_lic_collection = lambda *a, **k: cols["contratos"]
+    validator_ruc.call_sri = fake_sri_factory(stats, args.latencia_sri)
+
+    # Etapas instrumentadas (las llamadas se resuelven por atributo de módulo)
+    A.pdf_to_text = stats.wrap("extraccion.pdf_to_text", A.pdf_to_text)
+    A.open_document = stats.wrap("extraccion.open_document", A.open_document)
+    pdf_text_mod.LazyPdfDocument.excerpt = stats.wrap("extraccion.pdf_excerpt", pdf_text_mod.LazyPdfDocument.excerpt)
+    chunk_mod.chunk_text = stats.wrap("chunking", chunk_mod.chunk_text)
+    rag_legal.retrieve_context = stats.wrap("retrieval.legal", rag_legal.retrieve_context)
+    rag_legal.retrieve_contexts = stats.wrap("retrieval.legal", rag_legal.retrieve_contexts)
+    rag_legal.run_topics = stats.wrap("retrieval.topics", rag_legal.run_topics)
+    for name, mod in (("legal", validator_legal), ("tecnico", validator_tech), ("economico", validator_econ), ("inconsistencias", validator_incons)):
+        mod.run = stats.wrap(f"validador.{name}", mod.run)
+    validator_ruc.run = stats.wrap("validador.ruc", validator_ruc.run)
+    validator_ruc.run_many = stats.wrap("validador.ruc", validator_ruc.run_many)
+    aggregator.aggregate = stats.wrap("agregacion", aggregator.aggregate)
+    A.extract_rucs = stats.wrap("extraccion.rucs", A.extract_rucs)
+    A.generate_justification = stats.wrap("justificacion", A.generate_justification)
+
+    # Todo el estado en disco vive en el directorio temporal
+    A.DOCS_DIR = os.path.join(workdir, "docs")
+    A.REPORTS_DIR = os.path.join(workdir, "reports")
+    A.DB_PATH = os.path.join(workdir, "licitaciones.json")
+    analysis_cache.CACHE_DIR = os.path.join(workdir, "cache")
+    near_dup.MINHASH_PATH = os.path.join(workdir, "minhash.sqlite3")
+    os.makedirs(A.REPORTS_DIR, exist_ok=True)
+    return cols
+
+
+def _seed_legal_corpus(cols: Dict[str, FakeCollection], fake_embed, n_chunks: int, seed: int):
+    rnd = random.Random(seed)
+    docs = [" ".join(rnd.choice(VOCAB) for _ in range(200)) for _ in range(n_chunks)]
+    embs = [d.embedding for d in fake_embed(input=docs).data]
+    cols["base_legal"].add(
+        ids=[f"legal-{i}" for i in range(n_chunks)], documents=docs, embeddings=embs,
+        metadatas=[{"source": f"ley_{i % 4}.pdf", "path": f"ley_{i % 4}.pdf", "type": "legal"} for i in range(n_chunks)],
+    )
+
+
+def run_bench(args) -> Dict[str, Any]:
+    import app as A
+
+    workdir = tempfile.mkdtemp(prefix="bench_agenteia_")
+    try:
+        stats = StageStats()
+        cols = _install_standins(A, stats, args, workdir)
+        _seed_legal_corpus(cols, A.client.embeddings.create.__wrapped__, args.chunks_legales, args.seed)
+
+        lic_id = "bench-licitacion"
+        folder = os.path.join(A.DOCS_DIR, lic_id)
+        t0 = time.perf_counter()
+        docs = generate_tender(folder, args.pliegos, args.propuestas, args.paginas, args.palabras, args.seed)
+        gen_s = time.perf_counter() - t0
+        A._save_db({"licitaciones": [{
+            "id": lic_id, "nombre": "Benchmark", "objeto": "Construcción de obras civiles",
+            "pesos": {"legal": 35, "tecnico": 40, "economico": 25},
+            "docs": [{"file": os.path.basename(p), "path": p, "type": "pliego"} for p in docs["pliegos"]]
+                    + [{"file": os.path.basename(p), "path": p, "type": "propuesta"} for p in docs["propuestas"]],
+        }]})
+
+        runs: Dict[str, Any] = {}
+        phases = [("indexacion", lambda: A.index_folder_to_contratos(folder, lic_id)),
+                  ("analisis_frio", lambda: A.run_analysis_for_lic(lic_id, "Construcción de obras civiles"))]
+        if args.repetir:
+            phases.append(("analisis_caliente", lambda: A.run_analysis_for_lic(lic_id, "Construcción de obras civiles")))
+        for phase, fn in phases:
+            stats.stages.clear()
+            w0, c0 = time.perf_counter(), time.process_time()
+            fn()
+            runs[phase] = {
+                "wall_s": round(time.perf_counter() - w0, 4),
+                "cpu_s": round(time.process_time() - c0, 4),
+                "peak_rss_mb": _peak_rss_mb(),
+                "stages": stats.snapshot(),
+            }
+
+        return {
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "tolerancia")},
+            "entorno": {"python": platform.python_version(), "plataforma": platform.platform()},
+            "generacion_pdf_s": round(gen_s, 4),
+            "bytes_pdf": sum(os.path.getsize(p) for ps in docs.values() for p in ps),
+            "corridas": runs,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_s: float = 0.01) -> List[str]:
+    """Lista de regresiones de tiempo de pared (total y por etapa) frente al baseline."""
+    regs = []
+    for phase, cur in result.get("corridas", {}).items():
+        base = baseline.get("corridas", {}).get(phase)
+        if not base:
+            continue
+        pairs = [(f"{phase}", cur["wall_s"], base["wall_s"])]
+        for st, v in cur.get("stages", {}).items():
+            b = base.get("stages", {}).get(st)
+            if b:
+                pairs.append((f"{phase}/{st}", v["wall_s"], b["wall_s"]))
+                if v["calls"] != b["calls"]:
+                    regs.append(f"{phase}/{st}: llamadas {b['calls']} -> {v['calls']}")
+        for name, now, before in pairs:
+            if now > min_s and now > before * (1 + tolerance):
+                regs.append(f"{name}: {before:.3f}s -> {now:.3f}s (+{(now / max(before, 1e-9) - 1) * 100:.0f}%)")
+    return regs
+
+
+def _print_table(result: Dict[str, Any]):
+    for phase, run in result["corridas"].items():
+        print(f"\n== {phase}: pared={run['wall_s']:.3f}s cpu={run['cpu_s']:.3f}s rss_pico={run['peak_rss_mb']} MiB")
+        print(f"{'etapa':<34}{'llamadas':>9}{'pared_s':>10}{'cpu_s':>10}")
+        for st, v in run["stages"].items():
+            print(f"{st:<34}{v['calls']:>9}{v['wall_s']:>10.3f}{v['cpu_s']:>10.3f}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark end-to-end del pipeline de análisis")
+    p.add_argument("--pliegos", type=int, default=1)
+    p.add_argument("--propuestas", type=int, default=5)
+    p.add_argument("--paginas", type=int, default=10, help="Páginas por PDF")
+    p.add_argument("--palabras", type=int, default=400, help="Palabras por página")
+    p.add_argument("--chunks-legales", type=int, default=2000, help="Tamaño del corpus legal sintético")
+    p.add_argument("--dim", type=int, default=1536, help="Dimensión de embeddings")
+    p.add_argument("--latencia-llm", type=float, default=0.05, help="Segundos por llamada de chat")
+    p.add_argument("--latencia-emb", type=float, default=0.02, help="Segundos por llamada de embeddings")
+    p.add_argument("--latencia-vector", type=float, default=0.0, help="Segundos extra por consulta vectorial")
+    p.add_argument("--latencia-sri", type=float, default=0.1, help="Segundos por consulta al SRI")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--repetir", action="store_true", help="Segunda corrida para medir el análisis incremental")
+    p.add_argument("--out", help="Escribe el resultado JSON (baseline)")
+    p.add_argument("--baseline", help="Compara contra un baseline JSON previo")
+    p.add_argument("--tolerancia", type=float, default=0.2, help="Regresión máxima tolerada (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    result = run_bench(args)
+    _print_table(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado guardado en {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regs = compare(result, baseline, args.tolerancia)
+        if regs:
+            print("\nREGRESIONES:")
+            for r in regs:
+                print(f"  - {r}")
+            return 1
+        print("\nSin regresiones frente al baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+"""Benchmark de backends vectoriales: recall@k y latencia de consulta.
+
+Genera un corpus sintético agrupado (parecido a chunks de una misma norma) y
+consultas cercanas a documentos del corpus. La varianza decae con el índice de
+la componente, como en los embeddings text-embedding-3 (entrenados para que su
+prefijo sea utilizable), para que la reducción de dimensión sea representativa. La verdad de referencia es la
+búsqueda exacta por coseno en float64. Compara el backend NumPy en proceso
+(`rag/vector_store.py`), sus variantes cuantizadas (`numpy:int8`,
+`numpy:float16@512`, ...) y Chroma (si `chromadb` está instalado).
+
+Ejecuta (desde AgenteIA/):
+  python -m bench.vector_bench --n 5000 --consultas 200
+  python -m bench.vector_bench --backends numpy,numpy:int8@768 --recall-min 0.95
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Dict, Any, List, Callable
+
+import numpy as np
+
+from rag.vector_store import NumpyCollection, parse_quant
+
+ADD_BATCH = 1000
+
+
+# ============ Datos sintéticos ============
+
+def synthetic_corpus(n: int, dim: int, clusters: int, seed: int, decay: float = 256.0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    if decay:
+        x *= (1.0 / np.sqrt(1.0 + np.arange(dim) / decay)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_queries(corpus: np.ndarray, n: int, seed: int, noise: float = 0.5) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    base = corpus[rng.integers(0, len(corpus), size=n)]
+    q = base + noise * rng.standard_normal(base.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def exact_topk(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    sims = queries.astype(np.float64) @ corpus.astype(np.float64).T
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+# ============ Backends ============
+
+def _numpy_backend(workdir: str, quant: str = None):
+    return NumpyCollection("bench", path=os.path.join(workdir, "numpy"), quant=quant)
+
+
+def _chroma_backend(workdir: str):
+    import chromadb
+    from chromadb.config import Settings
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"), settings=Settings(anonymized_telemetry=False))
+    return client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+
+
+BACKENDS: Dict[str, Callable[[str], Any]] = {
+    "numpy": _numpy_backend,
+    "chroma": _chroma_backend,
+}
+
+
+def _open_backend(name: str, workdir: str):
+    # "numpy:int8@512" -> backend numpy con esa cuantización
+    base, _, quant = name.partition(":")
+    if quant:
+        parse_quant(quant)
+        return BACKENDS[base](workdir, quant)
+    return BACKENDS[base](workdir)
+
+
+def _pct(values: List[float], p: float) -> float:
+    return float(np.percentile(np.asarray(values), p)) if values else 0.0
+
+
+def bench_backend(name: str, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, batch: int, workdir: str) -> Dict[str, Any]:
+    col = _open_backend(name, workdir)
+    ids = [str(i) for i in range(len(corpus))]
+    t0 = time.perf_counter()
+    for s in range(0, len(corpus), ADD_BATCH):
+        col.add(ids=ids[s:s + ADD_BATCH], embeddings=corpus[s:s + ADD_BATCH].tolist(),
+                documents=[f"doc {i}" for i in ids[s:s + ADD_BATCH]],
+                metadatas=[{"source": f"s{int(i) % 20}"} for i in ids[s:s + ADD_BATCH]])
+    build_s = time.perf_counter() - t0
+
+    # Una consulta por llamada (como retrieve_context) ...
+    lat, hits = [], 0
+    for qi, q in enumerate(queries):
+        t = time.perf_counter()
+        res = col.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        lat.append(time.perf_counter() - t)
+        got = {int(x) for x in res["ids"][0]}
+        hits += len(got & set(truth[qi].tolist()))
+    # ... y por lotes (como run_topics)
+    t = time.perf_counter()
+    for s in range(0, len(queries), batch):
+        col.query(query_embeddings=queries[s:s + batch].tolist(), n_results=k, include=["distances"])
+    batch_s = time.perf_counter() - t
+
+    mem = col.memory_bytes() if hasattr(col, "memory_bytes") else None
+    return {
+        "construccion_s": round(build_s, 4),
+        "memoria_mb": round(mem / 2**20, 2) if mem is not None else "N/D",
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "latencia_p50_ms": round(_pct(lat, 50) * 1000, 3),
+        "latencia_p95_ms": round(_pct(lat, 95) * 1000, 3),
+        "lote_ms_por_consulta": round(batch_s / max(len(queries), 1) * 1000, 3),
+    }
+
+
+def run_bench(args) -> Dict[str, Any]:
+    corpus = synthetic_corpus(args.n, args.dim, args.clusters, args.seed, args.decaimiento)
+    queries = synthetic_queries(corpus, args.consultas, args.seed)
+    truth = exact_topk(corpus, queries, args.k)
+    result: Dict[str, Any] = {
+        "config": {"n": args.n, "dim": args.dim, "decaimiento": args.decaimiento, "consultas": args.consultas, "k": args.k, "lote": args.lote},
+        "backends": {},
+    }
+    for name in args.backends.split(","):
+        workdir = tempfile.mkdtemp(prefix=f"vector_bench_{name}_")
+        try:
+            result["backends"][name] = bench_backend(name, corpus, queries, truth, args.k, args.lote, workdir)
+        except ImportError as e:
+            result["backends"][name] = {"omitido": str(e)}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _print_table(result: Dict[str, Any]):
+    cols = ("construccion_s", "memoria_mb", "recall_at_k", "latencia_p50_ms", "latencia_p95_ms", "lote_ms_por_consulta")
+    print(f"{'backend':<20}" + "".join(f"{c:>22}" for c in cols))
+    for name, r in result["backends"].items():
+        if "omitido" in r:
+            print(f"{name:<20}  omitido: {r['omitido']}")
+            continue
+        print(f"{name:<20}" + "".join(f"{r[c]:>22}" for c in cols))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Recall y latencia de backends vectoriales")
+    p.add_argument("--n", type=int, default=5000, help="Chunks en el corpus sintético")
+    p.add_argument("--dim", type=int, default=1536, help="Dimensión de embeddings")
+    p.add_argument("--clusters", type=int, default=50)
+    p.add_argument("--decaimiento", type=float, default=256.0, help="Escala del decaimiento de varianza por componente (0 = isotrópico)")
+    p.add_argument("--consultas", type=int, default=200)
+    p.add_argument("--k", type=int, default=6)
+    p.add_argument("--lote", type=int, default=6, help="Consultas por lote (run_topics usa 6)")
+    p.add_argument("--backends", default="numpy,numpy:float16,numpy:int8,numpy:int8@768,chroma")
+    p.add_argument("--recall-min", type=float, help="Falla si algún backend queda bajo este recall@k")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--out", help="Escribe el resultado JSON")
+    args = p.parse_args(argv)
+
+    result = run_bench(args)
+    _print_table(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado guardado en {args.out}")
+    if args.recall_min is not None:
+        bajos = [n for n, r in result["backends"].items() if "recall_at_k" in r and r["recall_at_k"] < args.recall_min]
+        if bajos:
+            print(f"\nRecall bajo {args.recall_min}: {', '.join(bajos)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
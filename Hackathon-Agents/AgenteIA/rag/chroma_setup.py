@@ -1,4 +1,7 @@
 import os
+import re
+import shutil
+import threading
 try:
     import chromadb
     from chromadb.config import Settings
@@ -6,10 +9,25 @@ except Exception:  # fallback si sqlite/chromadb no disponible
     chromadb = None
     Settings = None
 
+from rag.vector_store import NumpyCollection, VECTOR_STORE_PATH
+
 CHROMA_PATH = os.environ.get("CHROMA_PATH", "./chroma_db")
 LEGAL_COLLECTION = os.environ.get("LEGAL_COLLECTION", "base_legal")
 DOCS_COLLECTION = os.environ.get("DOCS_COLLECTION", "contratos")
 
+# Backend por colección: "chroma" (HNSW persistente) o "numpy" (búsqueda exacta en proceso).
+# Ej.: VECTOR_BACKENDS="base_legal=numpy,contratos=chroma"
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+VECTOR_BACKENDS = dict(
+    item.split("=", 1) for item in os.environ.get("VECTOR_BACKENDS", "").replace(" ", "").split(",") if "=" in item
+)
+
+# Formato de búsqueda de las colecciones numpy al crearlas: int8, float16, opcionalmente @dim.
+# Ej.: VECTOR_QUANT="contratos=int8@512"
+VECTOR_QUANT = dict(
+    item.split("=", 1) for item in os.environ.get("VECTOR_QUANT", "").replace(" ", "").split(",") if "=" in item
+)
+
 client = None
 if chromadb is not None:
     try:
@@ -17,25 +35,95 @@ if chromadb is not None:
     except Exception:
         client = None
 
-def get_legal_collection():
+# Las colecciones se abren una sola vez por proceso
+_collections = {}
+_collections_lock = threading.Lock()
+
+
+class _Dummy:
+    def add(self, **kwargs):
+        pass
+    def query(self, **kwargs):
+        return {"documents": [[]], "metadatas": [[]]}
+    def delete(self, **kwargs):
+        pass
+    def count(self):
+        return 0
+
+
+def _config_name(name: str) -> str:
+    # Las particiones por licitación heredan la configuración de "contratos"
+    return DOCS_COLLECTION if name.startswith(DOCS_COLLECTION + "_") else name
+
+
+def backend_for(name: str) -> str:
+    name = _config_name(name)
+    return VECTOR_BACKENDS.get(name, VECTOR_BACKEND)
+
+
+def _open_collection(name: str):
+    if backend_for(name) == "numpy":
+        return NumpyCollection(name, quant=VECTOR_QUANT.get(_config_name(name)))
     if client is None:
-        class _Dummy:
-            def add(self, **kwargs):
-                pass
-            def query(self, **kwargs):
-                return {"documents": [[]], "metadatas": [[]]}
         return _Dummy()
-    return client.get_or_create_collection(name=LEGAL_COLLECTION, metadata={"hnsw:space": "cosine"})
+    return client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+
+
+def get_named_collection(name: str):
+    col = _collections.get(name)
+    if col is None:
+        with _collections_lock:
+            col = _collections.get(name)
+            if col is None:
+                col = _open_collection(name)
+                if not isinstance(col, _Dummy):
+                    _collections[name] = col
+    return col
+
+
+def list_collection_names():
+    """Colecciones existentes, cada una en el backend que tiene configurado."""
+    names = set()
+    if os.path.isdir(VECTOR_STORE_PATH):
+        names.update(d for d in os.listdir(VECTOR_STORE_PATH)
+                     if os.path.isdir(os.path.join(VECTOR_STORE_PATH, d)) and backend_for(d) == "numpy")
+    if client is not None:
+        for c in client.list_collections():
+            name = c if isinstance(c, str) else c.name
+            if backend_for(name) != "numpy":
+                names.add(name)
+    return sorted(names)
+
+
+# ============ Particiones de contratos por licitación ============
+
+def lic_collection_name(lic_id: str) -> str:
+    return f"{DOCS_COLLECTION}_{re.sub(r'[^A-Za-z0-9_-]', '_', lic_id)}"
+
+
+def get_lic_collection(lic_id: str):
+    """Partición de "contratos" de una licitación (se crea si no existe)."""
+    return get_named_collection(lic_collection_name(lic_id))
+
+
+def drop_lic_collection(lic_id: str):
+    """Elimina la partición completa de una licitación sin tocar las demás."""
+    name = lic_collection_name(lic_id)
+    with _collections_lock:
+        _collections.pop(name, None)
+    if backend_for(name) == "numpy":
+        shutil.rmtree(os.path.join(VECTOR_STORE_PATH, name), ignore_errors=True)
+    elif client is not None:
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass  # no existía
+
+def get_legal_collection():
+    return get_named_collection(LEGAL_COLLECTION)
 
 def get_docs_collection():
-    if client is None:
-        class _Dummy:
-            def add(self, **kwargs):
-                pass
-            def query(self, **kwargs):
-                return {"documents": [[]], "metadatas": [[]]}
-        return _Dummy()
-    return client.get_or_create_collection(name=DOCS_COLLECTION, metadata={"hnsw:space": "cosine"})
+    return get_named_collection(DOCS_COLLECTION)
 
 def get_collection(kind: str = "legal"):
     if kind == "legal":
@@ -44,4 +132,4 @@ def get_collection(kind: str = "legal"):
         return get_docs_collection()
     else:
         # por defecto, legal
-        return get_legal_collection()
\ No newline at end of file
+        return get_legal_collection()
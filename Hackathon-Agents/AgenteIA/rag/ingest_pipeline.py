@@ -0,0 +1,230 @@
+"""Ingesta en pipeline: extracción -> chunking -> lotes por tokens -> embeddings -> escritura.
+
+Las etapas se solapan: mientras un PDF se extrae, los lotes de los anteriores
+se están embebiendo (con concurrencia acotada) y escribiendo en la colección.
+Los lotes se arman por cantidad de tokens, así que un documento grande se
+reparte en varias solicitudes en lugar de fallar completo.
+
+Un manifiesto JSON registra los archivos terminados (tamaño + mtime); una
+corrida interrumpida continúa con los pendientes. Un archivo a medio escribir
+se limpia (delete por `path`) antes de volver a indexarlo.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+from utils.pdf_text import pdf_to_text
+from utils.chunk import chunk_text
+from utils import tracing
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("cl100k_base")
+except Exception:  # sin tiktoken (o sin red para bajar el vocabulario): estimación
+    _enc = None
+
+# Límites por solicitud de embeddings (la API admite 300k tokens y 2048 entradas)
+EMB_BATCH_TOKENS = int(os.environ.get("EMB_BATCH_TOKENS", "100000"))
+EMB_BATCH_INPUTS = int(os.environ.get("EMB_BATCH_INPUTS", "512"))
+EMB_CONCURRENCY = int(os.environ.get("EMB_CONCURRENCY", "4"))
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "2"))
+EMB_RETRIES = 3
+
+
+def count_tokens(text: str) -> int:
+    if _enc is not None:
+        return len(_enc.encode(text or "", disallowed_special=()))
+    return max(1, len(text or "") // 4)
+
+
+class Manifest:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("archivos", {})
+            except Exception:
+                self.files = {}
+
+    @staticmethod
+    def _stamp(path: str) -> Dict[str, int]:
+        st = os.stat(path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def is_done(self, path: str) -> bool:
+        e = self.files.get(path)
+        return bool(e and e.get("estado") == "completo" and {k: e.get(k) for k in ("size", "mtime_ns")} == self._stamp(path))
+
+    def mark(self, path: str, estado: str, **extra):
+        with self._lock:
+            self.files[path] = {**self._stamp(path), "estado": estado, **extra}
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"archivos": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+class _FileState:
+    def __init__(self, path: str, col, meta: Dict[str, Any], n_chunks: int):
+        self.path = path
+        self.col = col
+        self.meta = meta
+        self.pending = n_chunks
+        self.failed: Optional[str] = None
+
+
+def run_pipeline(
+    pdfs: List[str],
+    embed_fn: Callable[[List[str]], List[List[float]]],
+    collection_for: Callable[[str], Any],
+    meta_for: Callable[[str], Dict[str, Any]],
+    manifest_path: Optional[str] = None,
+    max_batch_tokens: int = EMB_BATCH_TOKENS,
+    max_batch_inputs: int = EMB_BATCH_INPUTS,
+    concurrency: int = EMB_CONCURRENCY,
+    extract_workers: int = EXTRACT_WORKERS,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    manifest = Manifest(manifest_path)
+    todo = [p for p in pdfs if not manifest.is_done(p)]
+    summary = {"archivos": len(pdfs), "omitidos": len(pdfs) - len(todo), "completos": 0, "errores": 0, "chunks": 0, "lotes": 0}
+    if not todo:
+        return summary
+
+    states: Dict[str, _FileState] = {}
+    states_lock = threading.Lock()
+    write_q: "queue.Queue" = queue.Queue(maxsize=concurrency * 2)
+    inflight = threading.BoundedSemaphore(concurrency)
+
+    def _count(key: str, n: int = 1):
+        with states_lock:
+            summary[key] += n
+
+    def _finish(st: _FileState):
+        if st.failed:
+            _count("errores")
+            manifest.mark(st.path, "error", error=st.failed)
+            log(f"✖ Error en {st.path}: {st.failed}")
+        else:
+            _count("completos")
+            manifest.mark(st.path, "completo")
+            log(f"✔ {os.path.basename(st.path)}")
+
+    # ---- escritura: un solo hilo, en orden de llegada ----
+    def _writer():
+        while True:
+            item = write_q.get()
+            if item is None:
+                return
+            batch, vectors, error = item
+            by_file: Dict[str, List[int]] = {}
+            for i, (path, _, _) in enumerate(batch):
+                by_file.setdefault(path, []).append(i)
+            for path, idx in by_file.items():
+                st = states[path]
+                if error and not st.failed:
+                    st.failed = error
+                if not st.failed:
+                    try:
+                        st.col.add(
+                            ids=[str(uuid.uuid4()) for _ in idx],
+                            documents=[batch[i][2] for i in idx],
+                            embeddings=[vectors[i] for i in idx],
+                            metadatas=[{**st.meta, "chunk": batch[i][1]} for i in idx],
+                        )
+                        _count("chunks", len(idx))
+                    except Exception as e:
+                        st.failed = str(e)
+                with states_lock:
+                    st.pending -= len(idx)
+                    done = st.pending == 0
+                if done:
+                    _finish(st)
+
+    # ---- embeddings: concurrencia acotada, reintentos con backoff ----
+    def _embed(batch):
+        try:
+            texts = [t for _, _, t in batch]
+            for attempt in range(EMB_RETRIES):
+                try:
+                    vectors = embed_fn(texts)
+                    write_q.put((batch, vectors, None))
+                    return
+                except Exception as e:
+                    if attempt == EMB_RETRIES - 1:
+                        write_q.put((batch, None, f"embeddings: {e}"))
+                        return
+                    tracing.record_retry("embeddings")
+                    time.sleep(2 ** attempt)
+        finally:
+            inflight.release()
+
+    writer = threading.Thread(target=_writer, name="ingest-writer", daemon=True)
+    writer.start()
+    emb_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest-emb")
+
+    def _submit(batch):
+        inflight.acquire()  # contrapresión: no se arman más lotes que los que se pueden embeber
+        _count("lotes")
+        emb_pool.submit(_embed, batch)
+
+    def _extract(path):
+        return chunk_text(pdf_to_text(path))
+
+    batch: List[Any] = []
+    batch_tokens = 0
+    try:
+        with ThreadPoolExecutor(max_workers=extract_workers, thread_name_prefix="ingest-extract") as ex_pool:
+            # Ventana de extracción acotada: no se acumulan textos de todo el corpus en memoria
+            window = max(1, extract_workers * 2)
+            futures = deque((p, ex_pool.submit(_extract, p)) for p in todo[:window])
+            rest = iter(todo[window:])
+            while futures:
+                path, fut = futures.popleft()
+                nxt = next(rest, None)
+                if nxt is not None:
+                    futures.append((nxt, ex_pool.submit(_extract, nxt)))
+                try:
+                    chunks = [c for c in fut.result() if c.strip()]
+                    col = collection_for(path)
+                    col.delete(where={"path": path})  # restos de una corrida interrumpida
+                except Exception as e:
+                    _count("errores")
+                    manifest.mark(path, "error", error=str(e))
+                    log(f"✖ Error en {path}: {e}")
+                    continue
+                if not chunks:
+                    manifest.mark(path, "completo", chunks=0)
+                    _count("completos")
+                    continue
+                with states_lock:
+                    states[path] = _FileState(path, col, meta_for(path), len(chunks))
+                for i, text in enumerate(chunks):
+                    ntok = count_tokens(text)
+                    if batch and (batch_tokens + ntok > max_batch_tokens or len(batch) >= max_batch_inputs):
+                        _submit(batch)
+                        batch, batch_tokens = [], 0
+                    batch.append((path, i, text))
+                    batch_tokens += ntok
+            if batch:
+                _submit(batch)
+    finally:
+        emb_pool.shutdown(wait=True)
+        write_q.put(None)
+        writer.join()
+    return summary
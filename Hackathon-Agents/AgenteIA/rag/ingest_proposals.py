@@ -1,45 +1,67 @@
-import os, glob, uuid
+import os, glob, argparse
 from dotenv import load_dotenv
 from openai import OpenAI
 
-from rag.chroma_setup import get_docs_collection
-from utils.pdf_text import pdf_to_text
-from utils.chunk import chunk_text
+from rag.chroma_setup import get_docs_collection, get_lic_collection
+from rag.ingest_pipeline import run_pipeline
+from utils import tracing
 
 load_dotenv()
 client = OpenAI()
 
 DOCS_DIR = os.environ.get("DOCS_DIR", "./data/docs")
 MODEL_EMB = os.environ.get("MODEL_EMB", "text-embedding-3-small")
+MANIFEST_PATH = os.environ.get("PROPOSALS_MANIFEST", "./cache/ingesta/contratos.json")
 
 # Ejecuta: python -m rag.ingest_proposals
 
 def embed(texts):
-    resp = client.embeddings.create(model=MODEL_EMB, input=texts)
+    with tracing.span("embeddings"):
+        resp = client.embeddings.create(model=MODEL_EMB, input=texts)
+    tracing.record_usage("embeddings", resp)
     return [d.embedding for d in resp.data]
 
 
-def main():
-    col = get_docs_collection()
-    pdfs = glob.glob(os.path.join(DOCS_DIR, "**/*.pdf"), recursive=True)
+def _lic_id_for(path):
+    # data/docs/<lic_id>/archivo.pdf -> lic_id; PDFs sueltos van a la colección compartida
+    rel = os.path.relpath(path, DOCS_DIR).split(os.sep)
+    return rel[0] if len(rel) > 1 else None
+
+
+def _meta_for(path):
+    meta = {"source": os.path.basename(path), "path": path, "type": "contrato"}
+    lic_id = _lic_id_for(path)
+    if lic_id:
+        meta["licitacion_id"] = lic_id
+    return meta
+
+
+def _collection_for(path):
+    lic_id = _lic_id_for(path)
+    return get_lic_collection(lic_id) if lic_id else get_docs_collection()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Indexa contratos/propuestas por licitación")
+    p.add_argument("--reiniciar", action="store_true", help="Ignora el manifiesto y reindexa todo")
+    args = p.parse_args(argv)
+
+    pdfs = sorted(glob.glob(os.path.join(DOCS_DIR, "**/*.pdf"), recursive=True))
     if not pdfs:
         print(f"No se encontraron PDFs en {DOCS_DIR}")
         return
 
+    if args.reiniciar and os.path.exists(MANIFEST_PATH):
+        os.remove(MANIFEST_PATH)
     print(f"Indexando {len(pdfs)} contratos/propuestas...")
-    for path in pdfs:
-        try:
-            text = pdf_to_text(path)
-            chunks = chunk_text(text)
-            ids = [str(uuid.uuid4()) for _ in chunks]
-            embeddings = embed(chunks)
-            metadatas = [{"source": os.path.basename(path), "path": path, "type": "contrato"} for _ in chunks]
-            col.add(ids=ids, documents=chunks, embeddings=embeddings, metadatas=metadatas)
-            print(f"✔ {os.path.basename(path)} → {len(chunks)} chunks")
-        except Exception as e:
-            print(f"✖ Error en {path}: {e}")
-
-    print("Listo. Contratos indexados en ChromaDB (colección 'contratos').")
+    summary = run_pipeline(
+        pdfs,
+        embed_fn=embed,
+        collection_for=_collection_for,
+        meta_for=_meta_for,
+        manifest_path=MANIFEST_PATH,
+    )
+    print(f"Listo. Contratos indexados (una partición de 'contratos' por licitación): {summary}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""Detección de propuestas casi duplicadas con MinHash + LSH.
+
+Cada propuesta indexada se resume en una firma MinHash (NUM_PERM mínimos) de
+los shingles de 5 palabras de sus chunks. Las firmas se reparten en bandas
+(LSH_BANDS x LSH_ROWS); dos documentos son candidatos si coinciden en alguna
+banda, así que revisar un documento nuevo solo toca sus buckets y no todos los
+pares. Los candidatos se confirman con la similitud de Jaccard estimada.
+
+El texto de los pliegos de una licitación (formularios que todos los oferentes
+copian) se registra como plantilla y sus shingles se descartan antes de firmar
+las propuestas de esa licitación.
+
+Estado en `db/minhash.sqlite3` (firmas, buckets y plantillas).
+"""
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+
+from utils.report_index import normalize
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MINHASH_PATH = os.environ.get("MINHASH_PATH", os.path.join(BASE_DIR, "db", "minhash.sqlite3"))
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 32 bandas de 4 filas: ~87% de probabilidad de ser candidatos con Jaccard 0.5, ~100% con 0.7
+LSH_BANDS = 32
+LSH_ROWS = 4
+DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.5"))
+# Documentos con muy pocos shingles (escaneos sin texto, anexos) no se comparan
+MIN_SHINGLES = int(os.environ.get("NEAR_DUP_MIN_SHINGLES", "50"))
+_BLOCK = 4096
+
+_rng = np.random.default_rng(20240601)  # fija: las firmas guardadas deben seguir siendo comparables
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS firmas (
+    path TEXT PRIMARY KEY,
+    lic_id TEXT,
+    documento TEXT,
+    shingles INTEGER,
+    firma BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS firmas_lic ON firmas (lic_id);
+CREATE TABLE IF NOT EXISTS bandas (
+    banda INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (banda, h, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bandas_path ON bandas (path);
+CREATE TABLE IF NOT EXISTS plantillas (
+    lic_id TEXT NOT NULL,
+    h INTEGER NOT NULL,
+    PRIMARY KEY (lic_id, h)
+) WITHOUT ROWID;
+"""
+
+_write_lock = threading.Lock()
+_ready = set()
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or MINHASH_PATH
+    conn = sqlite3.connect(path, timeout=30)
+    if path not in _ready:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+# ============ Firmas ============
+
+def _h64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True)
+
+
+def shingles(chunks: Iterable[str]) -> np.ndarray:
+    """Hashes (int64) únicos de los shingles de SHINGLE_WORDS palabras de los chunks."""
+    out = set()
+    for chunk in chunks:
+        w = _WORD.findall(normalize(chunk))
+        for i in range(max(len(w) - SHINGLE_WORDS + 1, 0)):
+            out.add(_h64(" ".join(w[i:i + SHINGLE_WORDS]).encode("utf-8")))
+    return np.fromiter(out, dtype=np.int64, count=len(out))
+
+
+def signature(hashes: np.ndarray) -> np.ndarray:
+    # Permutaciones multiply-shift sobre 64 bits (el desborde de uint64 es la reducción módulo 2^64)
+    sig = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    x = hashes.view(np.uint64)
+    with np.errstate(over="ignore"):
+        for s in range(0, len(x), _BLOCK):
+            block = (x[s:s + _BLOCK, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+            np.minimum(sig, block.min(axis=0), out=sig)
+    return sig
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def _bands(sig: np.ndarray) -> List[int]:
+    return [_h64(bytes([b]) + sig[b * LSH_ROWS:(b + 1) * LSH_ROWS].tobytes()) for b in range(LSH_BANDS)]
+
+
+# ============ Índice ============
+
+def add_template(lic_id: str, chunks: List[str], path: Optional[str] = None):
+    """Registra el texto de un pliego: sus shingles no cuentan como copia entre oferentes."""
+    hs = shingles(chunks)
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO plantillas (lic_id, h) VALUES (?, ?)",
+                                 ((lic_id, int(h)) for h in hs))
+        finally:
+            conn.close()
+
+
+def _template_filter(conn, lic_id: str, hs: np.ndarray) -> np.ndarray:
+    tpl = np.fromiter((r[0] for r in conn.execute("SELECT h FROM plantillas WHERE lic_id = ?", (lic_id,))), dtype=np.int64)
+    return hs[~np.isin(hs, tpl)] if len(tpl) else hs
+
+
+def _candidates(conn, sig: np.ndarray, exclude: str) -> List[Dict[str, Any]]:
+    seen: Dict[str, Dict[str, Any]] = {}
+    for b, h in enumerate(_bands(sig)):
+        for (p,) in conn.execute("SELECT path FROM bandas WHERE banda = ? AND h = ? AND path != ?", (b, h, exclude)):
+            if p in seen:
+                continue
+            row = conn.execute("SELECT lic_id, documento, firma FROM firmas WHERE path = ?", (p,)).fetchone()
+            if row:
+                seen[p] = {"path": p, "lic_id": row[0], "documento": row[1],
+                           "firma": np.frombuffer(row[2], dtype=np.uint64)}
+    return list(seen.values())
+
+
+def _confirm(sig: np.ndarray, lic_id: str, cands: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    out = []
+    for c in cands:
+        sim = jaccard(sig, c.pop("firma"))
+        if sim >= threshold:
+            out.append({**c, "similitud": round(sim, 3), "misma_licitacion": c["lic_id"] == lic_id})
+    out.sort(key=lambda m: -m["similitud"])
+    return out
+
+
+def add_document(doc_path: str, lic_id: str, chunks: List[str], threshold: float = DUP_THRESHOLD,
+                 path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Firma una propuesta, la agrega al índice LSH y devuelve sus casi duplicados."""
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            hs = _template_filter(conn, lic_id, shingles(chunks))
+            with conn:
+                conn.execute("DELETE FROM bandas WHERE path = ?", (doc_path,))
+                conn.execute("DELETE FROM firmas WHERE path = ?", (doc_path,))
+                # Con muy poco texto se guarda una firma vacía: queda registrado pero no se compara
+                sig = signature(hs) if len(hs) >= MIN_SHINGLES else np.empty(0, dtype=np.uint64)
+                conn.execute(
+                    "INSERT INTO firmas (path, lic_id, documento, shingles, firma) VALUES (?, ?, ?, ?, ?)",
+                    (doc_path, lic_id, os.path.basename(doc_path), int(len(hs)), sig.tobytes()),
+                )
+                if not len(sig):
+                    return []
+                conn.executemany("INSERT OR IGNORE INTO bandas (banda, h, path) VALUES (?, ?, ?)",
+                                 ((b, h, doc_path) for b, h in enumerate(_bands(sig))))
+            return _confirm(sig, lic_id, _candidates(conn, sig, doc_path), threshold)
+        finally:
+            conn.close()
+
+
+def matches(doc_path: str, threshold: float = DUP_THRESHOLD, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Casi duplicados de una propuesta ya indexada (lista vacía si no tiene firma)."""
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT lic_id, firma FROM firmas WHERE path = ?", (doc_path,)).fetchone()
+        if not row or not row[1]:
+            return []
+        sig = np.frombuffer(row[1], dtype=np.uint64)
+        return _confirm(sig, row[0], _candidates(conn, sig, doc_path), threshold)
+    finally:
+        conn.close()
+
+
+def has_signature(doc_path: str, path: Optional[str] = None) -> bool:
+    conn = _connect(path)
+    try:
+        return conn.execute("SELECT 1 FROM firmas WHERE path = ?", (doc_path,)).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def remove_lic(lic_id: str, path: Optional[str] = None):
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM bandas WHERE path IN (SELECT path FROM firmas WHERE lic_id = ?)", (lic_id,))
+                conn.execute("DELETE FROM firmas WHERE lic_id = ?", (lic_id,))
+                conn.execute("DELETE FROM plantillas WHERE lic_id = ?", (lic_id,))
+        finally:
+            conn.close()
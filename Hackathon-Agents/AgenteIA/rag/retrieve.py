@@ -3,32 +3,51 @@ from openai import OpenAI
 from dotenv import load_dotenv
 
 from rag.chroma_setup import get_legal_collection as get_collection
+from utils import tracing
 
 load_dotenv()
 client = OpenAI()
 MODEL_EMB = "text-embedding-3-small"
 
 
+def _embed_many(queries: List[str]):
+    with tracing.span("embeddings"):
+        resp = client.embeddings.create(model=MODEL_EMB, input=list(queries))
+    tracing.record_usage("embeddings", resp)
+    return [d.embedding for d in resp.data]
+
+
 def _embed(query: str):
-    resp = client.embeddings.create(model=MODEL_EMB, input=[query])
-    return resp.data[0].embedding
+    return _embed_many([query])[0]
 
 
-def retrieve_context(query: str, k: int = 6) -> List[Dict]:
+def retrieve_contexts(queries: List[str], k: int = 6) -> List[List[Dict]]:
+    """Varias consultas con un solo llamado de embeddings y una sola búsqueda por lote."""
+    if not queries:
+        return []
     col = get_collection()
-    qemb = _embed(query)
-    res = col.query(query_embeddings=[qemb], n_results=k, include=["documents", "metadatas", "distances"])
-
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
-
-    items = []
-    for doc, meta, dist in zip(docs, metas, dists):
-        items.append({
-            "text": doc,
-            "source": meta.get("source"),
-            "path": meta.get("path"),
-            "distance": float(dist),
-        })
-    return items
\ No newline at end of file
+    qembs = _embed_many(queries)
+    with tracing.span("vector_query"):
+        res = col.query(query_embeddings=qembs, n_results=k, include=["documents", "metadatas", "distances"])
+
+    def _row(key, i):
+        rows = res.get(key) or []
+        return rows[i] if i < len(rows) else []
+
+    out = []
+    for i in range(len(queries)):
+        docs, metas, dists = _row("documents", i), _row("metadatas", i), _row("distances", i)
+        items = []
+        for doc, meta, dist in zip(docs, metas, dists):
+            items.append({
+                "text": doc,
+                "source": meta.get("source"),
+                "path": meta.get("path"),
+                "distance": float(dist),
+            })
+        out.append(items)
+    return out
+
+
+def retrieve_context(query: str, k: int = 6) -> List[Dict]:
+    return retrieve_contexts([query], k=k)[0]
\ No newline at end of file
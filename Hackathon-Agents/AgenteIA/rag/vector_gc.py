@@ -0,0 +1,174 @@
+"""Recolección de basura y compactación de las colecciones vectoriales.
+
+Elimina, por colección:
+  - duplicados: misma licitación + misma ruta fuente + mismo texto (re-subidas, re-ingestas)
+  - huérfanos: chunks cuyo archivo fuente ya no existe en disco
+  - particiones `contratos_<id>` de licitaciones que ya no existen (si se conocen)
+
+Borra por lotes y luego compacta el almacenamiento (reescritura de los archivos
+numpy; VACUUM del SQLite de Chroma). Reporta tamaños antes/después.
+
+Ejecuta (desde AgenteIA/):
+  python -m rag.vector_gc --dry-run
+  python -m rag.vector_gc --db db/licitaciones.json
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+from rag import chroma_setup
+from rag.vector_store import NumpyCollection, VECTOR_STORE_PATH
+from utils import tracing
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GC_BATCH = int(os.environ.get("VECTOR_GC_BATCH", "500"))
+PAGE_SIZE = int(os.environ.get("VECTOR_GC_PAGE", "2000"))
+
+# Una sola corrida de GC a la vez por proceso
+_gc_lock = threading.Lock()
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def _store_bytes() -> int:
+    return _dir_bytes(VECTOR_STORE_PATH) + _dir_bytes(chroma_setup.CHROMA_PATH)
+
+
+def _source_exists(path: Optional[str]) -> bool:
+    if not path:
+        return True  # sin ruta no se puede decidir: se conserva
+    if not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+    return os.path.exists(path)
+
+
+def _iter_items(col) -> Iterable[Dict[str, Any]]:
+    offset = 0
+    while True:
+        page = col.get(include=["documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            return
+        for i, doc, meta in zip(ids, page.get("documents") or [], page.get("metadatas") or []):
+            yield {"id": i, "document": doc or "", "metadata": meta or {}}
+        offset += len(ids)
+
+
+def find_garbage(col) -> Dict[str, List[str]]:
+    seen = set()
+    dups, orphans = [], []
+    exists_cache: Dict[str, bool] = {}
+    for it in _iter_items(col):
+        meta = it["metadata"]
+        path = meta.get("path")
+        if path not in exists_cache:
+            exists_cache[path] = _source_exists(path)
+        if not exists_cache[path]:
+            orphans.append(it["id"])
+            continue
+        # Ruta completa y licitación: archivos homónimos de licitaciones distintas no son duplicados
+        key = (meta.get("licitacion_id"), path or meta.get("source"), hashlib.sha1(it["document"].encode("utf-8")).hexdigest())
+        if key in seen:
+            dups.append(it["id"])
+        else:
+            seen.add(key)
+    return {"duplicados": dups, "huerfanos": orphans}
+
+
+def _delete_batches(col, ids: List[str]):
+    for s in range(0, len(ids), GC_BATCH):
+        col.delete(ids=ids[s:s + GC_BATCH])
+
+
+def _vacuum_chroma():
+    db = os.path.join(chroma_setup.CHROMA_PATH, "chroma.sqlite3")
+    if not os.path.exists(db):
+        return
+    try:
+        conn = sqlite3.connect(db, timeout=30)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"[gc] VACUUM Chroma omitido: {e}")
+
+
+def _partition_lic_id(name: str) -> Optional[str]:
+    prefix = chroma_setup.DOCS_COLLECTION + "_"
+    return name[len(prefix):] if name.startswith(prefix) else None
+
+
+@tracing.traced("vector_gc")
+def run_gc(known_lic_ids: Optional[Iterable[str]] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """GC de todas las colecciones. `known_lic_ids` habilita borrar particiones sin licitación."""
+    known = {chroma_setup.lic_collection_name(x) for x in known_lic_ids} if known_lic_ids is not None else None
+    with _gc_lock:
+        bytes_before = _store_bytes()
+        report: Dict[str, Any] = {"dry_run": dry_run, "colecciones": {}, "particiones_eliminadas": []}
+        used_chroma = False
+        for name in chroma_setup.list_collection_names():
+            if known is not None and _partition_lic_id(name) is not None and name not in known:
+                report["particiones_eliminadas"].append(name)
+                if not dry_run:
+                    chroma_setup.drop_lic_collection(_partition_lic_id(name))
+                continue
+            col = chroma_setup.get_named_collection(name)
+            before = col.count()
+            garbage = find_garbage(col)
+            to_delete = garbage["duplicados"] + garbage["huerfanos"]
+            if to_delete and not dry_run:
+                _delete_batches(col, to_delete)
+            if isinstance(col, NumpyCollection):
+                if not dry_run:
+                    col.compact()
+            else:
+                used_chroma = used_chroma or bool(to_delete)
+            report["colecciones"][name] = {
+                "antes": before,
+                "despues": before if dry_run else col.count(),
+                "duplicados": len(garbage["duplicados"]),
+                "huerfanos": len(garbage["huerfanos"]),
+            }
+        if used_chroma and not dry_run:
+            _vacuum_chroma()
+        bytes_after = _store_bytes()
+    report["bytes_antes"] = bytes_before
+    report["bytes_despues"] = bytes_after
+    report["bytes_recuperados"] = max(bytes_before - bytes_after, 0)
+    return report
+
+
+def _known_lics(db_path: Optional[str]) -> Optional[List[str]]:
+    if not db_path or not os.path.exists(db_path):
+        return None
+    with open(db_path, "r", encoding="utf-8") as f:
+        return [x["id"] for x in json.load(f).get("licitaciones", [])]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Elimina chunks duplicados/huérfanos y compacta el índice vectorial")
+    p.add_argument("--dry-run", action="store_true", help="Solo reporta, no borra")
+    p.add_argument("--db", default=os.path.join(BASE_DIR, "db", "licitaciones.json"),
+                   help="DB de licitaciones (para detectar particiones sin licitación)")
+    args = p.parse_args(argv)
+    report = run_gc(_known_lics(args.db), dry_run=args.dry_run)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
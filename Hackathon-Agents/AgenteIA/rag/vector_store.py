@@ -0,0 +1,392 @@
+"""Almacén vectorial en proceso con búsqueda exacta (NumPy).
+
+Pensado para colecciones pequeñas (p. ej. `base_legal`, unos miles de chunks),
+donde el HNSW + SQLite de Chroma agrega más costo por consulta del que ahorra.
+Expone el subconjunto de la API de Chroma que usa el proyecto (`add`, `query`,
+`get`, `delete`, `count`), así que `rag/chroma_setup.py` puede devolver una u
+otra implementación según la configuración por colección.
+
+Formato en disco (`{VECTOR_STORE_PATH}/{nombre}/`):
+
+  vectors.f32   matriz float32 (n x dim) normalizada, solo se agregan filas
+  items.jsonl   una línea por fila: id, documento y metadata
+  deleted.jsonl ids borrados (lápidas) hasta la próxima compactación
+  meta.json     dimensión y formato de búsqueda
+
+Opcionalmente la búsqueda usa una copia compacta: `search.i8` (con una escala
+por fila en `scales.f32`), `search.f16`, o `search.f32` si solo se reduce la
+dimensión. La reducción trunca a las primeras componentes (los modelos
+text-embedding-3 se entrenan para que ese prefijo renormalizado conserve la
+semántica). Solo esa copia se recorre en cada consulta; los
+`RERANK_FACTOR * k` mejores candidatos se reordenan leyendo sus filas de
+`vectors.f32` (memmap, solo se paginan esas filas). El formato se fija al crear
+la colección.
+
+La matriz se abre con `np.memmap`; una consulta por lote es un único producto
+matricial más `argpartition`. Las distancias son coseno (1 - similitud), igual
+que las colecciones Chroma creadas con `hnsw:space=cosine`.
+"""
+import os
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+VECTOR_STORE_PATH = os.environ.get("VECTOR_STORE_PATH", os.path.join(BASE_DIR, "vector_store"))
+
+_VECTORS = "vectors.f32"
+_ITEMS = "items.jsonl"
+_DELETED = "deleted.jsonl"
+_META = "meta.json"
+_SCALES = "scales.f32"
+
+QUANT_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_SEARCH_FILES = {"float32": "search.f32", "float16": "search.f16", "int8": "search.i8"}
+RERANK_FACTOR = int(os.environ.get("VECTOR_RERANK_FACTOR", "4"))
+# Filas por bloque al puntuar matrices cuantizadas (la copia temporal en float32 cabe en caché)
+SCORE_BLOCK = 512
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _scores(mat: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """(consultas x filas) recorriendo la matriz una sola vez."""
+    if mat.dtype == np.float32:
+        return (mat @ q.T).T
+    out = np.empty((len(q), len(mat)), dtype=np.float32)
+    for s in range(0, len(mat), SCORE_BLOCK):
+        out[:, s:s + SCORE_BLOCK] = (np.asarray(mat[s:s + SCORE_BLOCK], dtype=np.float32) @ q.T).T
+    return out
+
+
+def _match(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Filtro `where` estilo Chroma: igualdad, $eq, $ne, $in, $nin, $and, $or."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(_match(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            val = meta.get(key)
+            for op, ref in cond.items():
+                if op == "$eq" and val != ref:
+                    return False
+                if op == "$ne" and val == ref:
+                    return False
+                if op == "$in" and val not in ref:
+                    return False
+                if op == "$nin" and val in ref:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def parse_quant(spec: Optional[str]) -> Tuple[str, Optional[int]]:
+    """'int8', 'float16@512' -> (dtype, dimensión reducida o None)."""
+    if not spec:
+        return "float32", None
+    dtype, _, dims = spec.partition("@")
+    if dtype not in QUANT_DTYPES:
+        raise ValueError(f"Cuantización no soportada: {dtype}")
+    return dtype, int(dims) if dims else None
+
+
+class NumpyCollection:
+    def __init__(self, name: str, path: Optional[str] = None, quant: Optional[str] = None):
+        self.name = name
+        self.path = os.path.join(path or VECTOR_STORE_PATH, name)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._requested_quant = parse_quant(quant)
+        self._load()
+
+    # ---------- carga ----------
+    def _file(self, fname: str) -> str:
+        return os.path.join(self.path, fname)
+
+    def _load(self):
+        self.dim: Optional[int] = None
+        self.quant, self.reduced_dim = self._requested_quant
+        if os.path.exists(self._file(_META)):
+            with open(self._file(_META), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta.get("dim")
+            self.quant, self.reduced_dim = meta.get("quant", "float32"), meta.get("reduced_dim")
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        # Fin (en bytes) de cada línea completa de items, para recortar el archivo si hace falta
+        ends: List[int] = []
+        if os.path.exists(self._file(_ITEMS)):
+            with open(self._file(_ITEMS), "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # línea truncada por una escritura interrumpida
+                    try:
+                        it = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        break
+                    offset += len(line)
+                    ends.append(offset)
+                    self.ids.append(it["id"])
+                    self.documents.append(it.get("document") or "")
+                    self.metadatas.append(it.get("metadata") or {})
+        # Filas consistentes entre matriz e items (una escritura pudo quedar a medias)
+        n_vec = 0
+        if self.dim and os.path.exists(self._file(_VECTORS)):
+            n_vec = os.path.getsize(self._file(_VECTORS)) // (4 * self.dim)
+        n = min(n_vec, len(self.ids))
+        if self._quantized and self.dim:
+            n = min(n, self._file_rows(_SEARCH_FILES.get(self.quant, _VECTORS), self._search_dim, QUANT_DTYPES[self.quant]))
+            if self.quant == "int8":
+                n = min(n, self._file_rows(_SCALES, 1, np.float32))
+        del self.ids[n:], self.documents[n:], self.metadatas[n:]
+        # Se recortan también los archivos: el próximo `add` agrega a continuación de la fila n
+        self._truncate(_ITEMS, ends[n - 1] if n else 0)
+        if self.dim:
+            self._truncate(_VECTORS, n * self.dim * 4)
+            if self._quantized:
+                dtype = np.dtype(QUANT_DTYPES[self.quant])
+                self._truncate(_SEARCH_FILES.get(self.quant, _VECTORS), n * self._search_dim * dtype.itemsize)
+                if self.quant == "int8":
+                    self._truncate(_SCALES, n * 4)
+        self._n = n
+        self._pos = {i: p for p, i in enumerate(self.ids)}
+        self._alive = np.ones(n, dtype=bool)
+        if os.path.exists(self._file(_DELETED)):
+            with open(self._file(_DELETED), "r", encoding="utf-8") as f:
+                for line in f:
+                    p = self._pos.pop(line.strip(), None)
+                    if p is not None:
+                        self._alive[p] = False
+        self._matrix: Optional[np.ndarray] = None
+        self._search: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+    @property
+    def _quantized(self) -> bool:
+        return self.quant != "float32" or bool(self.reduced_dim)
+
+    @property
+    def _search_dim(self) -> int:
+        return self.reduced_dim or self.dim or 0
+
+    def _truncate(self, fname: str, size: int):
+        if os.path.exists(self._file(fname)) and os.path.getsize(self._file(fname)) > size:
+            print(f"[vector_store] {self.name}/{fname}: se descartan bytes de una escritura interrumpida")
+            with open(self._file(fname), "r+b") as f:
+                f.truncate(size)
+
+    def _file_rows(self, fname: str, width: int, dtype) -> int:
+        if not os.path.exists(self._file(fname)) or not width:
+            return 0
+        return os.path.getsize(self._file(fname)) // (width * np.dtype(dtype).itemsize)
+
+    def _memmap(self, fname: str, dtype, width: int) -> np.ndarray:
+        if self._n == 0:
+            return np.zeros((0, width), dtype=dtype)
+        return np.memmap(self._file(fname), dtype=dtype, mode="r", shape=(self._n, width))
+
+    def _vectors(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = self._memmap(_VECTORS, np.float32, self.dim or 0)
+        return self._matrix
+
+    def _search_matrix(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Matriz que se recorre en cada consulta (+ escalas por fila si es int8)."""
+        if not self._quantized:
+            return self._vectors(), None
+        if self._search is None:
+            dtype = QUANT_DTYPES[self.quant]
+            self._search = self._memmap(_SEARCH_FILES.get(self.quant, _VECTORS), dtype, self._search_dim)
+            if self.quant == "int8":
+                self._scales = self._memmap(_SCALES, np.float32, 1)[:, 0]
+        return self._search, self._scales
+
+    def _reduce(self, mat: np.ndarray) -> np.ndarray:
+        if self.reduced_dim and self.reduced_dim < mat.shape[1]:
+            return _normalize_rows(mat[:, :self.reduced_dim])
+        return mat
+
+    def _encode(self, mat: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Filas normalizadas -> representación de búsqueda (truncada/cuantizada)."""
+        mat = self._reduce(mat)
+        if self.quant == "int8":
+            scales = np.abs(mat).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(mat / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return mat.astype(QUANT_DTYPES[self.quant]), None
+
+    def memory_bytes(self) -> int:
+        """Bytes que cada consulta recorre (la matriz residente en memoria)."""
+        mat, scales = self._search_matrix()
+        return int(mat.nbytes + (scales.nbytes if scales is not None else 0))
+
+    # ---------- API estilo Chroma ----------
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict[str, Any]]] = None, **kwargs):
+        if not ids:
+            return
+        mat = np.asarray(embeddings, dtype=np.float32)
+        if mat.ndim != 2 or mat.shape[0] != len(ids):
+            raise ValueError("embeddings debe ser una matriz con una fila por id")
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(mat.shape[1])
+                if self.reduced_dim:
+                    self.reduced_dim = min(self.reduced_dim, self.dim)
+                with open(self._file(_META), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "quant": self.quant, "reduced_dim": self.reduced_dim}, f)
+            elif mat.shape[1] != self.dim:
+                raise ValueError(f"Dimensión {mat.shape[1]} distinta de la colección ({self.dim})")
+            dup = [i for i in ids if i in self._pos]
+            if dup:
+                raise ValueError(f"IDs ya existentes: {dup[:3]}")
+            mat = _normalize_rows(mat)
+            with open(self._file(_VECTORS), "ab") as f:
+                f.write(np.ascontiguousarray(mat).tobytes())
+            if self._quantized:
+                enc, scales = self._encode(mat)
+                with open(self._file(_SEARCH_FILES.get(self.quant, _VECTORS)), "ab") as f:
+                    f.write(np.ascontiguousarray(enc).tobytes())
+                if scales is not None:
+                    with open(self._file(_SCALES), "ab") as f:
+                        f.write(scales.tobytes())
+            with open(self._file(_ITEMS), "a", encoding="utf-8") as f:
+                for i, d, m in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"id": i, "document": d, "metadata": m}, ensure_ascii=False) + "\n")
+            for i, d, m in zip(ids, documents, metadatas):
+                self._pos[i] = len(self.ids)
+                self.ids.append(i)
+                self.documents.append(d)
+                self.metadatas.append(m)
+            self._n = len(self.ids)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._matrix = self._search = self._scales = None
+
+    def _rows(self, where: Optional[Dict[str, Any]] = None, ids: Optional[List[str]] = None) -> np.ndarray:
+        if ids is not None:
+            rows = np.array(sorted(self._pos[i] for i in ids if i in self._pos), dtype=np.int64)
+        else:
+            rows = np.flatnonzero(self._alive)
+        if where:
+            rows = np.array([p for p in rows if _match(self.metadatas[p], where)], dtype=np.int64)
+        return rows
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas", "distances"]
+        q = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        with self._lock:
+            rows = self._rows(where)
+            mat, scales = self._search_matrix()
+            full = self._vectors()
+        out: Dict[str, Any] = {"ids": []}
+        for key in ("documents", "metadatas", "distances"):
+            if key in include:
+                out[key] = []
+        if len(rows) == 0:
+            for key in out:
+                out[key] = [[] for _ in range(len(q))]
+            return out
+        sub = mat if len(rows) == mat.shape[0] else mat[rows]
+        sims = _scores(sub, self._reduce(q))
+        if scales is not None:
+            sims = sims * (scales if len(rows) == len(scales) else scales[rows])
+        k = min(n_results, len(rows))
+        n_cand = min(k * RERANK_FACTOR, len(rows)) if self._quantized else k
+        top = np.argpartition(-sims, n_cand - 1, axis=1)[:, :n_cand]
+        for qi in range(len(q)):
+            if self._quantized:
+                # Reordenamiento exacto con las filas float32 de los candidatos
+                exact = full[rows[top[qi]]] @ q[qi]
+                order = np.argsort(-exact)[:k]
+                cand, dists = top[qi][order], exact[order]
+            else:
+                cand = top[qi][np.argsort(-sims[qi, top[qi]])]
+                dists = sims[qi, cand]
+            pos = rows[cand]
+            out["ids"].append([self.ids[p] for p in pos])
+            if "documents" in out:
+                out["documents"].append([self.documents[p] for p in pos])
+            if "metadatas" in out:
+                out["metadatas"].append([self.metadatas[p] for p in pos])
+            if "distances" in out:
+                out["distances"].append([float(1.0 - s) for s in dists])
+        return out
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0, **kwargs) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        with self._lock:
+            rows = self._rows(where, ids)
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            out: Dict[str, Any] = {"ids": [self.ids[p] for p in rows]}
+            if "documents" in include:
+                out["documents"] = [self.documents[p] for p in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self.metadatas[p] for p in rows]
+            if "embeddings" in include:
+                out["embeddings"] = np.asarray(self._vectors()[rows])
+        return out
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, **kwargs):
+        with self._lock:
+            rows = self._rows(where, ids)
+            if len(rows) == 0:
+                return
+            with open(self._file(_DELETED), "a", encoding="utf-8") as f:
+                for p in rows:
+                    f.write(self.ids[p] + "\n")
+                    self._pos.pop(self.ids[p], None)
+            self._alive[rows] = False
+
+
+    # ---------- mantenimiento ----------
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path)
+                   if os.path.isfile(os.path.join(self.path, f)))
+
+    def compact(self):
+        """Reescribe los archivos sin las filas borradas y elimina las lápidas."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            if len(rows) == self._n and not os.path.exists(self._file(_DELETED)):
+                return
+            full = np.asarray(self._vectors()[rows], dtype=np.float32)
+            outputs = {_VECTORS: full}
+            if self._quantized:
+                search, scales = self._search_matrix()
+                outputs[_SEARCH_FILES.get(self.quant, _VECTORS)] = np.asarray(search[rows])
+                if scales is not None:
+                    outputs[_SCALES] = np.asarray(scales[rows], dtype=np.float32)
+            self._matrix = self._search = self._scales = None  # liberar los memmap antes de reemplazar
+            for fname, mat in outputs.items():
+                with open(self._file(fname + ".tmp"), "wb") as f:
+                    f.write(np.ascontiguousarray(mat).tobytes())
+            with open(self._file(_ITEMS + ".tmp"), "w", encoding="utf-8") as f:
+                for p in rows:
+                    f.write(json.dumps({"id": self.ids[p], "document": self.documents[p], "metadata": self.metadatas[p]},
+                                       ensure_ascii=False) + "\n")
+            for fname in list(outputs) + [_ITEMS]:
+                os.replace(self._file(fname + ".tmp"), self._file(fname))
+            if os.path.exists(self._file(_DELETED)):
+                os.remove(self._file(_DELETED))
+            self._load()
@@ -1,8 +1,13 @@
 import argparse
+import csv
 import json
-from typing import Optional
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Dict, Any, Tuple
 
-from agents.validator_ruc import run, call_sri
+from agents.validator_ruc import run
 
 
 def run_check(ruc: str, objeto: str, razon_input: Optional[str] = None, verbose: bool = False):
@@ -41,14 +46,147 @@ def run_check(ruc: str, objeto: str, razon_input: Optional[str] = None, verbose:
     return 0 if result.get('related', False) else 1
 
 
+# ============ Modo lote (--input archivo.csv) ============
+
+RIESGOS = ("ALTO", "MEDIO", "BAJO")
+
+
+def read_pairs(path: str, objeto_default: Optional[str] = None) -> List[Tuple[str, str, Optional[str]]]:
+    """Lee (ruc, objeto, razon) de un CSV con encabezado ruc,objeto[,razon] o columnas posicionales."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.reader(f, dialect))
+    if not rows:
+        return []
+    header = [c.strip().lower() for c in rows[0]]
+    if "ruc" in header:
+        i_ruc = header.index("ruc")
+        i_obj = header.index("objeto") if "objeto" in header else None
+        i_raz = header.index("razon") if "razon" in header else None
+        rows = rows[1:]
+    else:
+        i_ruc, i_obj, i_raz = 0, 1, 2
+    pairs = []
+    for row in rows:
+        cell = lambda i: row[i].strip() if i is not None and i < len(row) else ""
+        ruc = cell(i_ruc)
+        if not ruc:
+            continue
+        objeto = cell(i_obj) or (objeto_default or "")
+        pairs.append((ruc, objeto, cell(i_raz) or None))
+    return pairs
+
+
+def _load_done(output: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Resultados ya escritos; descarta una última línea truncada por una corrida interrumpida.
+
+    Los errores transitorios del SRI (timeouts, 5xx) no cuentan como hechos: se
+    quitan del archivo y se vuelven a consultar.
+    """
+    done: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    valid_lines = []
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if str(rec.get("rationale", "")).startswith("Error en validación SRI"):
+                continue
+            done[(rec.get("ruc", ""), rec.get("objeto", ""))] = rec
+            valid_lines.append(json.dumps(rec, ensure_ascii=False) + "\n")
+    tmp = output + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(valid_lines)
+    os.replace(tmp, output)
+    return done
+
+
+def _check_one(ruc: str, objeto: str, razon: Optional[str]) -> Dict[str, Any]:
+    result = run(ruc, objeto)
+    rec = dict(result)
+    rec["objeto"] = objeto
+    if razon:
+        rec["razon_input"] = razon
+        rec["razon_coincide"] = razon.lower() in (result.get("razon_social") or "").lower()
+    return rec
+
+
+def _progress(n: int, total: int, counts: Dict[str, int]):
+    resumen = " ".join(f"{k}={counts.get(k, 0)}" for k in RIESGOS)
+    sys.stderr.write(f"\r[{n}/{total}] {resumen}")
+    sys.stderr.flush()
+
+
+def run_batch(input_path: str, output: str, workers: int = 8,
+              objeto_default: Optional[str] = None, resume: bool = False) -> int:
+    pairs = read_pairs(input_path, objeto_default)
+    done = _load_done(output) if resume and os.path.exists(output) else {}
+    todo = []
+    seen = set(done)
+    for ruc, objeto, razon in pairs:
+        if (ruc, objeto) not in seen:
+            seen.add((ruc, objeto))
+            todo.append((ruc, objeto, razon))
+
+    counts: Dict[str, int] = {}
+    for rec in done.values():
+        counts[rec.get("risk", "ALTO")] = counts.get(rec.get("risk", "ALTO"), 0) + 1
+    total = len(done) + len(todo)
+    if done:
+        print(f"Reanudando: {len(done)} resultados previos, {len(todo)} pendientes", file=sys.stderr)
+
+    lock = threading.Lock()
+    n = len(done)
+    with open(output, "a" if resume else "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_check_one, *item) for item in todo]
+        try:
+            for fut in as_completed(futures):
+                rec = fut.result()
+                with lock:
+                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    out.flush()
+                    counts[rec.get("risk", "ALTO")] = counts.get(rec.get("risk", "ALTO"), 0) + 1
+                    n += 1
+                    _progress(n, total, counts)
+        except KeyboardInterrupt:
+            for fut in futures:
+                fut.cancel()
+            sys.stderr.write("\nProceso cancelado; use --resume para continuar\n")
+            return 130
+    sys.stderr.write("\n")
+
+    print("=== Resumen por nivel de riesgo ===")
+    for k in RIESGOS:
+        print(f"{k}: {counts.get(k, 0)}")
+    print(f"Total: {total}  ->  {output}")
+    return 1 if counts.get("ALTO", 0) else 0
+
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser(description="Verifica RUC contra SRI y valida compatibilidad con proyecto")
     p.add_argument("--ruc", required=False, help="RUC de la empresa")
     p.add_argument("--objeto", required=False, help="Objeto del contrato/proyecto")
     p.add_argument("--razon", required=False, help="Razón social digitada (opcional)")
     p.add_argument("--verbose", "-v", action="store_true", help="Mostrar datos completos")
+    p.add_argument("--input", "-i", required=False, help="CSV con columnas ruc,objeto[,razon] (modo lote)")
+    p.add_argument("--output", "-o", required=False, help="Archivo JSONL de resultados (por defecto <input>.jsonl)")
+    p.add_argument("--workers", "-j", type=int, default=int(os.environ.get("RUC_WORKERS", "8")),
+                   help="Consultas concurrentes en modo lote")
+    p.add_argument("--resume", action="store_true", help="Continuar un archivo de resultados parcial")
     args = p.parse_args()
 
+    if args.input:
+        output = args.output or os.path.splitext(args.input)[0] + ".jsonl"
+        raise SystemExit(run_batch(args.input, output, args.workers,
+                                   args.objeto.strip() if args.objeto else None, args.resume))
+
     if args.ruc and args.objeto:
         raise SystemExit(run_check(args.ruc.strip(), args.objeto.strip(), 
                                   args.razon.strip() if args.razon else None,
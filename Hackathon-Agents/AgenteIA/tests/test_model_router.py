@@ -0,0 +1,62 @@
+import random
+
+from utils import model_router
+
+N_CALLS = 500
+INVALID_SHARE = 0.04
+
+
+def _small_model_answers():
+    # Scores típicos de un validador (concentrados en la zona media) y algún JSON ilegible
+    rng = random.Random(7)
+    answers = []
+    for _ in range(N_CALLS):
+        if rng.random() < INVALID_SHARE:
+            answers.append(None)
+        else:
+            answers.append({"issues": [], "score": max(0, min(100, round(rng.gauss(68, 14))))})
+    return answers
+
+
+def _escalation_share():
+    escalated = 0
+    for answer in _small_model_answers():
+        def call(model, answer=answer):
+            return answer if model == model_router.MODEL_SMALL else {"issues": [], "score": 70}
+        _, ruteo = model_router.cascade("validator_tech", "gpt-4o-mini", call)
+        escalated += ruteo["escalado"]
+    return escalated / N_CALLS
+
+
+def _expected_share(band):
+    answers = _small_model_answers()
+    return sum(a is None or band[0] <= a["score"] <= band[1] for a in answers) / N_CALLS
+
+
+def test_default_band_escalates_only_borderline_and_unreadable(monkeypatch):
+    # Configuración por defecto (sin ROUTER_SCORE_BAND en el entorno)
+    monkeypatch.setattr(model_router, "ROUTER_ENABLED", True)
+    assert model_router.SCORE_BAND == (55.0, 65.0)
+    share = _escalation_share()
+    assert share == _expected_share(model_router.SCORE_BAND)
+    # La mayoría de las llamadas se resuelve con el modelo chico
+    assert share < 0.35
+
+
+def test_without_band_escalates_only_unreadable_answers(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_ENABLED", True)
+    monkeypatch.setattr(model_router, "SCORE_BAND", None)
+    assert _escalation_share() == sum(a is None for a in _small_model_answers()) / N_CALLS
+
+
+def test_wide_score_band_escalates_most_calls(monkeypatch):
+    # La banda 40-75 mandaba la mayoría de las llamadas a los dos modelos
+    monkeypatch.setattr(model_router, "ROUTER_ENABLED", True)
+    monkeypatch.setattr(model_router, "SCORE_BAND", (40.0, 75.0))
+    assert _escalation_share() > 0.5
+
+
+def test_low_confidence_escalates():
+    assert model_router.confidence_reason(40) == "confianza_baja"
+    assert model_router.confidence_reason(90) is None
+    assert model_router.score_reason({"score": "n/a"}) == "json_invalido"
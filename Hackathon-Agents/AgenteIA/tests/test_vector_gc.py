@@ -0,0 +1,44 @@
+import numpy as np
+
+from rag.vector_gc import find_garbage
+from rag.vector_store import NumpyCollection
+
+NAME = "CONTRATO DE SUMINISTRO DE BANANO1.pdf"
+
+
+def _collection(tmp_path, items):
+    col = NumpyCollection("contratos", str(tmp_path / "store"))
+    rng = np.random.default_rng(0)
+    col.add(
+        ids=[i for i, _, _ in items],
+        embeddings=rng.normal(size=(len(items), 8)).tolist(),
+        documents=[d for _, d, _ in items],
+        metadatas=[m for _, _, m in items],
+    )
+    return col
+
+
+def test_same_filename_in_different_tenders_is_not_duplicate(tmp_path):
+    paths = {}
+    for lic in ("lic1", "lic2"):
+        f = tmp_path / "data" / lic / NAME
+        f.parent.mkdir(parents=True)
+        f.write_bytes(b"%PDF")
+        paths[lic] = str(f)
+    text = "Plazo de entrega: 30 días calendario."
+    col = _collection(tmp_path, [
+        ("a", text, {"source": NAME, "path": paths["lic1"], "licitacion_id": "lic1"}),
+        ("b", text, {"source": NAME, "path": paths["lic2"], "licitacion_id": "lic2"}),
+        # Re-ingesta del mismo archivo de lic1: este sí es duplicado
+        ("c", text, {"source": NAME, "path": paths["lic1"], "licitacion_id": "lic1"}),
+    ])
+    garbage = find_garbage(col)
+    assert garbage["duplicados"] == ["c"]
+    assert garbage["huerfanos"] == []
+
+
+def test_missing_source_is_orphan(tmp_path):
+    col = _collection(tmp_path, [
+        ("a", "texto", {"source": NAME, "path": str(tmp_path / "no_existe" / NAME), "licitacion_id": "lic1"}),
+    ])
+    assert find_garbage(col)["huerfanos"] == ["a"]
@@ -0,0 +1,45 @@
+import os
+import json
+import hashlib
+import uuid
+from typing import Dict, Any, Iterable, Optional
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join(BASE_DIR, "cache", "analisis"))
+
+
+def hash_parts(parts: Iterable[Any]) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p if p is not None else "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def make_key(proposal_hash: str, pliego_set_hash: str, fingerprint: str) -> str:
+    # (hash propuesta, hash del conjunto de pliegos, modelo + versión de prompts)
+    return hash_parts([proposal_hash, pliego_set_hash, fingerprint])
+
+
+def _path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def load(key: str) -> Optional[Dict[str, Any]]:
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save(key: str, data: Dict[str, Any]):
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
@@ -0,0 +1,145 @@
+"""Contabilidad de tokens por corrida de análisis y degradación por presupuesto.
+
+Cada respuesta con `resp.usage` registrada vía `tracing.record_usage` se carga a
+la corrida activa (ver `start`). Si la corrida tiene límite, el nivel de
+degradación sube por etapas a medida que se acerca al presupuesto:
+
+  0 normal
+  1 contextos reducidos (menos texto de propuesta y de RAG)
+  2 modelo económico (MODEL_ECONOMICO)
+  3 fallback determinístico (sin llamadas al LLM)
+"""
+import os
+import threading
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+from utils import tracing
+
+MODEL_ECONOMICO = os.environ.get("MODEL_ECONOMICO", "gpt-4.1-nano")
+# Fracción del presupuesto a partir de la cual se activa cada nivel (1, 2, 3)
+LEVELS = tuple(float(x) for x in os.environ.get("BUDGET_LEVELS", "0.6,0.8,0.95").split(","))
+
+NIVELES = {0: "normal", 1: "contexto_reducido", 2: "modelo_economico", 3: "deterministico"}
+
+
+class TokenBudget:
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = int(limit) if limit else None
+        self._lock = threading.Lock()
+        self.prompt = 0
+        self.completion = 0
+        self.by_stage: Dict[str, Dict[str, int]] = {}
+        self.max_level = 0
+
+    @property
+    def used(self) -> int:
+        return self.prompt + self.completion
+
+    def charge(self, stage: str, prompt: int, completion: int):
+        with self._lock:
+            self.prompt += prompt
+            self.completion += completion
+            st = self.by_stage.setdefault(stage, {"llamadas": 0, "prompt": 0, "completion": 0})
+            st["llamadas"] += 1
+            st["prompt"] += prompt
+            st["completion"] += completion
+
+    def level(self) -> int:
+        if not self.limit:
+            return 0
+        ratio = self.used / self.limit
+        lvl = sum(1 for th in LEVELS if ratio >= th)
+        self.max_level = max(self.max_level, lvl)
+        return lvl
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limite": self.limit,
+                "prompt": self.prompt,
+                "completion": self.completion,
+                "total": self.used,
+                "por_etapa": {k: dict(v) for k, v in sorted(self.by_stage.items())},
+                "degradacion_maxima": NIVELES[self.max_level],
+            }
+
+
+_current: ContextVar[Optional[TokenBudget]] = ContextVar("agenteia_budget", default=None)
+
+
+def _on_usage(stage: str, prompt: int, completion: int):
+    b = _current.get()
+    if b is not None:
+        b.charge(stage, prompt, completion)
+
+
+tracing.on_usage(_on_usage)
+
+
+def start(limit: Optional[int] = None):
+    return _current.set(TokenBudget(limit))
+
+
+def finish(token) -> Dict[str, Any]:
+    b = _current.get()
+    _current.reset(token)
+    return b.to_dict() if b is not None else {}
+
+
+def level() -> int:
+    b = _current.get()
+    return b.level() if b is not None else 0
+
+
+# ============ Decisiones para los agentes ============
+
+def model_for(default: str) -> str:
+    return MODEL_ECONOMICO if level() >= 2 else default
+
+
+def deterministic() -> bool:
+    return level() >= 3
+
+
+def context_limits(proposal_chars: int = 6000, item_chars: int = 1200) -> Tuple[int, Optional[int], int]:
+    """(caracteres de propuesta, máx. items de contexto, caracteres por item)."""
+    if level() >= 1:
+        return proposal_chars // 2, 6, item_chars // 2
+    return proposal_chars, None, item_chars
+
+
+def trim_context(ctx_items: List[Dict], max_items: Optional[int]) -> List[Dict]:
+    return ctx_items[:max_items] if max_items else ctx_items
+
+
+def fallback_result(where: str) -> Dict[str, Any]:
+    return {
+        "issues": [{
+            "type": "presupuesto_tokens",
+            "where": where,
+            "evidence": "Análisis con LLM omitido: la corrida alcanzó su presupuesto de tokens.",
+            "severity": "BAJO",
+            "recommendation": "Ampliar el presupuesto de tokens y volver a analizar.",
+        }],
+        # Sin score: el agregador lo completa y lo marca como faltante (un 50 fijo sesgaría el ranking)
+        "score": None,
+        "degradado": True,
+    }
+
+
+def add_usage(acc: Optional[Dict[str, Any]], run: Dict[str, Any], origen: str) -> Dict[str, Any]:
+    """Acumula el uso de una corrida (análisis, chat...) en el total por licitación."""
+    def _sum(dst: Dict[str, Any]) -> Dict[str, Any]:
+        dst = dict(dst or {})
+        dst["prompt"] = int(dst.get("prompt", 0)) + int(run.get("prompt", 0))
+        dst["completion"] = int(dst.get("completion", 0)) + int(run.get("completion", 0))
+        dst["total"] = dst["prompt"] + dst["completion"]
+        dst["corridas"] = int(dst.get("corridas", 0)) + 1
+        return dst
+
+    acc = _sum(acc or {})
+    por_origen = dict(acc.get("por_origen") or {})
+    por_origen[origen] = _sum(por_origen.get(origen))
+    acc["por_origen"] = por_origen
+    return acc
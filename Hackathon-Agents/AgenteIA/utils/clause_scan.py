@@ -0,0 +1,161 @@
+"""Pre-filtro de cláusulas legales con un autómata Aho-Corasick.
+
+Un solo recorrido del texto completo (sin tildes, minúsculas) encuentra todas
+las pistas del diccionario a la vez, en tiempo lineal en el largo del texto más
+la cantidad de coincidencias. Cada coincidencia se amplía a su oración; las
+oraciones solapadas se fusionan en tramos. Las cláusulas obligatorias sin
+ninguna pista quedan como faltantes.
+"""
+from collections import deque
+from typing import Dict, Any, List, Tuple
+
+from utils.report_index import fold
+
+# Cláusula -> pistas (se comparan sin tildes y en minúsculas, con límites de palabra)
+CLAUSE_CUES: Dict[str, List[str]] = {
+    "garantias": [
+        "garantía de fiel cumplimiento", "garantía de buen uso del anticipo", "garantía técnica",
+        "garantía", "garantías", "póliza", "fianza", "carta de crédito",
+    ],
+    "multas": [
+        "multa", "multas", "penalidad", "penalidades", "penalización", "sanción", "sanciones",
+        "cláusula penal", "por cada día de retraso", "por cada día de retardo",
+    ],
+    "plazos": [
+        "plazo de ejecución", "plazo de entrega", "plazo contractual", "plazo total", "plazo",
+        "cronograma", "días calendario", "días hábiles", "vigencia del contrato", "fecha de entrega",
+    ],
+}
+REQUIRED = ("garantias", "multas", "plazos")
+LEFT_CHARS = 200
+RIGHT_CHARS = 300
+_LABELS = {"garantias": "garantías", "multas": "multas", "plazos": "plazos"}
+
+
+class Automaton:
+    """Aho-Corasick sobre caracteres: trie + enlaces de falla + salidas acumuladas."""
+
+    def __init__(self, patterns: List[Tuple[str, Any]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[Tuple[int, Any]]] = [[]]
+        for word, payload in patterns:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append((len(word), payload))
+        # Enlaces de falla por BFS; cada nodo hereda las salidas de su sufijo más largo
+        q = deque(self.goto[0].values())
+        while q:
+            node = q.popleft()
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                q.append(nxt)
+
+    def iter(self, text: str):
+        """(inicio, fin, payload) de cada coincidencia."""
+        node = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, payload in out[node]:
+                yield i - length + 1, i + 1, payload
+
+
+def _build() -> Automaton:
+    return Automaton([(fold(cue), (clause, cue)) for clause, cues in CLAUSE_CUES.items() for cue in cues])
+
+
+_automaton = _build()
+
+
+def _bounded(folded: str, start: int, end: int) -> bool:
+    before = folded[start - 1] if start > 0 else " "
+    after = folded[end] if end < len(folded) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def _sentence(text: str, start: int, end: int) -> Tuple[int, int]:
+    left = max(text.rfind(".", max(0, start - LEFT_CHARS), start), text.rfind("\n", max(0, start - LEFT_CHARS), start))
+    s = left + 1 if left >= 0 else max(0, start - LEFT_CHARS)
+    stops = [p for p in (text.find(".", end, end + RIGHT_CHARS), text.find("\n", end, end + RIGHT_CHARS)) if p >= 0]
+    e = min(stops) + 1 if stops else min(len(text), end + RIGHT_CHARS)
+    return s, e
+
+
+def scan(text: str) -> Dict[str, Any]:
+    """Tramos con cláusulas, pistas encontradas por cláusula y cláusulas obligatorias faltantes."""
+    text = text or ""
+    folded = fold(text)
+    hits = []
+    found: Dict[str, List[str]] = {c: [] for c in CLAUSE_CUES}
+    for start, end, (clause, cue) in _automaton.iter(folded):
+        if not _bounded(folded, start, end):
+            continue
+        hits.append((start, end, clause))
+        if cue not in found[clause]:
+            found[clause].append(cue)
+    # Oraciones de cada pista, fusionadas cuando se solapan
+    spans: List[Dict[str, Any]] = []
+    for start, end, clause in sorted(hits):
+        s, e = _sentence(text, start, end)
+        if spans and s <= spans[-1]["fin"]:
+            last = spans[-1]
+            last["fin"] = max(last["fin"], e)
+            if clause not in last["clausulas"]:
+                last["clausulas"].append(clause)
+        else:
+            spans.append({"inicio": s, "fin": e, "clausulas": [clause]})
+    for sp in spans:
+        sp["texto"] = " ".join(text[sp["inicio"]:sp["fin"]].split())
+    return {
+        "tramos": spans,
+        "encontradas": {c: cues for c, cues in found.items() if cues},
+        "faltantes": [c for c in REQUIRED if not found.get(c)],
+    }
+
+
+def missing_issues(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Un issue por cláusula obligatoria sin ninguna pista en todo el documento."""
+    issues = []
+    for clause in result.get("faltantes", []):
+        label = _LABELS.get(clause, clause)
+        issues.append({
+            "type": f"Cláusula de {label} no encontrada",
+            "where": "documento completo",
+            "evidence": f"Ninguna mención de: {', '.join(CLAUSE_CUES[clause][:6])}.",
+            "severity": "ALTO",
+            "recommendation": f"Solicitar al oferente que incluya o ratifique las condiciones de {label} exigidas en el pliego.",
+            "origen": "reglas",
+        })
+    return issues
+
+
+def format_spans(result: Dict[str, Any], max_chars: int) -> str:
+    """Tramos para el prompt, en orden del documento, hasta `max_chars`."""
+    out, used = [], 0
+    for sp in result.get("tramos", []):
+        line = f"[{', '.join(sp['clausulas'])} | pos {sp['inicio']}-{sp['fin']}] {sp['texto']}"
+        if used + len(line) > max_chars:
+            break
+        out.append(line)
+        used += len(line) + 1
+    return "\n".join(out)
+
+
+def settings():
+    return (sorted((c, tuple(v)) for c, v in CLAUSE_CUES.items()), REQUIRED)
@@ -0,0 +1,187 @@
+"""Extracción determinística de montos, porcentajes y plazos de una propuesta.
+
+Regex compiladas sobre el texto original; cada hecho lleva su posición
+(inicio, fin) y la clase que sugiere el contexto previo (anticipo, garantía,
+total de la oferta, plazo de ejecución...). Sobre esos hechos se detectan sin
+LLM las violaciones evidentes: oferta sobre el presupuesto referencial,
+anticipo sobre el máximo y garantía de fiel cumplimiento bajo el mínimo.
+"""
+import os
+import re
+from typing import Dict, Any, List, Optional
+
+from utils.report_index import fold
+
+# Límites (LOSNCP y su reglamento); configurables por entorno
+ANTICIPO_MAX_PCT = float(os.environ.get("ANTICIPO_MAX_PCT", "50"))
+GARANTIA_FIEL_MIN_PCT = float(os.environ.get("GARANTIA_FIEL_MIN_PCT", "5"))
+CONTEXT_CHARS = 80
+
+_NUM = r"\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?"
+AMOUNT_REGEX = re.compile(
+    rf"(?:US\s?\$|USD\s?\$?|\$)\s?(?P<pre>{_NUM})"
+    rf"|(?P<post>{_NUM})\s?(?:USD\b|d[oó]lares\b)",
+    re.IGNORECASE,
+)
+PERCENT_REGEX = re.compile(r"(?P<num>\d{1,3}(?:[.,]\d{1,2})?)\s?(?:%|por\s?ciento\b)", re.IGNORECASE)
+TERM_REGEX = re.compile(
+    r"(?P<num>\d{1,4})\s*(?:\([^)\d]{1,40}\)\s*)?"
+    r"(?P<unit>d[ií]as?(?:\s+(?:calendario|h[aá]biles|laborables))?|mes(?:es)?|semanas?|años?)\b",
+    re.IGNORECASE,
+)
+
+# Clase del hecho según las palabras que lo preceden (texto sin tildes, minúsculas)
+_CLASSES = [
+    ("anticipo", re.compile(r"anticipo")),
+    ("garantia_fiel", re.compile(r"fiel cumplimiento")),
+    ("garantia", re.compile(r"garantia|poliza")),
+    ("multa", re.compile(r"multa|sancion|penalidad")),
+    ("iva", re.compile(r"\biva\b|impuesto")),
+    ("plazo_ejecucion", re.compile(r"plazo de (?:ejecucion|entrega)|plazo total|tiempo de (?:ejecucion|entrega)")),
+    ("plazo_pago", re.compile(r"pago|factura|planilla")),
+    ("vigencia", re.compile(r"vigencia|validez")),
+    # El presupuesto referencial citado en la propuesta no es el valor de la oferta
+    ("presupuesto", re.compile(r"presupuesto")),
+    ("total", re.compile(r"valor total|monto total|precio total|total de la (?:oferta|propuesta)|oferta economica|valor de la oferta|suma de")),
+]
+_DAYS_PER = {"d": 1, "s": 7, "m": 30, "a": 365}
+
+
+def parse_amount(s: str) -> Optional[float]:
+    """'1.234.567,89', '1,234,567.89', '1 234', '850,5' -> float."""
+    s = re.sub(r"\s", "", s or "")
+    if not s:
+        return None
+    last_dot, last_comma = s.rfind("."), s.rfind(",")
+    dec = None
+    if last_dot >= 0 and last_comma >= 0:
+        dec = "," if last_comma > last_dot else "."
+    elif last_comma >= 0 or last_dot >= 0:
+        sep = "," if last_comma >= 0 else "."
+        # Un solo separador con 1-2 decimales es decimal; con grupos de 3 es de miles
+        if len(s) - s.rfind(sep) - 1 in (1, 2) and s.count(sep) == 1:
+            dec = sep
+    if dec:
+        whole, frac = s.rsplit(dec, 1)
+        s = re.sub(r"[.,]", "", whole) + "." + frac
+    else:
+        s = re.sub(r"[.,]", "", s)
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _classify(folded: str, start: int) -> str:
+    window = folded[max(0, start - CONTEXT_CHARS):start]
+    # La palabra clave más cercana al número decide
+    best, best_pos = "otro", -1
+    for name, rx in _CLASSES:
+        for m in rx.finditer(window):
+            if m.start() > best_pos:
+                best, best_pos = name, m.start()
+    return best
+
+
+def _snippet(text: str, start: int, end: int) -> str:
+    return " ".join(text[max(0, start - CONTEXT_CHARS):min(len(text), end + 40)].split())
+
+
+def extract_facts(text: str) -> List[Dict[str, Any]]:
+    """Montos (USD), porcentajes y plazos (en días) con su clase, posición y contexto."""
+    text = text or ""
+    folded = fold(text)
+    facts: List[Dict[str, Any]] = []
+    for m in AMOUNT_REGEX.finditer(text):
+        value = parse_amount(m.group("pre") or m.group("post"))
+        if value is None:
+            continue
+        facts.append({"tipo": "monto", "clase": _classify(folded, m.start()), "valor": value, "unidad": "USD",
+                      "texto": m.group(0).strip(), "inicio": m.start(), "fin": m.end()})
+    for m in PERCENT_REGEX.finditer(text):
+        value = parse_amount(m.group("num"))
+        if value is None or value > 100:
+            continue
+        facts.append({"tipo": "porcentaje", "clase": _classify(folded, m.start()), "valor": value, "unidad": "%",
+                      "texto": m.group(0), "inicio": m.start(), "fin": m.end()})
+    for m in TERM_REGEX.finditer(text):
+        n = int(m.group("num"))
+        unit = fold(m.group("unit"))
+        facts.append({"tipo": "plazo", "clase": _classify(folded, m.start()), "valor": n * _DAYS_PER[unit[0]],
+                      "unidad": "dias", "habiles": "habil" in unit, "texto": m.group(0), "inicio": m.start(), "fin": m.end()})
+    facts.sort(key=lambda f: f["inicio"])
+    for f in facts:
+        f["contexto"] = _snippet(text, f["inicio"], f["fin"])
+    return facts
+
+
+def _money(v: float) -> str:
+    return f"${v:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _issue(f: Dict[str, Any], type_: str, severity: str, evidence: str, recommendation: str) -> Dict[str, Any]:
+    return {
+        "type": type_,
+        "where": f"posición {f['inicio']}-{f['fin']}",
+        "evidence": f"{evidence} «{f['contexto']}»",
+        "severity": severity,
+        "recommendation": recommendation,
+        "origen": "reglas",
+    }
+
+
+def check_facts(facts: List[Dict[str, Any]], presupuesto: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Violaciones claras detectadas sin LLM."""
+    issues = []
+    totals = [f for f in facts if f["tipo"] == "monto" and f["clase"] == "total"]
+    total = max(totals, key=lambda f: f["valor"]) if totals else None
+    if presupuesto and total and total["valor"] > presupuesto:
+        exceso = (total["valor"] / presupuesto - 1) * 100
+        issues.append(_issue(
+            total, "Oferta sobre el presupuesto referencial", "ALTO",
+            f"Valor de la oferta {_money(total['valor'])} supera el presupuesto {_money(presupuesto)} en {exceso:.1f}%.",
+            "La oferta no puede superar el presupuesto referencial; solicitar aclaración o descalificar.",
+        ))
+    # Anticipo en % o en monto relativo al total; se reporta el mayor una sola vez
+    anticipos = []
+    for f in facts:
+        if f["clase"] != "anticipo":
+            continue
+        if f["tipo"] == "porcentaje":
+            anticipos.append((f["valor"], f))
+        elif f["tipo"] == "monto" and total and total["valor"] > 0:
+            anticipos.append((f["valor"] / total["valor"] * 100, f))
+    if anticipos:
+        pct, f = max(anticipos, key=lambda a: a[0])
+        if pct > ANTICIPO_MAX_PCT:
+            issues.append(_issue(
+                f, "Anticipo sobre el máximo permitido", "ALTO",
+                f"Anticipo de {pct:.1f}% supera el máximo de {ANTICIPO_MAX_PCT:g}%.",
+                f"Reducir el anticipo a un máximo de {ANTICIPO_MAX_PCT:g}% del valor del contrato.",
+            ))
+    for f in facts:
+        if f["tipo"] == "porcentaje" and f["clase"] == "garantia_fiel" and f["valor"] < GARANTIA_FIEL_MIN_PCT:
+            issues.append(_issue(
+                f, "Garantía de fiel cumplimiento insuficiente", "MEDIO",
+                f"Garantía de fiel cumplimiento de {f['valor']:g}% bajo el mínimo de {GARANTIA_FIEL_MIN_PCT:g}%.",
+                f"Exigir garantía de fiel cumplimiento de al menos {GARANTIA_FIEL_MIN_PCT:g}% del monto del contrato.",
+            ))
+    return issues
+
+
+def format_facts(facts: List[Dict[str, Any]], max_facts: int = 60) -> str:
+    """Hechos en líneas compactas para el prompt del validador económico."""
+    lines = []
+    for f in facts[:max_facts]:
+        if f["tipo"] == "monto":
+            val = _money(f["valor"])
+        elif f["tipo"] == "porcentaje":
+            val = f"{f['valor']:g}%"
+        else:
+            val = f"{f['valor']:g} días" + (" hábiles" if f.get("habiles") else "")
+        lines.append(f"- [{f['tipo']}/{f['clase']}] {val} (pos {f['inicio']}): «{f['contexto']}»")
+    return "\n".join(lines)
+
+
+def settings():
+    return (ANTICIPO_MAX_PCT, GARANTIA_FIEL_MIN_PCT, CONTEXT_CHARS, tuple((n, rx.pattern) for n, rx in _CLASSES))
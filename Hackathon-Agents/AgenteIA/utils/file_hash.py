@@ -0,0 +1,14 @@
+import hashlib
+
+HASH_CHUNK = 1024 * 1024
+
+
+def sha256_file(path: str, chunk_size: int = HASH_CHUNK) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
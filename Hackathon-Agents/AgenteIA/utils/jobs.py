@@ -0,0 +1,97 @@
+import threading
+import queue
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+
+class JobQueue:
+    """Cola de trabajos en segundo plano con hilos worker y estado consultable.
+
+    Cada trabajo pasa por: pendiente -> en_proceso -> completado | error.
+    Se conserva un historial acotado para los endpoints de estado.
+    """
+
+    def __init__(self, name: str, workers: int = 1, history: int = 500):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.history = history
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._fns: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_workers(self):
+        # Bajo el lock: dos submit simultáneos no deben arrancar workers duplicados
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _loop(self):
+        while True:
+            job_id = self._q.get()
+            if job_id is None:
+                break
+            with self._lock:
+                job = self._jobs.get(job_id)
+                fn, args, kwargs = self._fns.pop(job_id, (None, (), {}))
+            if job is None or fn is None:
+                continue
+            job["estado"] = "en_proceso"
+            job["inicio"] = datetime.utcnow().isoformat()
+            try:
+                job["resultado"] = fn(*args, **kwargs)
+                job["estado"] = "completado"
+            except Exception as e:
+                job["estado"] = "error"
+                job["error"] = str(e)
+                print(f"[{self.name}] Error en trabajo {job_id}: {e}")
+            finally:
+                job["fin"] = datetime.utcnow().isoformat()
+
+    def submit(self, fn: Callable, *args, key: Optional[str] = None, **kwargs) -> str:
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "key": key,
+            "estado": "pendiente",
+            "creado": datetime.utcnow().isoformat(),
+            "inicio": None,
+            "fin": None,
+            "error": None,
+            "resultado": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._fns[job_id] = (fn, args, kwargs)
+            # Recortar historial de trabajos terminados
+            while len(self._jobs) > self.history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest["estado"] in ("pendiente", "en_proceso"):
+                    break
+                self._jobs.pop(oldest_id)
+        self._ensure_workers()
+        self._q.put(job_id)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs_for(self, key: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(j) for j in self._jobs.values() if j.get("key") == key]
+
+    def pending(self, key: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(
+                1 for j in self._jobs.values()
+                if j["estado"] in ("pendiente", "en_proceso") and (key is None or j.get("key") == key)
+            )
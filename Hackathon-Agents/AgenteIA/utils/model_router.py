@@ -0,0 +1,118 @@
+"""Cascada de modelos por agente: primero un modelo chico, se escala solo si hace falta.
+
+Cada agente (validator_legal, validator_tech, ..., ruc_relatedness) tiene una ruta
+(modelo inicial, modelo de escalamiento). La respuesta del modelo inicial se
+acepta salvo que:
+
+  - el JSON sea inválido o no cumpla el esquema -> "json_invalido"
+  - la confianza (relación RUC) sea baja        -> "confianza_baja"
+  - el score caiga en la banda incierta         -> "score_incierto"
+
+La banda es angosta (55-65, alrededor del umbral de riesgo ALTO/MEDIO): los
+scores de los validadores se concentran en la zona media y una banda ancha
+haría pagar los dos modelos en casi todas las llamadas.
+
+Con presupuesto de tokens en nivel 2+ no se escala: se usa solo el modelo
+económico (ver utils.budget). Cada decisión queda en el resultado del agente
+(`ruteo`) y en la métrica `agenteia_model_routes_total`.
+
+Configuración:
+  MODEL_ROUTER=0                 desactiva la cascada (solo el modelo del agente)
+  ROUTER_MODEL_SMALL             modelo inicial por defecto
+  MODEL_ROUTES                   "agente=inicial>escalamiento,..." (p. ej. validator_legal=gpt-4.1-mini>gpt-4o)
+  ROUTER_SCORE_BAND              "55,65": scores dentro de la banda se escalan; vacío = no se escala por score
+  ROUTER_MIN_CONFIDENCE          60: confianza (0-100) mínima para aceptar sin escalar
+"""
+import os
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from utils import tracing, budget
+
+ROUTER_ENABLED = os.environ.get("MODEL_ROUTER", "1") != "0"
+MODEL_SMALL = os.environ.get("ROUTER_MODEL_SMALL", "gpt-4.1-nano")
+SCORE_BAND = tuple(float(x) for x in os.environ.get("ROUTER_SCORE_BAND", "55,65").split(",") if x.strip()) or None
+MIN_CONFIDENCE = float(os.environ.get("ROUTER_MIN_CONFIDENCE", "60"))
+
+
+def _parse_routes(spec: str) -> Dict[str, Tuple[str, str]]:
+    routes = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        stage, models = part.split("=", 1)
+        small, _, large = models.partition(">")
+        if small.strip():
+            routes[stage.strip()] = (small.strip(), (large or small).strip())
+    return routes
+
+
+ROUTES = _parse_routes(os.environ.get("MODEL_ROUTES", ""))
+
+
+def models_for(stage: str, default_model: str) -> List[str]:
+    """Modelos a probar en orden para un agente."""
+    if budget.level() >= 2 or not ROUTER_ENABLED:
+        return [budget.model_for(default_model)]
+    small, large = ROUTES.get(stage, (MODEL_SMALL, default_model))
+    return [small] if small == large else [small, large]
+
+
+def score_reason(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Motivo para escalar la respuesta de un validador (None = se acepta)."""
+    if not isinstance(data, dict):
+        return "json_invalido"
+    try:
+        score = float(data.get("score"))
+    except (TypeError, ValueError):
+        return "json_invalido"
+    if SCORE_BAND and SCORE_BAND[0] <= score <= SCORE_BAND[-1]:
+        return "score_incierto"
+    return None
+
+
+def confidence_reason(confidence: Any) -> Optional[str]:
+    try:
+        return "confianza_baja" if float(confidence) < MIN_CONFIDENCE else None
+    except (TypeError, ValueError):
+        return "confianza_baja"
+
+
+def cascade(stage: str, default_model: str, call: Callable[[str], Any],
+            check: Callable[[Any], Optional[str]] = score_reason) -> Tuple[Any, Dict[str, Any]]:
+    """Llama `call(modelo)` con cada modelo de la ruta hasta que `check` acepte la respuesta.
+
+    Devuelve (respuesta, ruteo). Si el último modelo tampoco pasa `check`, su
+    respuesta se devuelve igual (el agente decide cómo degradar), salvo que sea
+    JSON inválido y una anterior sí se haya podido leer.
+    """
+    models = models_for(stage, default_model)
+    intentos = []
+    result, readable, used = None, None, None
+    for model in models:
+        result = call(model)
+        reason = check(result)
+        tracing.record_route(stage, model, reason or "aceptado")
+        intentos.append({"modelo": model, "motivo": reason})
+        used = model
+        if reason is None:
+            break
+        if reason != "json_invalido":
+            readable = (result, model)
+    if intentos[-1]["motivo"] == "json_invalido" and readable is not None:
+        result, used = readable
+    return result, summary(stage, intentos, used)
+
+
+def summary(stage: str, intentos: List[Dict[str, Any]], used: Optional[str] = None) -> Dict[str, Any]:
+    """Registro de ruteo de un agente: modelo cuya respuesta se usó y por qué se escaló."""
+    return {
+        "agente": stage,
+        "modelo": used or intentos[-1]["modelo"],
+        "escalado": len(intentos) > 1,
+        "motivo": intentos[0]["motivo"] if len(intentos) > 1 else None,
+        "intentos": intentos,
+    }
+
+
+def settings():
+    return (ROUTER_ENABLED, MODEL_SMALL, sorted(ROUTES.items()), SCORE_BAND, MIN_CONFIDENCE)
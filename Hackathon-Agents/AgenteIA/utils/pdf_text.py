@@ -1,5 +1,14 @@
+import threading
+from typing import List, Optional
+
 from pypdf import PdfReader
 
+from utils import tracing
+
+PAGE_SEP = "\n\n"
+
+
+@tracing.traced("pdf_to_text")
 def pdf_to_text(path: str) -> str:
     reader = PdfReader(path)
     texts = []
@@ -8,4 +17,83 @@ def pdf_to_text(path: str) -> str:
             texts.append(page.extract_text() or "")
         except Exception:
             texts.append("")
-    return "\n\n".join(texts)
\ No newline at end of file
+    return "\n\n".join(texts)
+
+
+class LazyPdfDocument:
+    """PDF que extrae páginas solo a medida que se necesitan.
+
+    `excerpt(n)` devuelve lo mismo que `pdf_to_text(path)[:n]` pero decodifica
+    únicamente las primeras páginas necesarias. El texto completo se obtiene
+    con `text` (bajo demanda) o se adelanta en segundo plano con `prefetch()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reader: Optional[PdfReader] = None
+        self._pages: List[str] = []
+        self._chars = 0  # largo de PAGE_SEP.join(self._pages)
+        self._total: Optional[int] = None
+        self._bg: Optional[threading.Thread] = None
+
+    def _open(self) -> PdfReader:
+        if self._reader is None:
+            self._reader = PdfReader(self.path)
+            self._total = len(self._reader.pages)
+        return self._reader
+
+    def _extract_next(self) -> bool:
+        # Una página por vez bajo el lock: el prefetch y los extractos se intercalan
+        with self._lock:
+            reader = self._open()
+            i = len(self._pages)
+            if i >= self._total:
+                return False
+            try:
+                page = reader.pages[i].extract_text() or ""
+            except Exception:
+                page = ""
+            self._chars += len(page) + (len(PAGE_SEP) if i else 0)
+            self._pages.append(page)
+            return True
+
+    @property
+    def complete(self) -> bool:
+        return self._total is not None and len(self._pages) >= self._total
+
+    def excerpt(self, n_chars: int) -> str:
+        with tracing.span("pdf_excerpt"):
+            while self._chars < n_chars and self._extract_next():
+                pass
+        return PAGE_SEP.join(self._pages)[:n_chars]
+
+    def first_words(self, n: int) -> str:
+        # ~15 caracteres por palabra alcanza de sobra; si no, se extrae todo
+        words = self.excerpt(n * 15).split()
+        if len(words) < n and not self.complete:
+            words = self.text.split()
+        return " ".join(words[:n])
+
+    @property
+    def text(self) -> str:
+        if self._bg is not None:
+            self._bg.join()
+        with tracing.span("pdf_to_text"):
+            self._extract_all()
+        return PAGE_SEP.join(self._pages)
+
+    def _extract_all(self):
+        while self._extract_next():
+            pass
+
+    def prefetch(self) -> "LazyPdfDocument":
+        """Decodifica el resto del documento en un hilo de fondo."""
+        if self._bg is None and not self.complete:
+            self._bg = threading.Thread(target=self._extract_all, name="pdf-prefetch", daemon=True)
+            self._bg.start()
+        return self
+
+
+def open_document(path: str) -> LazyPdfDocument:
+    return LazyPdfDocument(path)
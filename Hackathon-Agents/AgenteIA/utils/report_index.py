@@ -0,0 +1,202 @@
+"""Índices precalculados por reporte para filtrar y paginar hallazgos.
+
+Al guardar `reporte_<id>.json` se escribe al lado `reporte_<id>.idx.json` con
+los hallazgos aplanados y listas de posiciones (postings) por severidad,
+categoría, documento y palabra. Una consulta intersecta postings y corta una
+página con un cursor, sin recorrer el reporte. El índice se reconstruye solo
+si falta o si el reporte cambió (tamaño + mtime), y se mantiene en memoria.
+"""
+import os
+import re
+import json
+import uuid
+import base64
+import bisect
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence
+
+INDEX_VERSION = 2
+# Índices en memoria (LRU por reporte)
+MAX_CACHED = int(os.environ.get("REPORT_INDEX_CACHE", "32"))
+MAX_PAGE = 500
+
+# Sinónimos que devuelven los modelos (colores, inglés, femenino)
+# Solo palabras completas y colores: una letra suelta es ambigua ("A" = ALTO o amarillo)
+_SEVERITY = {
+    "ROJO": "ALTO", "ALTA": "ALTO", "HIGH": "ALTO", "RED": "ALTO",
+    "AMARILLO": "MEDIO", "MEDIA": "MEDIO", "MEDIUM": "MEDIO", "AMBER": "MEDIO", "AMBAR": "MEDIO", "MODERADA": "MEDIO",
+    "VERDE": "BAJO", "BAJA": "BAJO", "LOW": "BAJO", "GREEN": "BAJO",
+}
+_WORD = re.compile(r"\w{2,}")
+_TEXT_FIELDS = ("type", "evidence", "recommendation", "where", "category")
+
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize(text: Any) -> str:
+    # minúsculas y sin tildes: "Garantía" y "garantia" son la misma palabra
+    s = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+
+def fold(text: str) -> str:
+    """Minúsculas sin tildes con la misma longitud que `text` (las posiciones siguen valiendo).
+
+    Carácter por carácter, porque lower() puede expandir alguno ("İ" -> "i̇").
+    """
+    return "".join(unicodedata.normalize("NFD", c.lower())[0] for c in (text or ""))
+
+
+def severity_key(value: Any) -> str:
+    s = normalize(value).strip().upper()
+    return _SEVERITY.get(s, s)
+
+
+def words(text: Any) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def index_path(rep_path: str) -> str:
+    return os.path.splitext(rep_path)[0] + ".idx.json"
+
+
+def _stamp(rep_path: str) -> str:
+    st = os.stat(rep_path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+# ============ Construcción ============
+
+def build_index(report: Dict[str, Any], stamp: str = "") -> Dict[str, Any]:
+    items: List[Dict[str, Any]] = []
+    postings: Dict[str, Dict[str, List[int]]] = {"severity": {}, "category": {}, "documento": {}}
+    texto: Dict[str, List[int]] = {}
+    for r in report.get("results", []) or []:
+        doc = r.get("file")
+        for it in (r.get("report") or {}).get("issues", []) or []:
+            pos = len(items)
+            items.append({**it, "documento": doc})
+            postings["severity"].setdefault(severity_key(it.get("severity")), []).append(pos)
+            postings["category"].setdefault(normalize(it.get("category")), []).append(pos)
+            postings["documento"].setdefault(str(doc), []).append(pos)
+            for w in set(words(" ".join(str(it.get(f) or "") for f in _TEXT_FIELDS))):
+                texto.setdefault(w, []).append(pos)
+    facetas = {k: {v: len(ids) for v, ids in vals.items()} for k, vals in postings.items()}
+    return {"version": INDEX_VERSION, "reporte": stamp, "items": items, "postings": postings, "texto": texto, "facetas": facetas}
+
+
+def write_index(rep_path: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """Construye y guarda el índice de un reporte recién escrito."""
+    idx = build_index(report, _stamp(rep_path))
+    path = index_path(rep_path)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(idx, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    _remember(rep_path, idx)
+    return idx
+
+
+def _remember(rep_path: str, idx: Dict[str, Any]):
+    with _lock:
+        _cache[rep_path] = idx
+        _cache.move_to_end(rep_path)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+
+
+def load_index(rep_path: str) -> Dict[str, Any]:
+    stamp = _stamp(rep_path)
+    with _lock:
+        idx = _cache.get(rep_path)
+        if idx is not None and idx.get("reporte") == stamp:
+            _cache.move_to_end(rep_path)
+            return idx
+    try:
+        with open(index_path(rep_path), "r", encoding="utf-8") as f:
+            idx = json.load(f)
+        if idx.get("version") == INDEX_VERSION and idx.get("reporte") == stamp:
+            _remember(rep_path, idx)
+            return idx
+    except (OSError, ValueError):
+        pass
+    # Reportes anteriores al índice, o reescritos por fuera de la API
+    with open(rep_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return write_index(rep_path, report)
+
+
+def forget(rep_path: str):
+    with _lock:
+        _cache.pop(rep_path, None)
+    try:
+        os.remove(index_path(rep_path))
+    except OSError:
+        pass
+
+
+# ============ Cursores ============
+
+def encode_cursor(stamp: str, last: Any) -> str:
+    raw = json.dumps([stamp, last], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, stamp: Optional[str] = None) -> Any:
+    """Posición guardada en el cursor; ValueError si es inválido o de otra versión del reporte."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        got_stamp, last = json.loads(raw)
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if stamp is not None and got_stamp != stamp:
+        raise ValueError("El reporte cambió; vuelve a pedir la primera página")
+    return last
+
+
+# ============ Consultas ============
+
+def _union(postings: Dict[str, List[int]], keys: Sequence[str]) -> List[int]:
+    lists = [postings.get(k, []) for k in keys]
+    if len(lists) == 1:
+        return lists[0]
+    return sorted(set().union(*lists))
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def query(idx: Dict[str, Any], severity: Optional[str] = None, category: Optional[str] = None,
+          documento: Optional[str] = None, q: Optional[str] = None,
+          cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Filtra por severidad/categoría/documento (valores separados por coma = O) y texto (todas las palabras)."""
+    post = idx["postings"]
+    candidates: List[Sequence[int]] = []
+    if severity:
+        candidates.append(_union(post["severity"], [severity_key(s) for s in _split(severity)]))
+    if category:
+        candidates.append(_union(post["category"], [normalize(c) for c in _split(category)]))
+    if documento:
+        candidates.append(_union(post["documento"], _split(documento)))
+    for w in set(words(q)):
+        candidates.append(idx["texto"].get(w, []))
+
+    if not candidates:
+        ids: Sequence[int] = range(len(idx["items"]))
+    else:
+        # Se recorre la lista más corta y se prueba pertenencia en las demás
+        candidates.sort(key=len)
+        others = [set(c) for c in candidates[1:]]
+        ids = [i for i in candidates[0] if all(i in o for o in others)]
+
+    start = 0
+    if cursor:
+        start = bisect.bisect_right(ids, decode_cursor(cursor, idx["reporte"]))
+    end = len(ids) if limit is None else min(start + max(1, min(limit, MAX_PAGE)), len(ids))
+    page = [idx["items"][i] for i in ids[start:end]]
+    next_cursor = encode_cursor(idx["reporte"], ids[end - 1]) if end < len(ids) else None
+    return {"items": page, "total": len(ids), "next_cursor": next_cursor, "facetas": idx["facetas"]}
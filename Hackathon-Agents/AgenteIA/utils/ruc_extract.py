@@ -1,8 +1,84 @@
 import re
-from typing import List
+from typing import List, Tuple
+
+from utils.report_index import fold
 
 RUC_REGEX = re.compile(r"\b\d{13}\b")
 
+# Códigos de provincia válidos (01-24) y 30 para ecuatorianos registrados en el exterior
+PROVINCIAS = set(range(1, 25)) | {30}
+COEF_PUBLICA = (3, 2, 7, 6, 5, 4, 3, 2)
+COEF_PRIVADA = (4, 3, 2, 7, 6, 5, 4, 3, 2)
+
+# Pistas en el texto previo que indican que el número es un RUC
+CUE_REGEX = re.compile(r"r\.?\s*u\.?\s*c\b|registro unico de contribuyente|contribuyente")
+CUE_WINDOW = 60
+
+
+def _mod10(digits: List[int]) -> int:
+    total = 0
+    for i, d in enumerate(digits):
+        v = d * (2 if i % 2 == 0 else 1)
+        total += v - 9 if v > 9 else v
+    return (10 - total % 10) % 10
+
+
+def _mod11(digits: List[int], coefs: Tuple[int, ...]) -> int:
+    r = sum(d * c for d, c in zip(digits, coefs)) % 11
+    return 0 if r == 0 else 11 - r
+
+
+def check_ruc(ruc: str) -> Tuple[bool, bool, str]:
+    """Valida un RUC ecuatoriano de 13 dígitos.
+
+    Retorna (estructura_ok, digito_ok, motivo): estructura_ok cubre provincia,
+    tercer dígito y sufijo de establecimiento; digito_ok el verificador
+    (módulo 10 para personas naturales, módulo 11 para públicas y privadas).
+    """
+    if not re.fullmatch(r"\d{13}", ruc or ""):
+        return False, False, "no tiene 13 dígitos"
+    d = [int(c) for c in ruc]
+    if int(ruc[:2]) not in PROVINCIAS:
+        return False, False, f"código de provincia {ruc[:2]} inválido"
+    tipo = d[2]
+    if tipo < 6:
+        if ruc[10:] != "001":
+            return False, False, "sufijo de establecimiento distinto de 001"
+        return True, _mod10(d[:9]) == d[9], "persona natural"
+    if tipo == 6:
+        if ruc[9:] != "0001":
+            return False, False, "sufijo de entidad pública distinto de 0001"
+        return True, _mod11(d[:8], COEF_PUBLICA) == d[8], "entidad pública"
+    if tipo == 9:
+        if ruc[10:] != "001":
+            return False, False, "sufijo de establecimiento distinto de 001"
+        return True, _mod11(d[:9], COEF_PRIVADA) == d[9], "sociedad privada"
+    return False, False, f"tercer dígito {tipo} inválido"
+
+
+def is_valid_ruc(ruc: str) -> bool:
+    estructura, digito, _ = check_ruc(ruc)
+    return estructura and digito
+
+
+def has_ruc_cue(text: str, start: int) -> bool:
+    return bool(CUE_REGEX.search(fold(text[max(0, start - CUE_WINDOW):start])))
+
 
 def extract_rucs(text: str) -> List[str]:
-    return sorted(set(RUC_REGEX.findall(text or "")))
\ No newline at end of file
+    """RUCs plausibles del texto. Descarta cuentas, teléfonos y códigos de 13 dígitos.
+
+    Se exige estructura válida y dígito verificador correcto; si el verificador
+    no cuadra (p. ej. sociedades con numeración nueva), solo se acepta cuando el
+    texto previo lo rotula explícitamente como RUC.
+    """
+    text = text or ""
+    found = set()
+    for m in RUC_REGEX.finditer(text):
+        ruc = m.group(0)
+        estructura, digito, _ = check_ruc(ruc)
+        if not estructura:
+            continue
+        if digito or has_ruc_cue(text, m.start()):
+            found.add(ruc)
+    return sorted(found)
@@ -0,0 +1,262 @@
+"""Índice invertido entre licitaciones: RUC, razón social, categoría/tipo y severidad de hallazgos.
+
+Cada reporte aporta postings (campo, valor) -> (licitación, documento, n) a un
+SQLite en `db/busqueda.sqlite3`. Se actualiza por licitación después de cada
+análisis (se reemplazan solo sus postings), así que responder "en qué
+licitaciones participó este RUC" o "qué proveedores acumulan hallazgos de
+garantías" no requiere abrir ningún `reporte_*.json`.
+
+Campos:
+  ruc, razon_social          proveedor identificado en el documento
+  categoria, severidad, tipo hallazgos (tipo = palabras del tipo del issue)
+  categoria|SEV, tipo|SEV    los mismos combinados con la severidad del hallazgo
+
+Reconstrucción completa (desde AgenteIA/):
+  python -m utils.search_index --reconstruir
+"""
+import os
+import re
+import json
+import glob
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+from utils.report_index import normalize, severity_key, words
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(BASE_DIR, "db", "busqueda.sqlite3"))
+CAMPOS = ("ruc", "razon_social", "categoria", "severidad", "tipo")
+# Palabras del tipo que no sirven para buscar
+_STOP = {"de", "del", "la", "las", "el", "los", "en", "por", "con", "sin", "para", "una", "uno", "que"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS postings (
+    campo TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    lic_id TEXT NOT NULL,
+    documento TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (campo, valor, lic_id, documento)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (lic_id, documento);
+CREATE TABLE IF NOT EXISTS licitaciones (
+    lic_id TEXT PRIMARY KEY,
+    nombre TEXT,
+    indexado_at TEXT
+);
+"""
+
+_write_lock = threading.Lock()
+_ready = set()
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or SEARCH_INDEX_PATH
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if path not in _ready:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def _ruc_key(ruc: Any) -> str:
+    return re.sub(r"\D", "", str(ruc or ""))
+
+
+def _type_words(text: Any) -> List[str]:
+    return sorted({w for w in words(text) if len(w) > 2 and w not in _STOP})
+
+
+def report_postings(report: Dict[str, Any]) -> List[Tuple[str, str, str, int]]:
+    """[(campo, valor, documento, n)] de un reporte de /analizar."""
+    counts: Counter = Counter()
+    for r in report.get("results", []) or []:
+        doc = str(r.get("file") or "")
+        rep = r.get("report") or {}
+        for rr in rep.get("ruc_reports", []) or []:
+            ruc = _ruc_key(rr.get("ruc"))
+            if ruc:
+                counts[("ruc", ruc, doc)] += 1
+            razon = normalize(rr.get("razon_social")).strip()
+            if razon:
+                counts[("razon_social", razon, doc)] += 1
+        for it in rep.get("issues", []) or []:
+            sev = severity_key(it.get("severity"))
+            cat = normalize(it.get("category")).strip()
+            if sev:
+                counts[("severidad", sev, doc)] += 1
+            if cat:
+                counts[("categoria", cat, doc)] += 1
+                counts[("categoria", f"{cat}|{sev}", doc)] += 1
+            for w in _type_words(it.get("type")):
+                counts[("tipo", w, doc)] += 1
+                counts[("tipo", f"{w}|{sev}", doc)] += 1
+    return [(campo, valor, doc, n) for (campo, valor, doc), n in counts.items()]
+
+
+# ============ Actualización ============
+
+def update_report(lic_id: str, report: Dict[str, Any], nombre: Optional[str] = None, path: Optional[str] = None):
+    """Reemplaza los postings de una licitación por los de su último reporte."""
+    rows = [(campo, valor, lic_id, doc, n) for campo, valor, doc, n in report_postings(report)]
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM postings WHERE lic_id = ?", (lic_id,))
+                conn.executemany("INSERT INTO postings (campo, valor, lic_id, documento, n) VALUES (?, ?, ?, ?, ?)", rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO licitaciones (lic_id, nombre, indexado_at) VALUES (?, ?, ?)",
+                    (lic_id, nombre, datetime.utcnow().isoformat()),
+                )
+        finally:
+            conn.close()
+    return len(rows)
+
+
+def remove_lic(lic_id: str, path: Optional[str] = None):
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM postings WHERE lic_id = ?", (lic_id,))
+                conn.execute("DELETE FROM licitaciones WHERE lic_id = ?", (lic_id,))
+        finally:
+            conn.close()
+
+
+def rebuild(reports_dir: str, nombres: Optional[Dict[str, str]] = None, path: Optional[str] = None) -> Dict[str, int]:
+    """Reindexa todos los `reporte_<id>.json` (p. ej., al crear el índice sobre un historial existente)."""
+    nombres = nombres or {}
+    total = {"licitaciones": 0, "postings": 0}
+    with _write_lock:
+        conn = _connect(path)
+        try:
+            with conn:  # se descartan también licitaciones cuyo reporte ya no existe
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM licitaciones")
+        finally:
+            conn.close()
+    for rep_path in sorted(glob.glob(os.path.join(reports_dir, "reporte_*.json"))):
+        if rep_path.endswith(".idx.json"):
+            continue
+        lic_id = os.path.basename(rep_path)[len("reporte_"):-len(".json")]
+        try:
+            with open(rep_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[busqueda] reporte ilegible {rep_path}: {e}")
+            continue
+        total["postings"] += update_report(lic_id, report, nombres.get(lic_id), path)
+        total["licitaciones"] += 1
+    return total
+
+
+# ============ Consultas ============
+
+def _value(campo: str, valor: str) -> str:
+    if campo == "ruc":
+        return _ruc_key(valor)
+    if campo == "severidad":
+        return severity_key(valor)
+    return normalize(valor).strip()
+
+
+def lookup(campo: str, valor: str, prefijo: bool = False, limit: int = 200, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Postings de un valor (o de todos los valores con ese prefijo): licitación + documento."""
+    if campo not in CAMPOS:
+        raise ValueError(f"Campo desconocido: {campo}. Usa uno de {', '.join(CAMPOS)}")
+    v = _value(campo, valor)
+    if not v:
+        return []
+    if prefijo:
+        cond, args = "p.valor >= ? AND p.valor < ?", [v, v + "\uffff"]
+    else:
+        cond, args = "p.valor = ?", [v]
+    conn = _connect(path)
+    try:
+        rows = conn.execute(
+            f"""SELECT p.valor, p.lic_id, l.nombre, p.documento, p.n
+                FROM postings p LEFT JOIN licitaciones l ON l.lic_id = p.lic_id
+                WHERE p.campo = ? AND {cond}
+                ORDER BY l.indexado_at DESC, p.documento LIMIT ?""",
+            [campo, *args, limit],
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+
+def suppliers(filtros: Iterable[Tuple[str, str]], severidad: Optional[str] = None, limit: int = 50,
+              path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Proveedores (RUC) de los documentos que cumplen todos los filtros de hallazgos, por cantidad de hallazgos.
+
+    `filtros`: [(campo, valor)] con campo en categoria/tipo/severidad; `severidad` se
+    combina con cada filtro para que ambos se cumplan en el mismo hallazgo.
+    """
+    sev = severity_key(severidad) if severidad else None
+    conds: List[Tuple[str, str]] = []
+    for campo, valor in filtros:
+        if campo not in ("categoria", "tipo", "severidad"):
+            raise ValueError(f"Filtro no soportado: {campo}")
+        vals = [_value(campo, valor)] if campo != "tipo" else _type_words(valor)
+        conds += [(campo, f"{v}|{sev}" if sev and campo != "severidad" else v) for v in vals if v]
+    if not conds and sev:
+        conds = [("severidad", sev)]
+    if not conds:
+        return []
+    # Documentos que cumplen todas las condiciones; el conteo sale de la primera
+    first, rest = conds[0], conds[1:]
+    where = " AND ".join(
+        "EXISTS (SELECT 1 FROM postings x WHERE x.lic_id = h.lic_id AND x.documento = h.documento AND x.campo = ? AND x.valor = ?)"
+        for _ in rest
+    )
+    sql = f"""
+        SELECT r.valor AS ruc,
+               (SELECT MAX(z.valor) FROM postings z
+                WHERE z.lic_id = h.lic_id AND z.documento = h.documento AND z.campo = 'razon_social') AS razon_social,
+               SUM(h.n) AS hallazgos, COUNT(DISTINCT h.lic_id) AS licitaciones,
+               COUNT(DISTINCT h.lic_id || '/' || h.documento) AS documentos
+        FROM postings h
+        JOIN postings r ON r.lic_id = h.lic_id AND r.documento = h.documento AND r.campo = 'ruc'
+        WHERE h.campo = ? AND h.valor = ? {('AND ' + where) if where else ''}
+        GROUP BY r.valor
+        ORDER BY hallazgos DESC, licitaciones DESC
+        LIMIT ?
+    """
+    args: List[Any] = [first[0], first[1]]
+    for c, v in rest:
+        args += [c, v]
+    args.append(limit)
+    conn = _connect(path)
+    try:
+        rows = conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Índice invertido de RUC/proveedores/hallazgos entre licitaciones")
+    p.add_argument("--reconstruir", action="store_true", help="Reindexa todos los reportes de reports/")
+    p.add_argument("--reports", default=os.path.join(BASE_DIR, "reports"))
+    p.add_argument("--db", default=os.path.join(BASE_DIR, "db", "licitaciones.json"), help="DB de licitaciones (nombres)")
+    args = p.parse_args(argv)
+    if args.reconstruir:
+        nombres = {}
+        if os.path.exists(args.db):
+            with open(args.db, "r", encoding="utf-8") as f:
+                nombres = {x["id"]: x.get("nombre") for x in json.load(f).get("licitaciones", [])}
+        print(json.dumps(rebuild(args.reports, nombres), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
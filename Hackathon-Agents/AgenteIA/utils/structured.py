@@ -0,0 +1,202 @@
+"""Salidas estructuradas de los agentes: esquema JSON estricto, reparación y un reintento.
+
+Cada agente declara su salida como JSON Schema y la pide con
+`response_format={"type": "json_schema", "strict": true}`, así el proveedor
+solo puede devolver JSON que cumpla el esquema (severidad dentro de un enum
+incluida). Si aun así llega algo ilegible (modelo sin modo estricto, respuesta
+cortada), se intenta una reparación local sin costo y, si no alcanza, un único
+reintento. Lo que se devuelve ya viene normalizado: severidad ALTO/MEDIO/BAJO,
+score entero 0-100 y los cinco campos de cada issue como texto.
+
+STRUCTURED_OUTPUTS=0 vuelve a `json_object` (proveedores sin json_schema).
+"""
+import os
+import re
+import json
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from utils import tracing
+from utils.report_index import severity_key
+
+STRUCTURED_OUTPUTS = os.environ.get("STRUCTURED_OUTPUTS", "1") != "0"
+MAX_RETRIES = 1
+SEVERITIES = ("ALTO", "MEDIO", "BAJO")
+ISSUE_FIELDS = ("type", "where", "evidence", "severity", "recommendation")
+
+# ============ Esquemas ============
+
+ISSUE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string"},
+        "where": {"type": "string"},
+        "evidence": {"type": "string"},
+        "severity": {"type": "string", "enum": list(SEVERITIES)},
+        "recommendation": {"type": "string"},
+    },
+    "required": list(ISSUE_FIELDS),
+    "additionalProperties": False,
+}
+
+VALIDATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "issues": {"type": "array", "items": ISSUE_SCHEMA},
+        "score": {"type": "integer", "description": "Conformidad de 0 a 100"},
+    },
+    "required": ["issues", "score"],
+    "additionalProperties": False,
+}
+
+_RELATEDNESS_FIELDS = {
+    "related": {"type": "boolean"},
+    "confidence": {"type": "integer", "description": "Confianza de 0 a 100"},
+    "reasoning": {"type": "string"},
+}
+
+RELATEDNESS_SCHEMA = {
+    "type": "object",
+    "properties": dict(_RELATEDNESS_FIELDS),
+    "required": list(_RELATEDNESS_FIELDS),
+    "additionalProperties": False,
+}
+
+RELATEDNESS_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "resultados": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, **_RELATEDNESS_FIELDS},
+                "required": ["id", *_RELATEDNESS_FIELDS],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["resultados"],
+    "additionalProperties": False,
+}
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    if not STRUCTURED_OUTPUTS:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+# ============ Lectura y normalización ============
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def repair(text: str) -> Optional[Any]:
+    """Arreglos baratos: cercas de markdown, texto alrededor del objeto y comas finales."""
+    s = _FENCE.sub("", text or "")
+    start, end = s.find("{"), s.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    s = _TRAILING_COMMA.sub(r"\1", s[start:end + 1])
+    try:
+        return json.loads(s)
+    except ValueError:
+        return None
+
+
+def parse(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return repair(text)
+
+
+def severity(value: Any) -> str:
+    s = severity_key(value)
+    return s if s in SEVERITIES else "MEDIO"
+
+
+def _score(value: Any) -> Optional[int]:
+    try:
+        return max(0, min(100, int(round(float(value)))))
+    except (TypeError, ValueError):
+        return None
+
+
+def validation_result(data: Any) -> Optional[Dict[str, Any]]:
+    """{issues, score} normalizado; None si no hay score utilizable."""
+    if not isinstance(data, dict):
+        return None
+    score = _score(data.get("score"))
+    if score is None:
+        return None
+    issues = []
+    for it in data.get("issues") or []:
+        if not isinstance(it, dict):
+            continue
+        issue = {f: str(it.get(f) or "").strip() for f in ISSUE_FIELDS}
+        issue["severity"] = severity(it.get("severity"))
+        issues.append(issue)
+    return {"issues": issues, "score": score}
+
+
+def _relatedness(r: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(r, dict) or not isinstance(r.get("related"), bool):
+        return None
+    return {"related": r["related"], "confidence": _score(r.get("confidence")) or 0,
+            "reasoning": str(r.get("reasoning") or "No se proporcionó razonamiento")}
+
+
+def relatedness_result(data: Any) -> Optional[Dict[str, Any]]:
+    return _relatedness(data)
+
+
+def relatedness_batch_result(data: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(data, dict) or not isinstance(data.get("resultados"), list):
+        return None
+    out = []
+    for r in data["resultados"]:
+        v = _relatedness(r)
+        if v is not None and str(r.get("id", "")).isdigit():
+            out.append({"id": int(r["id"]), **v})
+    return {"resultados": out}
+
+
+# ============ Llamada ============
+
+def call(stage: str, create: Callable[[], Any], normalize: Callable[[Any], Optional[Dict[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Ejecuta `create()` (una llamada al chat), lee y normaliza la respuesta.
+
+    Devuelve (resultado, texto crudo); resultado None si sigue ilegible después
+    de la reparación y del único reintento.
+    """
+    text = ""
+    for attempt in range(1 + MAX_RETRIES):
+        if attempt:
+            tracing.record_retry(stage)
+        with tracing.span(stage):
+            resp = create()
+        tracing.record_usage(stage, resp)
+        choice = resp.choices[0]
+        text = choice.message.content or ""
+        data = normalize(parse(text))
+        if data is not None:
+            return data, text
+        # Cortada por largo o rechazada: repetir la misma llamada no cambia el resultado
+        if getattr(choice, "finish_reason", None) == "length" or getattr(choice.message, "refusal", None):
+            break
+    return None, text
+
+
+def unavailable(stage: str, text: str) -> Dict[str, Any]:
+    """Resultado de un agente sin respuesta utilizable: sin score, para no sesgar el ranking."""
+    return {
+        "issues": [],
+        "score": None,
+        "degradado": True,
+        "error": f"{stage}: respuesta sin JSON válido tras reparación y reintento ({(text or '')[:200]!r})",
+    }
+
+
+def settings():
+    return (STRUCTURED_OUTPUTS, MAX_RETRIES, json.dumps(VALIDATION_SCHEMA, sort_keys=True))
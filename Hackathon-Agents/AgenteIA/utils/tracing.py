@@ -0,0 +1,207 @@
+"""Spans livianos por etapa del pipeline + métricas en formato Prometheus.
+
+Cada `span(etapa)` registra latencia y errores en métricas globales del proceso
+y, si hay una traza activa (ver `start_trace`), también en el bloque `timings`
+de esa ejecución. `record_usage` toma `resp.usage` de las respuestas de OpenAI.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_hist: Dict[str, Dict[str, Any]] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("agenteia_trace", default=None)
+_usage_listeners: List[Callable[[str, int, int], None]] = []
+
+
+class Trace:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.cache: Dict[str, Dict[str, int]] = {}
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        return self.stages.setdefault(name, {
+            "calls": 0, "total_s": 0.0, "max_s": 0.0, "errores": 0,
+            "tokens_prompt": 0, "tokens_completion": 0, "reintentos": 0,
+        })
+
+    def observe(self, name: str, elapsed: float, error: bool):
+        with self._lock:
+            st = self._stage(name)
+            st["calls"] += 1
+            st["total_s"] += elapsed
+            st["max_s"] = max(st["max_s"], elapsed)
+            if error:
+                st["errores"] += 1
+
+    def add(self, name: str, field: str, n: int = 1):
+        with self._lock:
+            self._stage(name)[field] += n
+
+    def cache_event(self, name: str, hit: bool):
+        with self._lock:
+            c = self.cache.setdefault(name, {"hits": 0, "misses": 0})
+            c["hits" if hit else "misses"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                k: {**v, "total_s": round(v["total_s"], 4), "max_s": round(v["max_s"], 4)}
+                for k, v in sorted(self.stages.items())
+            }
+            return {
+                "total_s": round(time.perf_counter() - self.started, 4),
+                "etapas": stages,
+                "cache": dict(self.cache),
+            }
+
+
+def _inc(metric: str, labels: Dict[str, str], n: float = 1.0):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + n
+
+
+def _observe(name: str, elapsed: float):
+    with _lock:
+        h = _hist.setdefault(name, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if elapsed <= le:
+                h["buckets"][i] += 1
+        h["sum"] += elapsed
+        h["count"] += 1
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        _observe(name, elapsed)
+        if error:
+            _inc("agenteia_stage_errors_total", {"stage": name})
+        tr = _current.get()
+        if tr is not None:
+            tr.observe(name, elapsed, error)
+
+
+def traced(name: str):
+    def deco(fn):
+        def _wrapped(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        _wrapped.__name__ = getattr(fn, "__name__", name)
+        _wrapped.__doc__ = getattr(fn, "__doc__", None)
+        _wrapped.__wrapped__ = fn
+        return _wrapped
+    return deco
+
+
+def record_usage(name: str, resp: Any):
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    _inc("agenteia_llm_tokens_total", {"stage": name, "kind": "prompt"}, prompt)
+    _inc("agenteia_llm_tokens_total", {"stage": name, "kind": "completion"}, completion)
+    tr = _current.get()
+    if tr is not None:
+        tr.add(name, "tokens_prompt", prompt)
+        tr.add(name, "tokens_completion", completion)
+    for fn in _usage_listeners:
+        fn(name, prompt, completion)
+
+
+def on_usage(fn: Callable[[str, int, int], None]):
+    """Registra un callback (etapa, tokens_prompt, tokens_completion)."""
+    if fn not in _usage_listeners:
+        _usage_listeners.append(fn)
+
+
+def record_retry(name: str):
+    _inc("agenteia_retries_total", {"stage": name})
+    tr = _current.get()
+    if tr is not None:
+        tr.add(name, "reintentos")
+
+
+def record_cache(name: str, hit: bool):
+    _inc("agenteia_cache_requests_total", {"cache": name, "result": "hit" if hit else "miss"})
+    tr = _current.get()
+    if tr is not None:
+        tr.cache_event(name, hit)
+
+
+def record_route(name: str, model: str, result: str):
+    _inc("agenteia_model_routes_total", {"stage": name, "model": model, "result": result})
+
+
+def start_trace():
+    return _current.set(Trace())
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def finish_trace(token) -> Dict[str, Any]:
+    tr = _current.get()
+    _current.reset(token)
+    return tr.to_dict() if tr is not None else {}
+
+
+# ============ Exposición Prometheus ============
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+_HELP = {
+    "agenteia_stage_errors_total": "Errores por etapa del pipeline",
+    "agenteia_llm_tokens_total": "Tokens consumidos por etapa (resp.usage)",
+    "agenteia_retries_total": "Reintentos por etapa",
+    "agenteia_cache_requests_total": "Consultas a cachés internas por resultado",
+    "agenteia_model_routes_total": "Respuestas por agente y modelo de la cascada (aceptado o motivo de escalamiento)",
+}
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP agenteia_stage_latency_seconds Latencia por etapa del pipeline",
+        "# TYPE agenteia_stage_latency_seconds histogram",
+    ]
+    with _lock:
+        hist = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]} for k, v in _hist.items()}
+        counters = dict(_counters)
+    for name in sorted(hist):
+        h = hist[name]
+        for le, n in zip(LATENCY_BUCKETS, h["buckets"]):
+            lines.append(f'agenteia_stage_latency_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+        lines.append(f'agenteia_stage_latency_seconds_bucket{{stage="{name}",le="+Inf"}} {h["count"]}')
+        lines.append(f'agenteia_stage_latency_seconds_sum{{stage="{name}"}} {h["sum"]:.6f}')
+        lines.append(f'agenteia_stage_latency_seconds_count{{stage="{name}"}} {h["count"]}')
+    for metric in sorted({m for m, _ in counters} | set(_HELP)):
+        lines.append(f"# HELP {metric} {_HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} counter")
+        for (m, labels), v in sorted(counters.items()):
+            if m == metric:
+                lines.append(f"{metric}{_fmt_labels(labels)} {v:g}")
+    return "\n".join(lines) + "\n"
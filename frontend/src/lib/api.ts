@@ -110,7 +110,8 @@ export const api = {
       progreso: number;
       rojas: number;
       amarillas: number;
-      justificacion_agente?: string;
+      justificacion_agente?: string | null;
+      justificacion_estado?: "lista" | "pendiente" | "error";
     }>(`/licitaciones/${licId}/resumen`),
   hallazgos: (licId: string) =>
     request<{ items: Hallazgo[] }>(`/licitaciones/${licId}/hallazgos`),
@@ -40,7 +40,13 @@ const CARD_SIZE = {
 export default function Dashboard() {
   const [gridKey, setGridKey] = useState(0);
 	const lic = useQueryParam("lic") || "";
-	const resumenQ = useQuery({ queryKey: ["resumen", lic], queryFn: () => api.resumen(lic), enabled: !!lic });
+	// La justificación se genera después del análisis: se consulta de nuevo mientras esté pendiente
+	const resumenQ = useQuery({
+		queryKey: ["resumen", lic],
+		queryFn: () => api.resumen(lic),
+		enabled: !!lic,
+		refetchInterval: (query) => (query.state.data?.justificacion_estado === "pendiente" ? 3000 : false),
+	});
 	const hallazgosQ = useQuery({ queryKey: ["hallazgos", lic], queryFn: () => api.hallazgos(lic), enabled: !!lic });
 	const compQ = useQuery({ queryKey: ["comparativo", lic], queryFn: () => api.comparativo(lic), enabled: !!lic });
   const rucQ = useQuery({ queryKey: ["validaciones-ruc", lic], queryFn: () => api.validacionesRuc(lic), enabled: !!lic });
@@ -81,8 +87,8 @@ export default function Dashboard() {
   const avgE = avg(items.map((x)=>Number(x.economico||0)));
   const rows: ComparativoItem[] = [...items].sort((a, b) => b.score_total - a.score_total);
   // Cargar justificación del reporte si viene embebida en /resumen
-  type ResumenResp = { progreso: number; rojas?: number; amarillas?: number; justificacion_agente?: string };
-  const justificacion: string | undefined = (resumenQ.data as ResumenResp | undefined)?.justificacion_agente;
+  type ResumenResp = { progreso: number; rojas?: number; amarillas?: number; justificacion_agente?: string | null };
+  const justificacion: string | undefined = (resumenQ.data as ResumenResp | undefined)?.justificacion_agente ?? undefined;
   const [showBubble, setShowBubble] = useState(true);
   const [showNudge, setShowNudge] = useState(false);
   type ChatMsg = { role: 'user' | 'assistant'; content: string };